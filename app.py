@@ -1,8 +1,21 @@
-from fastapi import FastAPI
-from rag.router import router
-from fastapi.staticfiles import StaticFiles
+import asyncio
+import hmac
+import os
+from contextlib import asynccontextmanager
+
 from dotenv import load_dotenv
-load_dotenv()
+load_dotenv()  # before importing rag.*, which reads config from env at import
+
+from fastapi import FastAPI, Header
+from fastapi.responses import JSONResponse, PlainTextResponse
+from rag.router import router, answer_cache_stats, semantic_cache_stats
+from rag.clients import aclose_async_client
+from rag.faq import faq_stats, reload_faq
+from rag.retriever import (
+    batching_stats, embedding_cache_stats, index_info, reload_resources, retrieval_stats,
+)
+from rag import metrics, warmup
+from fastapi.staticfiles import StaticFiles
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -10,8 +23,23 @@ from fastapi.middleware.cors import CORSMiddleware
 
 # app = FastAPI()
 
+# Token for the /admin endpoints (X-Admin-Token header); unset = disabled
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+if warmup.PRELOAD_RESOURCES:
+    warmup.preload()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await warmup.startup()
+    yield
+    warmup.shutdown()
+    await aclose_async_client()
+
 
 app = FastAPI(
+    lifespan=lifespan,
     swagger_ui_parameters={
         "tryItOutEnabled": True,
         # optional but nice:
@@ -33,6 +61,7 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["POST", "OPTIONS"],
     allow_headers=["Content-Type"],
+    expose_headers=["Server-Timing"],
 )
 
 # Register the router
@@ -44,4 +73,48 @@ def root():
 
 @app.get("/health")
 def health():
+    # Ready only once the index is loaded and warm-up has finished
+    if not warmup.is_ready():
+        return JSONResponse({"status": "starting"}, status_code=503)
     return {"status": "ok"}
+
+@app.get("/stats")
+def stats():
+    return {
+        "embedding_cache": embedding_cache_stats(),
+        "embedding_batching": batching_stats(),
+        "answer_cache": answer_cache_stats(),
+        "semantic_cache": semantic_cache_stats(),
+        "faq": faq_stats(),
+        "index": index_info(),
+        "retrieval": retrieval_stats(),
+    }
+
+@app.get("/metrics")
+def prometheus_metrics():
+    # Prometheus text format; cache counters are read from the caches' own stats
+    emb = embedding_cache_stats()
+    caches = {
+        "answer": answer_cache_stats(),
+        "semantic": semantic_cache_stats(),
+        "embedding": {"hits": emb["hits"] + emb["disk_hits"], "misses": emb["api_calls"]},
+    }
+    return PlainTextResponse(metrics.render(caches), media_type=metrics.CONTENT_TYPE)
+
+@app.post("/admin/reload")
+async def admin_reload(force: bool = False, x_admin_token: str = Header(default="")):
+    # Swap in a rebuilt faiss.index + chunk store; requests in flight finish
+    # on the old one. Each worker process holds its own copy, so with several
+    # workers use INDEX_WATCH_INTERVAL (every worker polls) instead.
+    if not ADMIN_TOKEN or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        return JSONResponse({"detail": "Not Found"}, status_code=404)
+    try:
+        result = await asyncio.to_thread(reload_resources, force)
+    except Exception as e:
+        return JSONResponse({"reloaded": False, "error": str(e), "version": index_info()["version"]},
+                            status_code=409)
+    try:
+        result["faq"] = await asyncio.to_thread(reload_faq, force)
+    except Exception as e:  # the FAQ index is optional; the old one keeps serving
+        result["faq"] = {"reloaded": False, "error": str(e)}
+    return result
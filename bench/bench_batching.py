@@ -0,0 +1,85 @@
+# bench/bench_batching.py
+"""
+Throughput vs p99 latency of aretrieve_context under burst load, for
+several micro-batching windows (EMBED_BATCH_WINDOW_MS; 0 = off).
+
+Every query in a burst is unique, so the embedding cache never helps. The
+fake server caps concurrent embeddings requests (--server-concurrency) to
+model provider-side rate limits, which is where batching pays off.
+
+    python bench/bench_batching.py --burst 200 --windows 0 2 5 10 --max-batch 32
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench import fake_openai  # noqa: E402
+from bench.bench_concurrency import percentile  # noqa: E402
+
+
+async def run_burst(retriever, window_ms: float, max_batch: int, burst: int, tag: str) -> dict:
+    retriever.configure_batching(window_ms, max_batch)
+    latencies: List[float] = []
+
+    async def one(i: int) -> None:
+        t0 = time.perf_counter()
+        await retriever.aretrieve_context(f"{tag} question number {i} about the EDI programme?", top_k=10)
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(burst)))
+    elapsed = time.perf_counter() - t0
+    stats = retriever.batching_stats()
+    return {
+        "window_ms": window_ms,
+        "qps": burst / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": percentile(latencies, 99),
+        "api_calls": stats.get("batches", burst),
+        "avg_batch": stats.get("avg_batch", 1.0),
+    }
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    from rag import retriever
+    from rag.clients import aclose_async_client
+
+    retriever.load_resources()
+    print(f"{'window':>7} {'qps':>8} {'p50 ms':>8} {'p99 ms':>8} {'api calls':>10} {'avg batch':>10}")
+    for n, w in enumerate(args.windows):
+        r = await run_burst(retriever, w, args.max_batch, args.burst, f"run{n}")
+        print(
+            f"{r['window_ms']:>7.1f} {r['qps']:>8.1f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} "
+            f"{r['api_calls']:>10} {r['avg_batch']:>10.1f}"
+        )
+    await aclose_async_client()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--burst", type=int, default=200)
+    ap.add_argument("--windows", type=float, nargs="+", default=[0, 2, 5, 10])
+    ap.add_argument("--max-batch", type=int, default=32)
+    ap.add_argument("--port", type=int, default=8100)
+    ap.add_argument("--embed-ms", type=float, default=150.0)
+    ap.add_argument("--server-concurrency", type=int, default=8)
+    args = ap.parse_args()
+
+    with fake_openai.running(args.port, args.embed_ms, 0, args.server_concurrency) as base_url:
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
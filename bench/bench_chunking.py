@@ -0,0 +1,118 @@
+# bench/bench_chunking.py
+"""
+Structure-aware chunks (rag/chunking.py) vs fixed character windows, on the
+real data/*.txt sources, without any API call.
+
+For every FAQ entry (a "...?" line followed by its answer) in the sources:
+  intact     question and the first answer line end up in one chunk
+  answer@k   with the question as a BM25 query over all chunks, a chunk
+             holding the answer line is among the top k
+  ctx chars  prompt context needed to reach that chunk (sum of the chunk
+             lengths ranked above it, itself included), median over entries
+
+plus chunk count and size percentiles per chunker. BM25 stands in for the
+dense retriever, so the numbers compare chunkings, not the production
+ranking.
+
+    python bench/bench_chunking.py [--size 900] [--overlap 150] [--ks 1 3 5 10]
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from rag.chunking import fixed_spans, normalize_source, structure_spans  # noqa: E402
+from rag.lexical import BM25Index, BM25Writer  # noqa: E402
+
+Spans = Callable[[str, int, int], Iterator[Tuple[int, int, str]]]
+
+
+def load_sources(data_dir: Path) -> Dict[str, str]:
+    return {fp.name: normalize_source(fp.read_text(encoding="utf-8", errors="ignore"))
+            for fp in sorted(data_dir.glob("*.txt"))}
+
+
+def faq_entries(sources: Dict[str, str]) -> List[Tuple[str, Tuple[int, int], Tuple[int, int]]]:
+    """(source, question span, first answer line span) for each question line followed by text."""
+    entries = []
+    for name, text in sources.items():
+        pos, lines = 0, []
+        for line in text.split("\n"):
+            body = line.strip()
+            start = pos + len(line) - len(line.lstrip())
+            lines.append((start, start + len(body), body))
+            pos += len(line) + 1
+        for (qa, qb, q), (aa, ab, a) in zip(lines, lines[1:]):
+            if q.endswith("?") and a and not a.endswith("?"):
+                entries.append((name, (qa, qb), (aa, ab)))
+    return entries
+
+
+def evaluate(spans: Spans, sources: Dict[str, str], entries, size: int, overlap: int, ks: List[int]):
+    chunks: List[Tuple[str, int, int]] = []
+    writer = BM25Writer()
+    for name, text in sources.items():
+        for a, b, c in spans(text, size, overlap):
+            chunks.append((name, a, b))
+            writer.add(c)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = BM25Index(writer.save(Path(tmp) / "bm25.npz"))
+
+    def holds(i: int, name: str, span: Tuple[int, int]) -> bool:
+        src, a, b = chunks[i]
+        return src == name and a <= span[0] and span[1] <= b
+
+    intact = 0
+    found = {k: 0 for k in ks}
+    ctx: List[int] = []
+    for name, q, ans in entries:
+        intact += any(holds(i, name, q) and holds(i, name, ans) for i in range(len(chunks)))
+        query = sources[name][q[0]:q[1]]
+        ranked = [row for row, _ in index.search(query, max(ks))]
+        rank = next((r for r, i in enumerate(ranked) if holds(i, name, ans)), None)
+        for k in ks:
+            found[k] += rank is not None and rank < k
+        if rank is not None:
+            ctx.append(sum(chunks[i][2] - chunks[i][1] for i in ranked[:rank + 1]))
+    sizes = sorted(b - a for _, a, b in chunks)
+    return {
+        "chunks": len(chunks),
+        "chars": sum(sizes),
+        "p50": sizes[len(sizes) // 2],
+        "max": sizes[-1],
+        "intact": intact / len(entries),
+        "found": {k: v / len(entries) for k, v in found.items()},
+        "ctx": statistics.median(ctx) if ctx else 0,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--data", type=Path, default=ROOT / "data")
+    ap.add_argument("--size", type=int, default=900)
+    ap.add_argument("--overlap", type=int, default=150)
+    ap.add_argument("--ks", type=int, nargs="+", default=[1, 3, 5, 10])
+    args = ap.parse_args()
+
+    sources = load_sources(args.data)
+    entries = faq_entries(sources)
+    print(f"{len(sources)} sources, {len(entries)} FAQ entries, chunk size {args.size}, overlap {args.overlap}\n")
+    header = f"{'chunker':<10} {'chunks':>6} {'chars':>7} {'p50':>5} {'max':>5} {'intact':>7}"
+    header += "".join(f" {'ans@' + str(k):>7}" for k in args.ks) + f" {'ctx chars':>10}"
+    print(header)
+    for name, spans in (("fixed", fixed_spans), ("structure", structure_spans)):
+        r = evaluate(spans, sources, entries, args.size, args.overlap, args.ks)
+        row = f"{name:<10} {r['chunks']:>6} {r['chars']:>7} {r['p50']:>5} {r['max']:>5} {r['intact']:>7.1%}"
+        row += "".join(f" {r['found'][k]:>7.1%}" for k in args.ks) + f" {r['ctx']:>10.0f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
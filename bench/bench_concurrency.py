@@ -0,0 +1,106 @@
+# bench/bench_concurrency.py
+"""
+Concurrency scaling of POST /ask against the local fake OpenAI server.
+
+Drives the FastAPI app in-process (httpx ASGI transport) on one event loop,
+i.e. the same situation as a single uvicorn worker. With a non-blocking
+request path, throughput should grow roughly linearly with concurrency
+until the connection pool (OPENAI_MAX_CONNECTIONS) is saturated.
+
+    python bench/bench_concurrency.py --concurrency 1 10 50 100 --requests 200
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench import fake_openai  # noqa: E402
+
+QUESTIONS = [
+    "What courses are taught in the MSc EDI programme?",
+    "What is the GPA requirement to graduate?",
+    "I am an engineer. Am I suitable for EDI?",
+    "How long is the programme?",
+    "Can I study part-time?",
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[k]
+
+
+async def run_level(client, concurrency: int, total: int) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one(i: int) -> None:
+        async with sem:
+            t0 = time.perf_counter()
+            r = await client.post("/ask", json={"question": QUESTIONS[i % len(QUESTIONS)]})
+            r.raise_for_status()
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - t0
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    import httpx
+
+    import app as app_module
+
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # warm-up: loads FAISS/docs and opens pool connections
+        await client.post("/ask", json={"question": QUESTIONS[0]})
+
+        print(f"{'conc':>5} {'req':>5} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        base_rps = None
+        for c in args.concurrency:
+            res = await run_level(client, c, max(args.requests, c))
+            base_rps = base_rps or res["rps"]
+            print(
+                f"{res['concurrency']:>5} {res['requests']:>5} {res['rps']:>8.1f} "
+                f"{res['p50_ms']:>8.1f} {res['p95_ms']:>8.1f} {res['p99_ms']:>8.1f}"
+                f"   (x{res['rps'] / base_rps:.1f} vs c={args.concurrency[0]})"
+            )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50, 100])
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--port", type=int, default=8100)
+    ap.add_argument("--embed-ms", type=float, default=150.0)
+    ap.add_argument("--chat-ms", type=float, default=800.0)
+    args = ap.parse_args()
+
+    with fake_openai.running(args.port, args.embed_ms, args.chat_ms) as base_url:
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# bench/bench_embeddings.py
+"""
+Single-query embedding latency and memory of an embedding backend
+(rag/embeddings.py), one query at a time as on the /ask path.
+
+Queries are the "...?" lines of data/*.txt. Reports load time, RSS growth
+from loading the backend, and p50/p95/p99 per query. The onnx backend
+(int8 MiniLM) should stay under ~10 ms per query with ONNX_THREADS=1.
+
+    python bench/bench_embeddings.py [--backend onnx] [--model all-MiniLM-L6-v2] [--queries 300]
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench.bench_concurrency import percentile  # noqa: E402
+from rag.embeddings import make_backend  # noqa: E402
+from rag.export_onnx import sample_questions  # noqa: E402
+from rag.timing import peak_rss_mb  # noqa: E402
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--backend", default="onnx")
+    ap.add_argument("--model", default="all-MiniLM-L6-v2")
+    ap.add_argument("--queries", type=int, default=300)
+    ap.add_argument("--warmup", type=int, default=10)
+    ap.add_argument("--data", type=Path, default=ROOT / "data")
+    args = ap.parse_args()
+
+    questions = sample_questions(args.data, args.queries)
+    backend = make_backend(args.model, args.backend)
+    rss0 = peak_rss_mb()
+    t0 = time.perf_counter()
+    backend.load()
+    load_ms = (time.perf_counter() - t0) * 1000.0
+    for q in questions[:args.warmup]:
+        backend.embed([q])
+    rss1 = peak_rss_mb()
+
+    lat = []
+    for q in questions:
+        t = time.perf_counter()
+        backend.embed([q])
+        lat.append((time.perf_counter() - t) * 1000.0)
+    lat.sort()
+
+    print(f"{backend.name} {args.model} ({backend.key}), {len(lat)} queries, load {load_ms:.0f} ms")
+    print(f"  per query: mean {statistics.mean(lat):.2f} ms | p50 {percentile(lat, 50):.2f} | "
+          f"p95 {percentile(lat, 95):.2f} | p99 {percentile(lat, 99):.2f} ms")
+    if rss0 is not None and rss1 is not None:
+        print(f"  peak RSS {rss1:.1f} MB (+{rss1 - rss0:.1f} MB for the backend)")
+
+
+if __name__ == "__main__":
+    main()
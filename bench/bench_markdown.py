@@ -0,0 +1,132 @@
+# bench/bench_markdown.py
+"""
+Per-answer cost of format_markdown_safe on ~800-token answers: the
+single-pass formatter (rag/formatting/markdown.py) vs the multi-pass one it
+replaced (bench/markdown_multipass.py), one-shot and streamed.
+
+Before timing, the run checks that
+  - every input of the golden corpus formats byte-for-byte to its
+    "expected" output (produced by the multi-pass implementation), and
+  - streaming each input in random-size deltas through
+    IncrementalMarkdownFormatter gives the same bytes as one-shot.
+Any difference is printed and fails the run.
+
+    python bench/bench_markdown.py [--golden bench/golden_markdown.jsonl] [--tokens 800] [--repeat 200]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench import markdown_multipass as old  # noqa: E402
+from rag.formatting.markdown import IncrementalMarkdownFormatter, format_markdown_safe  # noqa: E402
+
+
+def load_golden(path: Path) -> List[Dict[str, str]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(ln) for ln in f if ln.strip()]
+
+
+def stream(formatter, text: str, rnd: random.Random, max_delta: int = 12) -> str:
+    out, i = [], 0
+    while i < len(text):
+        n = rnd.randint(1, max_delta)
+        out.append(formatter.feed(text[i:i + n]))
+        i += n
+    out.append(formatter.close())
+    return "".join(out)
+
+
+def first_diff(a: str, b: str) -> str:
+    k = next((i for i in range(min(len(a), len(b))) if a[i] != b[i]), min(len(a), len(b)))
+    return f"at char {k}: got {a[max(0, k - 40):k + 40]!r}, want {b[max(0, k - 40):k + 40]!r}"
+
+
+def check(rows: List[Dict[str, str]], seed: int) -> int:
+    rnd = random.Random(seed)
+    bad = 0
+    for n, row in enumerate(rows):
+        got = format_markdown_safe(row["input"])
+        if got != row["expected"]:
+            bad += 1
+            print(f"MISMATCH row {n} (one-shot) {first_diff(got, row['expected'])}")
+        got = stream(IncrementalMarkdownFormatter(), row["input"], rnd)
+        if got != row["expected"]:
+            bad += 1
+            print(f"MISMATCH row {n} (streamed) {first_diff(got, row['expected'])}")
+    return bad
+
+
+def answers_of(rows: List[Dict[str, str]], tokens: int) -> List[str]:
+    """Golden inputs glued into answers of ~`tokens` tokens (~4 chars each)."""
+    answers, cur = [], ""
+    for row in rows:
+        cur = f"{cur}\n\n{row['input']}" if cur else row["input"]
+        if len(cur) >= 4 * tokens:
+            answers.append(cur[:4 * tokens])
+            cur = ""
+    return answers
+
+
+def time_per_answer(fn: Callable[[str], str], answers: List[str], repeat: int) -> List[float]:
+    """Microseconds per answer, one sample per pass over the answers."""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for a in answers:
+            fn(a)
+        samples.append((time.perf_counter() - t0) * 1e6 / len(answers))
+    return samples
+
+
+def streamed(cls) -> Callable[[str], str]:
+    """Feed an answer in 4-char deltas (about one token each)."""
+    def run(text: str) -> str:
+        f = cls()
+        out = [f.feed(text[i:i + 4]) for i in range(0, len(text), 4)]
+        out.append(f.close())
+        return "".join(out)
+    return run
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--golden", type=Path, default=ROOT / "bench" / "golden_markdown.jsonl")
+    ap.add_argument("--tokens", type=int, default=800, help="approximate answer length")
+    ap.add_argument("--repeat", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rows = load_golden(args.golden)
+    bad = check(rows, args.seed)
+    if bad:
+        raise SystemExit(f"{bad} outputs differ from {args.golden}")
+
+    answers = answers_of(rows, args.tokens)
+    print(f"{len(rows)} golden rows identical (one-shot and streamed); "
+          f"{len(answers)} answers of ~{args.tokens} tokens, {args.repeat} passes\n")
+    print(f"{'path':<26} {'median us/answer':>17} {'min':>9}")
+    base = None
+    for name, fn in (
+        ("multi-pass one-shot", old.format_markdown_safe),
+        ("single-pass one-shot", format_markdown_safe),
+        ("multi-pass streamed", streamed(old.IncrementalMarkdownFormatter)),
+        ("single-pass streamed", streamed(IncrementalMarkdownFormatter)),
+    ):
+        samples = time_per_answer(fn, answers, args.repeat)
+        med = statistics.median(samples)
+        base = base or med
+        print(f"{name:<26} {med:>17.1f} {min(samples):>9.1f}   (x{base / med:.2f})")
+
+
+if __name__ == "__main__":
+    main()
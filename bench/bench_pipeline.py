@@ -0,0 +1,305 @@
+# bench/bench_pipeline.py
+"""
+Offline benchmark / regression harness for the /ask pipeline.
+
+Runs against the local fake OpenAI server (deterministic embeddings, canned
+completions, fixed latencies), so no API key is needed and runs are
+comparable between commits. Components:
+
+    routing     classify() + the routing policy, no retrieval (CPU only)
+    format      format_markdown_safe over the golden Markdown corpus (CPU only)
+    retrieval   aretrieve_context: embed + FAISS/BM25 + merge/MMR
+    ask         POST /ask end to end through the FastAPI app (rag.router.ask)
+
+retrieval and ask run at every --concurrency level; the CPU-only
+components run sequentially. For each, the report has throughput, p50 /
+p95 / p99 latency and process RSS after the run. A separate sequential
+pass under tracemalloc records, per operation, the peak of transient
+allocations and the memory and blocks still held afterwards (a steady
+non-zero value there is a leak). CPython has no cheap counter of
+allocation events, so these are the allocation numbers reported.
+
+Caches (answer, semantic, embedding) are off unless --caches is given, so
+every request takes the full path.
+
+    python bench/bench_pipeline.py [--concurrency 1 10 50] [--requests 200] [--out results.json]
+    python bench/bench_pipeline.py --compare bench/results/pipeline-<old>.json
+
+Results go to bench/results/pipeline-<git short hash>.json by default.
+With --compare, p50/p95/p99 and throughput are diffed against an earlier
+result; the run fails if any p95 got worse by more than --threshold.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench import fake_openai  # noqa: E402
+from bench.bench_concurrency import percentile  # noqa: E402
+from bench.bench_markdown import load_golden  # noqa: E402
+from rag.timing import peak_rss_mb, rss_mb  # noqa: E402
+
+RESULTS_DIR = ROOT / "bench" / "results"
+
+
+def git_revision() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=str(ROOT),
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_questions(path: Path) -> List[str]:
+    qs = [ln.strip() for ln in path.read_text(encoding="utf-8").splitlines()]
+    return [q for q in qs if q and not q.startswith("#")]
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    return {
+        "ops": len(latencies),
+        "throughput": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "rss_mb": round(rss_mb(), 1),
+    }
+
+
+# -----------------------------
+# Timed runs
+# -----------------------------
+
+def run_sync(op: Callable[[int], Any], n: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    t0 = time.perf_counter()
+    for i in range(n):
+        t = time.perf_counter()
+        op(i)
+        latencies.append((time.perf_counter() - t) * 1000.0)
+    return summarize(latencies, time.perf_counter() - t0)
+
+
+async def run_async(op: Callable[[int], Awaitable[Any]], n: int, concurrency: int) -> Dict[str, float]:
+    sem = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one(i: int) -> None:
+        async with sem:
+            t = time.perf_counter()
+            await op(i)
+            latencies.append((time.perf_counter() - t) * 1000.0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    res = summarize(latencies, time.perf_counter() - t0)
+    res["concurrency"] = concurrency
+    return res
+
+
+async def allocations(op: Callable[[int], Any], n: int) -> Dict[str, float]:
+    """Sequential pass under tracemalloc (op may be sync or async)."""
+    peaks: List[int] = []
+    held: List[int] = []
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    try:
+        for i in range(n):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            res = op(i)
+            if asyncio.iscoroutine(res):
+                await res
+            peak = tracemalloc.get_traced_memory()[1]
+            gc.collect()  # count only what the operation really keeps
+            peaks.append(peak - before)
+            held.append(tracemalloc.get_traced_memory()[0] - before)
+    finally:
+        tracemalloc.stop()
+    gc.collect()
+    return {
+        "alloc_peak_kib_p50": round(statistics.median(peaks) / 1024.0, 1),
+        "alloc_peak_kib_max": round(max(peaks) / 1024.0, 1),
+        "retained_bytes_per_op": round(statistics.mean(held), 1),
+        "blocks_per_op": round((sys.getallocatedblocks() - blocks) / n, 2),
+    }
+
+
+# -----------------------------
+# Components
+# -----------------------------
+
+async def bench_components(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+
+    import app as app_module
+    from bench.bench_routing import engine_decision, load_corpus
+    from rag import retriever
+    from rag.formatting.markdown import format_markdown_safe
+
+    questions = load_questions(args.questions)
+    routing_corpus = load_corpus(args.questions)
+    golden = [row["input"] for row in load_golden(args.golden)]
+    results: Dict[str, Any] = {"rss_mb_start": round(rss_mb(), 1)}
+
+    retriever.load_resources()
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def ask(i: int) -> None:
+            r = await client.post("/ask", json={"question": questions[i % len(questions)]})
+            r.raise_for_status()
+
+        async def retrieve(i: int) -> None:
+            await retriever.aretrieve_context(questions[i % len(questions)], top_k=10)
+
+        def route(i: int) -> None:
+            engine_decision(routing_corpus[i % len(routing_corpus)])
+
+        def fmt(i: int) -> None:
+            format_markdown_safe(golden[i % len(golden)])
+
+        # warm-up: index, chunk store, pool connections, lazy imports
+        await ask(0)
+        await retrieve(0)
+        results["rss_mb_loaded"] = round(rss_mb(), 1)
+
+        results["routing"] = run_sync(route, max(args.requests, 10 * len(routing_corpus)))
+        results["format"] = run_sync(fmt, max(args.requests, 10 * len(golden)))
+        for name, op in (("retrieval", retrieve), ("ask", ask)):
+            results[name] = {
+                f"c{c}": await run_async(op, max(args.requests, c), c) for c in args.concurrency
+            }
+
+        for name, op in (("routing", route), ("format", fmt), ("retrieval", retrieve), ("ask", ask)):
+            results.setdefault("allocations", {})[name] = await allocations(op, args.alloc_samples)
+
+    peak = peak_rss_mb()
+    results["rss_mb_peak"] = round(peak, 1) if peak is not None else None
+    return results
+
+
+# -----------------------------
+# Comparison
+# -----------------------------
+
+def _latency_rows(results: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """component[/cN] -> timing row, for every timed run in a result file."""
+    rows = {}
+    for name in ("routing", "format"):
+        if name in results:
+            rows[name] = results[name]
+    for name in ("retrieval", "ask"):
+        for level, row in results.get(name, {}).items():
+            rows[f"{name}/{level}"] = row
+    return rows
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], threshold: float) -> int:
+    """Print deltas; returns the number of p95 regressions beyond threshold (a fraction)."""
+    old_rows, new_rows = _latency_rows(old["results"]), _latency_rows(new["results"])
+    print(f"\nvs {old['meta']['revision']} ({old['meta']['timestamp']})")
+    print(f"{'run':<16} {'p50':>8} {'p95':>8} {'p99':>8} {'throughput':>11}")
+    regressions = 0
+    for key, row in new_rows.items():
+        base = old_rows.get(key)
+        if base is None:
+            continue
+        deltas = [row[m] / base[m] - 1.0 if base[m] else 0.0
+                  for m in ("p50_ms", "p95_ms", "p99_ms", "throughput")]
+        flag = ""
+        if deltas[1] > threshold:
+            regressions += 1
+            flag = "  <- p95 regression"
+        print(f"{key:<16} " + " ".join(f"{d:>+8.1%}" for d in deltas[:3]) + f" {deltas[3]:>+11.1%}{flag}")
+    return regressions
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    print(f"{'run':<16} {'ops':>6} {'ops/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rss MB':>7}")
+    for key, row in _latency_rows(results).items():
+        print(f"{key:<16} {row['ops']:>6} {row['throughput']:>9.1f} {row['p50_ms']:>9.3f} "
+              f"{row['p95_ms']:>9.3f} {row['p99_ms']:>9.3f} {row['rss_mb']:>7.1f}")
+    print(f"\n{'allocations':<16} {'peak KiB p50':>13} {'peak KiB max':>13} {'held B/op':>10} {'blocks/op':>10}")
+    for name, a in results["allocations"].items():
+        print(f"{name:<16} {a['alloc_peak_kib_p50']:>13.1f} {a['alloc_peak_kib_max']:>13.1f} "
+              f"{a['retained_bytes_per_op']:>10.1f} {a['blocks_per_op']:>10.2f}")
+    print(f"\nRSS MB: start {results['rss_mb_start']}, loaded {results['rss_mb_loaded']}, "
+          f"peak {results['rss_mb_peak']}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    ap.add_argument("--requests", type=int, default=200, help="operations per timed run")
+    ap.add_argument("--alloc-samples", type=int, default=50, help="operations per tracemalloc pass")
+    ap.add_argument("--questions", type=Path, default=ROOT / "bench" / "questions.txt")
+    ap.add_argument("--golden", type=Path, default=ROOT / "bench" / "golden_markdown.jsonl")
+    ap.add_argument("--port", type=int, default=8100)
+    ap.add_argument("--embed-ms", type=float, default=20.0)
+    ap.add_argument("--chat-ms", type=float, default=100.0)
+    ap.add_argument("--caches", action="store_true", help="keep the answer/semantic/embedding caches on")
+    ap.add_argument("--out", type=Path, default=None)
+    ap.add_argument("--compare", type=Path, default=None, help="earlier result file to diff against")
+    ap.add_argument("--threshold", type=float, default=0.2, help="allowed p95 slowdown for --compare")
+    args = ap.parse_args()
+
+    if not args.caches:
+        for var in ("ANSWER_CACHE_SIZE", "SEMANTIC_CACHE_SIZE", "EMBED_CACHE_SIZE"):
+            os.environ[var] = "0"
+    os.environ.setdefault("WARMUP", "0")
+
+    with fake_openai.running(args.port, args.embed_ms, args.chat_ms) as base_url:
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        results = asyncio.run(bench_components(args))
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {
+                "concurrency": args.concurrency,
+                "requests": args.requests,
+                "alloc_samples": args.alloc_samples,
+                "embed_ms": args.embed_ms,
+                "chat_ms": args.chat_ms,
+                "caches": args.caches,
+            },
+        },
+        "results": results,
+    }
+    print_report(results)
+
+    out: Optional[Path] = args.out or RESULTS_DIR / f"pipeline-{report['meta']['revision']}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    print("\nWrote:", out)
+
+    if args.compare is not None:
+        old = json.loads(args.compare.read_text(encoding="utf-8"))
+        bad = compare(old, report, args.threshold)
+        if bad:
+            raise SystemExit(f"{bad} runs regressed by more than {args.threshold:.0%} at p95")
+
+
+if __name__ == "__main__":
+    main()
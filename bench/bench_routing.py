@@ -0,0 +1,187 @@
+# bench/bench_routing.py
+"""
+Micro-benchmark of the routing policy over a corpus of logged questions:
+the single-scan classifier (rag/routing/intents.py) vs running every
+pattern of rag/routing/patterns.py per router call, as the policy did
+before. Both paths must give the same decisions; any difference is
+printed and fails the run.
+
+    python bench/bench_routing.py [--corpus bench/questions.txt] [--repeat 200]
+
+The corpus defaults to bench/questions.txt plus every question found in
+data/*.txt.
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from rag.routing import fallbacks as F  # noqa: E402
+from rag.routing import patterns as P  # noqa: E402
+from rag.routing import policy  # noqa: E402
+from rag.routing.intents import INTENTS, classify  # noqa: E402
+
+# intent name -> the pattern check it replaces
+LEGACY_CHECKS: Dict[str, Callable[[str], Any]] = {
+    "greeting": P.GREETING_PATTERN.match,
+    "thanks": P.THANKS_PATTERN.match,
+    "praise": P.PRAISE_PATTERN.match,
+    "mdes": P.MDES_PATTERN.search,
+    "overview": P.OVERVIEW_PATTERN.search,
+    "requirement": P.REQUIREMENT_PATTERN.search,
+    "wh_prefix": P.WH_PREFIX_PATTERN.search,
+    "suitability": P.SUITABILITY_PATTERN.search,
+    "suitability_profile": P.SUITABILITY_PROFILE_PATTERN.search,
+    "suitability_question": lambda q: any(p in q.lower() for p in P.SUITABILITY_QUESTION_PHRASES),
+    "intake": P.INTAKE_PATTERN.search,
+    "programme_start": P.PROGRAMME_START_PATTERN.search,
+    "application_period": P.APPLICATION_PERIOD_PATTERN.search,
+    "reapplication": P.REAPPLICATION_PATTERN.search,
+    "offer_outcome": P.OFFER_OUTCOME_PATTERN.search,
+    "arrival": P.ARRIVAL_PATTERN.search,
+    "visa": P.VISA_PATTERN.search,
+    "visa_process": P.VISA_PROCESS_PATTERN.search,
+    "logistics": P.LOGISTICS_PATTERN.search,
+}
+
+
+def load_corpus(path: Path) -> List[str]:
+    qs = [ln.strip() for ln in path.read_text(encoding="utf-8").splitlines()]
+    qs = [q for q in qs if q and not q.startswith("#")]
+    for fp in sorted((ROOT / "data").glob("*.txt")):
+        for ln in fp.read_text(encoding="utf-8", errors="ignore").splitlines():
+            ln = ln.strip()
+            if ln.endswith("?") and len(ln) < 300:
+                qs.append(ln)
+    return qs
+
+
+# -----------------------------
+# Per-pattern policy (what every request ran before the classifier)
+# -----------------------------
+
+def _legacy_requirement(q: str) -> bool:
+    return bool(
+        P.REQUIREMENT_PATTERN.search(q)
+        and not P.WH_PREFIX_PATTERN.search(q)
+        and not P.LOGISTICS_PATTERN.search(q)
+    )
+
+
+def _legacy_suitability(q: str) -> bool:
+    return bool(P.SUITABILITY_PATTERN.search(q) or P.SUITABILITY_PROFILE_PATTERN.search(q))
+
+
+def legacy_decision(q: str) -> Tuple[Any, ...]:
+    """Routing decision, with the pattern checks the old routers ran, in their order."""
+    # route_early
+    if P.GREETING_PATTERN.match(q) or P.THANKS_PATTERN.match(q) or P.PRAISE_PATTERN.match(q):
+        return ("early",)
+    if P.MDES_PATTERN.search(q):
+        return ("early", F.MDES_REDIRECT_MSG)
+    # route_intake
+    if not P.SUITABILITY_PATTERN.search(q) and (
+        P.INTAKE_PATTERN.search(q) or P.PROGRAMME_START_PATTERN.search(q) or P.APPLICATION_PERIOD_PATTERN.search(q)
+    ):
+        if P.PROGRAMME_START_PATTERN.search(q):
+            return ("intake", "start")
+        if not P.APPLICATION_PERIOD_PATTERN.search(q):
+            return ("intake", "clarify")
+    # policy_logistics_needs_context + route_policy_logistics
+    needs_ctx = bool(P.ARRIVAL_PATTERN.search(q))
+    for name, pat in (("offer", P.OFFER_OUTCOME_PATTERN), ("reapply", P.REAPPLICATION_PATTERN),
+                      ("visa_process", P.VISA_PROCESS_PATTERN), ("visa", P.VISA_PATTERN)):
+        if pat.search(q):
+            return ("policy", name)
+    P.ARRIVAL_PATTERN.search(q)
+    # requirement_needs_context + route_requirement_or_suitability
+    _legacy_requirement(q)
+    if _legacy_requirement(q):
+        if not any(p in q.lower() for p in P.SUITABILITY_QUESTION_PHRASES):
+            return ("requirement",)
+    else:
+        _legacy_suitability(q)
+    # cache intent
+    if any(p in q.lower() for p in P.SUITABILITY_QUESTION_PHRASES):
+        return ("llm", "suitability", needs_ctx)
+    if _legacy_requirement(q):
+        return ("llm", "requirement", needs_ctx)
+    return ("llm", "suitability" if _legacy_suitability(q) else "general", needs_ctx)
+
+
+def engine_decision(q: str) -> Tuple[Any, ...]:
+    """Same decision, from one classify() call."""
+    i = classify(q)
+    if "greeting" in i or "thanks" in i or "praise" in i:
+        return ("early",)
+    if policy.route_early(q, i):
+        return ("early", F.MDES_REDIRECT_MSG)
+    r = policy.route_intake(q, i)
+    if r:
+        return ("intake", "start" if r == F.PROGRAMME_START_FALLBACK else "clarify")
+    needs_ctx = policy.policy_logistics_needs_context(q, i)
+    r = policy.route_policy_logistics(q, ["ctx"], i)
+    if r:
+        name = {F.OFFER_OUTCOME_FALLBACK: "offer", F.REAPPLICATION_FALLBACK: "reapply",
+                F.VISA_PROCESS_FALLBACK: "visa_process", F.VISA_FALLBACK: "visa"}[r]
+        return ("policy", name)
+    suitable = policy.is_suitability_question(q, i)
+    if policy.requirement_needs_context(q, i) and not suitable:
+        return ("requirement",)
+    intent = "suitability" if suitable else policy.query_intent(q, i)
+    return ("llm", intent, needs_ctx)
+
+
+def time_per_question(fn: Callable[[str], Any], corpus: List[str], repeat: int) -> List[float]:
+    """Microseconds per question, one sample per pass over the corpus."""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for q in corpus:
+            fn(q)
+        samples.append((time.perf_counter() - t0) * 1e6 / len(corpus))
+    return samples
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--corpus", type=Path, default=ROOT / "bench" / "questions.txt")
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    bad = 0
+    for q in corpus:
+        want = frozenset(k for k, check in LEGACY_CHECKS.items() if check(q))
+        got = classify(q)
+        if want != got or legacy_decision(q) != engine_decision(q):
+            bad += 1
+            print(f"MISMATCH {q!r}: patterns={sorted(want)} classifier={sorted(got)}")
+    if set(LEGACY_CHECKS) != set(INTENTS):
+        raise SystemExit(f"intent lists differ: {sorted(set(LEGACY_CHECKS) ^ set(INTENTS))}")
+    if bad:
+        raise SystemExit(f"{bad}/{len(corpus)} questions route differently")
+
+    print(f"{len(corpus)} questions, decisions identical; {args.repeat} passes\n")
+    print(f"{'path':<22} {'median us/q':>12} {'min us/q':>10}")
+    base = None
+    for name, fn in (
+        ("per-pattern policy", legacy_decision),
+        ("single-scan policy", engine_decision),
+        ("classify() only", classify),
+    ):
+        samples = time_per_question(fn, corpus, args.repeat)
+        med = statistics.median(samples)
+        base = base or med
+        print(f"{name:<22} {med:>12.2f} {min(samples):>10.2f}   (x{base / med:.1f})")
+
+
+if __name__ == "__main__":
+    main()
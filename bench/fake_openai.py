@@ -0,0 +1,187 @@
+# bench/fake_openai.py
+"""
+Local stand-in for the OpenAI API used by the benchmarks.
+
+- POST /v1/embeddings        deterministic unit vectors (seeded by the input text)
+- POST /v1/chat/completions  a canned Markdown answer (streamed word by word
+                             when the request sets "stream": true)
+
+Latency is simulated with asyncio.sleep so the server itself never becomes
+the bottleneck. Run standalone with:
+
+    FAKE_EMBED_MS=150 FAKE_CHAT_MS=800 uvicorn bench.fake_openai:app --port 8100
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+import json
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+EMBED_DIM = int(os.getenv("FAKE_EMBED_DIM", "1536"))
+EMBED_MS = float(os.getenv("FAKE_EMBED_MS", "150"))
+CHAT_MS = float(os.getenv("FAKE_CHAT_MS", "800"))
+# Max embeddings requests served at once (models provider-side concurrency /
+# rate limits); 0 = unlimited
+EMBED_CONCURRENCY = int(os.getenv("FAKE_EMBED_CONCURRENCY", "0"))
+# Fraction of embeddings requests answered with 429/503 (retry testing)
+EMBED_ERROR_RATE = float(os.getenv("FAKE_EMBED_ERROR_RATE", "0"))
+
+CANNED_ANSWER = (
+    "### Overview\n\n"
+    "The MSc in Engineering Design & Innovation (EDI) is a multidisciplinary programme.\n\n"
+    "### Key points\n\n"
+    "- Coursework-based programme\n"
+    "- Open to applicants from varied backgrounds\n"
+)
+
+ROOT = Path(__file__).resolve().parent.parent
+
+app = FastAPI()
+_rng = np.random.default_rng(0)
+_embed_sem = asyncio.Semaphore(EMBED_CONCURRENCY) if EMBED_CONCURRENCY > 0 else None
+
+
+def fake_embedding(text: str) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vec = np.random.default_rng(seed).standard_normal(EMBED_DIM).astype("float32")
+    vec /= np.linalg.norm(vec)
+    return vec
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "fake-chat", "object": "model", "created": 0, "owned_by": "bench"}]}
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    inputs = body.get("input")
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    if EMBED_ERROR_RATE and _rng.random() < EMBED_ERROR_RATE:
+        status = 429 if _rng.random() < 0.5 else 503
+        return JSONResponse(
+            {"error": {"message": "fake transient error", "type": "server_error", "code": None}},
+            status_code=status,
+            headers={"retry-after": "0.1"} if status == 429 else {},
+        )
+    if _embed_sem is not None:
+        async with _embed_sem:
+            await asyncio.sleep(EMBED_MS / 1000.0)
+    else:
+        await asyncio.sleep(EMBED_MS / 1000.0)
+
+    as_base64 = body.get("encoding_format") == "base64"
+    data = []
+    for i, text in enumerate(inputs):
+        vec = fake_embedding(text)
+        emb = base64.b64encode(vec.tobytes()).decode("ascii") if as_base64 else vec.tolist()
+        data.append({"object": "embedding", "index": i, "embedding": emb})
+
+    tokens = sum(len(t.split()) for t in inputs)
+    return {
+        "object": "list",
+        "data": data,
+        "model": body.get("model", "fake-embedding"),
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+async def _stream_chat(model: str, include_usage: bool = False):
+    # Split the completion time between first token and the rest
+    words = CANNED_ANSWER.split(" ")
+    await asyncio.sleep(CHAT_MS / 4000.0)
+    for i, w in enumerate(words):
+        chunk = {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": w if i == 0 else " " + w}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(CHAT_MS * 0.75 / 1000.0 / len(words))
+    done = {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+    }
+    yield f"data: {json.dumps(done)}\n\n"
+    if include_usage:
+        # stream_options.include_usage: a final chunk with no choices
+        usage = {"prompt_tokens": 500, "completion_tokens": len(words), "total_tokens": 500 + len(words)}
+        yield f"data: {json.dumps(dict(done, choices=[], usage=usage))}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if body.get("stream"):
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        return StreamingResponse(_stream_chat(body.get("model", "fake-chat"), include_usage),
+                                 media_type="text/event-stream")
+    await asyncio.sleep(CHAT_MS / 1000.0)
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake-chat"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": CANNED_ANSWER},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 500, "completion_tokens": 60, "total_tokens": 560},
+    }
+
+
+@contextmanager
+def running(port: int = 8100, embed_ms: float = EMBED_MS, chat_ms: float = CHAT_MS,
+            embed_concurrency: int = EMBED_CONCURRENCY) -> Iterator[str]:
+    """Run this server in a subprocess; yields the base_url to hand to the OpenAI SDK."""
+    env = dict(
+        os.environ,
+        FAKE_EMBED_MS=str(embed_ms),
+        FAKE_CHAT_MS=str(chat_ms),
+        FAKE_EMBED_CONCURRENCY=str(embed_concurrency),
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "bench.fake_openai:app",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=str(ROOT),
+        env=env,
+    )
+    try:
+        deadline = time.time() + 15
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                break
+            except OSError:
+                if time.time() > deadline or proc.poll() is not None:
+                    raise RuntimeError("fake OpenAI server did not start")
+                time.sleep(0.05)
+        yield f"http://127.0.0.1:{port}/v1"
+    finally:
+        proc.terminate()
+        proc.wait()
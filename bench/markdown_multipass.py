@@ -0,0 +1,357 @@
+# bench/markdown_multipass.py
+"""
+Frozen copy of rag/formatting/markdown.py before the single-pass rewrite:
+the multi-pass format_markdown_safe (one list or regex pass per rule) and
+the block-wise IncrementalMarkdownFormatter. bench/bench_markdown.py uses it
+as the timing baseline and as the reference output. Do not edit.
+"""
+import re
+
+# Structural detectors
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+)$")
+_BULLET_RE = re.compile(r"^\s*(?:[-*]|\d+\.)\s+")
+_CODE_FENCE_RE = re.compile(r"^\s*```")
+
+# Common bad pattern: "### Heading The paragraph starts..."
+# We split after a short heading title.
+# This is intentionally conservative and only triggers for ### headings.
+_INLINE_H3_RE = re.compile(r"^(###\s+)(.+)$")
+
+
+def format_markdown_safe(text: str) -> str:
+    """
+    Minimal, deterministic Markdown normalizer.
+    Only changes whitespace/newlines; does NOT paraphrase or reorder content.
+
+    Fixes:
+    - Inline headings: "### Title The ..." -> "### Title\n\nThe ..."
+    - Reflow paragraphs: removes accidental hard wraps inside paragraphs
+    - Tight bullets: removes blank lines between bullet items
+    - Ensures one blank line after headings and around list blocks
+    - Preserves code fences exactly
+    """
+      
+    if not isinstance(text, str) or not text.strip():
+        return text
+
+    t = _normalize_newlines(text)
+    t = _strip_trailing_spaces(t)
+
+    t = _rejoin_split_headings(t)
+    t = _split_inline_h3_headings(t)
+    t = _reflow_paragraphs_preserve_blocks(t)
+
+    # Join accidental blank-line breaks in the middle of a sentence/paragraph
+    t = re.sub(r"\n\n(?=[a-z0-9])", " ", t)
+    # blank line before lowercase continuation
+    t = re.sub(r"\b(in|to|of|be|is|are|was|were)\n\n(?=\w)", r"\1 ", t, flags=re.IGNORECASE)
+
+    # ADD THE re.sub FIX HERE
+    t = re.sub(
+    r"\n\n(\d+(?:\s+and\s+\d+)?\s+[A-Za-z]+[A-Za-z\s]*[,.;:]?)\n\n",
+    r" \1 ",
+    t
+    )
+
+    t = _tighten_bullets(t)
+    t = _ensure_blank_line_after_headings(t)
+    t = _ensure_blank_lines_around_lists(t)
+
+    # Cap excessive blank lines (keep max 2 consecutive)
+    t = re.sub(r"\n{4,}", "\n\n\n", t).strip() + "\n"
+    return t
+
+def _rejoin_split_headings(t: str) -> str:
+    """
+    Rejoin headings split across lines (even with blank lines).
+    Example:
+      ### Why the EDI
+      programme?
+    -> ### Why the EDI programme?
+    """
+    lines = t.split("\n")
+    out = []
+    i = 0
+
+    while i < len(lines):
+        line = lines[i].rstrip()
+        stripped = line.strip()
+
+        if stripped.startswith("###"):
+            # find next non-empty line
+            j = i + 1
+            while j < len(lines) and lines[j].strip() == "":
+                j += 1
+
+            if j < len(lines):
+                nxt = lines[j].strip()
+
+                # Merge only if nxt looks like heading continuation
+                if (
+                    nxt
+                    and len(nxt.split()) <= 7
+                    and not nxt.startswith(("#", "-", "*"))
+                    and not _BULLET_RE.match(nxt)
+                    and not re.search(r"[.!]$", nxt)  # allow '?'
+                ):
+                    out.append(f"{stripped} {nxt}")
+                    i = j + 1
+                    continue
+
+        out.append(line)
+        i += 1
+
+    return "\n".join(out)
+
+
+
+
+
+def _normalize_newlines(t: str) -> str:
+    return t.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _strip_trailing_spaces(t: str) -> str:
+    return "\n".join(line.rstrip() for line in t.split("\n"))
+
+def _split_inline_h3_headings(t: str) -> str:
+    """
+    Split inline H3 headings like:
+      "### Programme overview The MSc..." ->
+      "### Programme overview\n\nThe MSc..."
+
+    Prefer splitting before 'The' (common pattern), otherwise fall back to a short-title split.
+    """
+    out = []
+    for line in t.split("\n"):
+        m = _INLINE_H3_RE.match(line.strip())
+        if not m:
+            out.append(line)
+            continue
+
+        prefix, rest = m.group(1), m.group(2).strip()
+
+        # If it's already a short heading, keep it.
+        if len(rest.split()) <= 5:
+            out.append(f"{prefix}{rest}")
+            continue
+
+        # Prefer splitting right before "The " if present (case-insensitive)
+        lower = rest.lower()
+        the_idx = lower.find(" the ")
+        if the_idx != -1:
+            title = rest[:the_idx].strip()
+            cont = rest[the_idx + 1 :].strip()  # keep "The ..." (remove leading space only)
+            if title and cont:
+                out.append(f"{prefix}{title}")
+                out.append("")
+                out.append(cont)
+                continue
+
+        # Fallback: first 3 words as title
+        words = rest.split()
+        title = " ".join(words[:3])
+        cont = " ".join(words[3:]).strip()
+
+        out.append(f"{prefix}{title}")
+        out.append("")
+        out.append(cont)
+
+    return "\n".join(out)
+
+
+
+
+
+def _reflow_paragraphs_preserve_blocks(t: str) -> str:
+    """
+    Joins lines inside paragraphs (hard wraps) into a single line.
+    Preserves headings, bullet/numbered lines, blank lines, and code fences.
+    """
+    lines = t.split("\n")
+    out = []
+    buf = []
+    in_code = False
+
+    def flush_buf():
+        nonlocal buf
+        if not buf:
+            return
+        # Join wrapped lines with spaces (do not change words)
+        out.append(" ".join(s.strip() for s in buf if s.strip()))
+        buf = []
+
+    for line in lines:
+        if _CODE_FENCE_RE.match(line):
+            flush_buf()
+            out.append(line)
+            in_code = not in_code
+            continue
+
+        if in_code:
+            out.append(line)
+            continue
+
+        stripped = line.strip()
+
+        if stripped == "":
+            flush_buf()
+            out.append("")
+            continue
+
+        if _HEADING_RE.match(stripped) or _BULLET_RE.match(stripped):
+            flush_buf()
+            out.append(line)
+            continue
+
+        # Otherwise paragraph text
+        buf.append(line)
+
+    flush_buf()
+    return "\n".join(out)
+
+
+
+def _tighten_bullets(t: str) -> str:
+    """
+    Remove blank lines between consecutive bullet items.
+    Keeps blank lines before/after list blocks (handled separately).
+    """
+    lines = t.split("\n")
+    out = []
+    for i, line in enumerate(lines):
+        if (
+            line.strip() == ""
+            and i > 0
+            and i + 1 < len(lines)
+            and _BULLET_RE.match(lines[i - 1].strip())
+            and _BULLET_RE.match(lines[i + 1].strip())
+        ):
+            # skip blank line between bullets
+            continue
+        out.append(line)
+    return "\n".join(out)
+
+
+def _ensure_blank_line_after_headings(t: str) -> str:
+    lines = t.split("\n")
+    out = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        out.append(line)
+        if _HEADING_RE.match(line.strip()):
+            # Ensure exactly one blank line after heading
+            if i + 1 < len(lines) and lines[i + 1].strip() != "":
+                out.append("")
+        i += 1
+    return "\n".join(out)
+
+
+def _ensure_blank_lines_around_lists(t: str) -> str:
+    """
+    Ensure:
+    - blank line before a list block (if preceding line is text)
+    - blank line after a list block (if following line is text)
+    """
+    lines = t.split("\n")
+    out = []
+    for i, line in enumerate(lines):
+        cur_is_bullet = bool(_BULLET_RE.match(line.strip()))
+        prev = lines[i - 1] if i > 0 else ""
+        nxt = lines[i + 1] if i + 1 < len(lines) else ""
+
+        if cur_is_bullet and prev.strip() != "" and not _BULLET_RE.match(prev.strip()) and not _HEADING_RE.match(prev.strip()):
+            out.append("")
+
+        out.append(line)
+
+        if cur_is_bullet and nxt.strip() != "" and not _BULLET_RE.match(nxt.strip()):
+            out.append("")
+
+    return "\n".join(out)
+
+
+# -----------------------------
+# Incremental (streaming) use
+# -----------------------------
+
+_BLANK_SEP_RE = re.compile(r"\n(?:[ \t]*\n)+")
+_JOIN_WORD_END_RE = re.compile(r"\b(in|to|of|be|is|are|was|were)$", re.IGNORECASE)
+
+
+class IncrementalMarkdownFormatter:
+    """
+    Streaming front-end for format_markdown_safe.
+
+    feed() buffers raw deltas and returns formatted Markdown only for blocks
+    that are final: text up to a blank line whose following block has
+    started (its first line is complete) and can no longer be merged back by
+    any of the cross-block rules above (heading rejoin, lowercase/number
+    continuation, tight bullets, open code fence). close() flushes the rest.
+    """
+
+    def __init__(self, pre=None) -> None:
+        self._buf = ""
+        self._pre = pre  # optional raw-text fixer applied per block before formatting
+        self._emitted = False
+
+    def feed(self, delta: str) -> str:
+        self._buf += delta
+        cut = self._safe_cut()
+        if cut <= 0:
+            return ""
+        head, self._buf = self._buf[:cut], self._buf[cut:]
+        return self._format(head)
+
+    def close(self) -> str:
+        head, self._buf = self._buf, ""
+        return self._format(head)
+
+    def _format(self, raw: str) -> str:
+        if not raw.strip():
+            return ""
+        if self._pre is not None:
+            raw = self._pre(raw)
+        out = format_markdown_safe(raw)
+        if self._emitted:
+            out = "\n" + out  # blank line between blocks
+        self._emitted = True
+        return out
+
+    def _safe_cut(self) -> int:
+        buf = _normalize_newlines(self._buf)
+        if len(buf) != len(self._buf):
+            self._buf = buf
+        cut = 0
+        for m in _BLANK_SEP_RE.finditer(buf):
+            nxt = buf[m.end():]
+            if "\n" not in nxt:
+                break  # next block's first line still streaming
+            if self._can_cut(buf[:m.start()], nxt.split("\n", 1)[0]):
+                cut = m.end()
+        return cut
+
+    @staticmethod
+    def _can_cut(prev: str, next_line: str) -> bool:
+        prev = prev.rstrip()
+        if not prev or not next_line.strip():
+            return False
+        if sum(1 for ln in prev.split("\n") if _CODE_FENCE_RE.match(ln)) % 2:
+            return False
+
+        prev_block = _BLANK_SEP_RE.split(prev)[-1].strip()
+        prev_last = prev.rsplit("\n", 1)[-1].strip()
+        nxt = next_line.strip()
+
+        if prev_last.startswith("#"):
+            return False  # heading may absorb the next line
+        if _BULLET_RE.match(prev_last) and _BULLET_RE.match(nxt):
+            return False  # same list block
+        if re.match(r"[a-z0-9]", nxt):
+            return False  # lowercase / number continuation is re-joined
+        if prev_block[:1].isdigit():
+            return False  # "N units" fragment may be re-joined on both sides
+        if _JOIN_WORD_END_RE.search(prev_last):
+            return False
+        return True
@@ -6,6 +6,12 @@
     window.EDI_CHAT_API_URL ||
     "https://msc-edi-ai-agent.onrender.com/ask";
 
+  // Server-Sent-Events variant of API_URL; set to "" to disable streaming
+  const STREAM_URL =
+    window.EDI_CHAT_STREAM_URL !== undefined
+      ? window.EDI_CHAT_STREAM_URL
+      : API_URL.replace(/\/ask$/, "/ask/stream");
+
   const CHAT_TITLE =
     window.EDI_CHAT_TITLE ||
     "MSc EDI Programme Assistant";
@@ -252,14 +258,98 @@
   /* ============================
      Ask logic
      ============================ */
+  const addCopyTool = (row, getText) => {
+    const tools = document.createElement("div");
+    tools.className = "edi-tools";
+    const copyBtn = document.createElement("button");
+    copyBtn.textContent = "Copy";
+    copyBtn.onclick = () => navigator.clipboard.writeText(getText());
+    tools.appendChild(copyBtn);
+    row.appendChild(tools);
+  };
+
+  // Parse an SSE byte stream from fetch(); calls onEvent(name, data) per event.
+  const readSSE = async (res, onEvent) => {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buf = "";
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buf += decoder.decode(value, { stream: true });
+      let sep;
+      while ((sep = buf.indexOf("\n\n")) !== -1) {
+        const raw = buf.slice(0, sep);
+        buf = buf.slice(sep + 2);
+        let name = "message";
+        let data = "";
+        raw.split("\n").forEach((line) => {
+          if (line.startsWith("event:")) name = line.slice(6).trim();
+          else if (line.startsWith("data:")) data += line.slice(5).trim();
+        });
+        if (data) onEvent(name, JSON.parse(data));
+      }
+    }
+  };
+
+  // Streaming ask: renders each finalized Markdown block as it arrives.
+  // Returns false if streaming is unavailable so the caller can fall back.
+  const askStream = async (question, typing) => {
+    const res = await fetch(STREAM_URL, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ question }),
+    });
+    if (!res.ok || !res.body || !res.body.getReader) return false;
+
+    let row = null;
+    let bubble = null;
+    let text = "";
+    const onEvent = (name, data) => {
+      if (name === "block" && data.text) {
+        if (!row) {
+          if (typing.parentNode) body.removeChild(typing);
+          row = addMsg("bot", "");
+          bubble = row.querySelector(".edi-bubble");
+        }
+        text += data.text;
+        bubble.textContent = text;
+        body.scrollTop = body.scrollHeight;
+      } else if (name === "done") {
+        text = data.answer || text;
+        if (!row) {
+          if (typing.parentNode) body.removeChild(typing);
+          row = addMsg("bot", "");
+          bubble = row.querySelector(".edi-bubble");
+        }
+        bubble.textContent = text || "No answer returned.";
+      }
+    };
+    try {
+      await readSSE(res, onEvent);
+    } catch (e) {
+      // Keep what was already rendered; only fall back if nothing arrived
+      if (!row) return false;
+      bubble.textContent = text + "\n\n(Connection interrupted.)";
+      console.error(e);
+    }
+    if (!row) return false;
+    addCopyTool(row, () => text);
+    return true;
+  };
+
   const ask = async (question) => {
     send.disabled = true;
     addMsg("user", question);
 
     const typing = addMsg("bot", "Typing…");
-    meta.textContent = `Calling: ${API_URL}`;
+    meta.textContent = `Calling: ${STREAM_URL || API_URL}`;
 
     try {
+      if (STREAM_URL && (await askStream(question, typing).catch(() => false))) {
+        return;
+      }
+
       const res = await fetch(API_URL, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
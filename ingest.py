@@ -1,21 +1,35 @@
 import os
-import pickle
+import tempfile
+from pathlib import Path
+
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+from rag.ann import IndexBuilder, choose_index_type, index_params, write_manifest
+from rag.chunking import chunk_spans, normalize_source
+from rag.chunkstore import ChunkStoreWriter
+from rag.embeddings import EMBED_MODEL, make_backend
+from rag.lexical import BM25Writer
+from rag.timing import peak_rss_mb
 
 DATA_FOLDER = "data"  # folder containing .txt files
-DOCS_PKL = "docs.pkl"
+CHUNKS_BIN = "chunks.bin"
 FAISS_INDEX = "faiss.index"
+BM25_INDEX = "bm25.npz"
 
 # ----- SETTINGS -----
 CHUNK_SIZE = 400
 CHUNK_OVERLAP = 50
+EMBED_BATCH_SIZE = 256  # chunks embedded + added per step
+# Embeddings come from EMBED_MODEL / EMBED_BACKEND (rag/embeddings.py), as
+# for the server: the OpenAI API by default. EMBED_MODEL=all-MiniLM-L6-v2
+# runs locally on the int8 ONNX export (pip install -r requirements-onnx.txt,
+# then rag/export_onnx.py).
 
 
 def load_text_files(folder):
-    docs = []
-    file_list = sorted(os.listdir(folder))  # fixed ordering
+    """Yield (filename, text) one file at a time (fixed ordering)."""
+    file_list = sorted(os.listdir(folder))
 
     print(f"📄 Loading documents from {folder}...")
 
@@ -24,71 +38,108 @@ def load_text_files(folder):
             path = os.path.join(folder, filename)
 
             with open(path, "r", encoding="utf-8") as f:
-                text = f.read().strip()
+                text = normalize_source(f.read())  # chunk spans index into this
 
             if text:
-                docs.append(text)
-
-    print(f"🔹 Loaded {len(docs)} documents.")
-    return docs
-
-
-def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
-    chunks = []
-    start = 0
-
-    while start < len(text):
-        end = start + size
-        chunks.append(text[start:end])
-        start = end - overlap
-
-    return chunks
+                yield filename, text
 
 
 def build_dataset(docs):
-    all_chunks = []
-
-    print("🔹 Splitting into chunks...")
-
-    for doc in docs:
-        chunks = chunk_text(doc)
-        all_chunks.extend(chunks)
-
-    print(f"🔹 Total text chunks: {len(all_chunks)}")
-    return all_chunks
-
-
-def embed_chunks(chunks):
-    print("🔹 Embedding text with all-MiniLM-L6-v2...")
-
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-    embeddings = model.encode(chunks, batch_size=32, show_progress_bar=True)
-
-    embeddings = np.asarray(embeddings).astype("float32")
-    return embeddings
-
-
-def save_index(embeddings, chunks):
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dim)
-
-    print(f"🔹 Creating FAISS index (dim={dim})...")
-    index.add(embeddings)
-
-    faiss.write_index(index, FAISS_INDEX)
-
-    print("💾 Saving docs.pkl...")
-    with open(DOCS_PKL, "wb") as f:
-        pickle.dump(chunks, f)
-
-    print("✅ Saved faiss.index and docs.pkl")
+    """Yield chunk dicts lazily, so the corpus is never held in memory at once."""
+    print("🔹 Splitting into chunks (headings, Q/A pairs, lists and tables kept whole)...")
+
+    for filename, doc in docs:
+        for i, (a, b, c) in enumerate(chunk_spans(doc, CHUNK_SIZE, CHUNK_OVERLAP), start=1):
+            yield {"text": c, "source": filename, "chunk": i, "span": (a, b)}
+
+
+def iter_batches(chunks, size=EMBED_BATCH_SIZE):
+    batch = []
+    for c in chunks:
+        batch.append(c)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def build_index(chunks, expected):
+    """
+    Streaming build: each batch is embedded, added to the index and written
+    to the chunk store before the next one is read, so peak memory is the
+    index itself plus one batch. IVF types are trained on a sample and then
+    filled from a temporary on-disk copy of the vectors (see IndexBuilder
+    in rag/ann.py), so nothing is embedded twice.
+    """
+    backend = make_backend(EMBED_MODEL)
+    print(f"🔹 Embedding text with {EMBED_MODEL} ({backend.name})...")
+    builder = None
+    spill = None
+    lexical = BM25Writer()
+    rows = 0
+
+    header = {"embed_model": EMBED_MODEL, "embed_backend": backend.name}
+    with tempfile.TemporaryDirectory(dir=".") as tmp, ChunkStoreWriter(Path(CHUNKS_BIN), header) as store:
+        for batch in iter_batches(chunks):
+            texts = [c["text"] for c in batch]
+            # normalized, so inner product = cosine (what the retriever scores with)
+            embeddings = backend.embed(texts).vectors
+            if builder is None:
+                dim = embeddings.shape[1]
+                kind, params = index_params(choose_index_type(expected), expected, dim)
+                print(f"🔹 Creating FAISS index: {kind} {params or ''} (dim={dim}, ~{expected} chunks)...")
+                builder = IndexBuilder(kind, params, dim, expected)
+                if builder.needs_second_pass:
+                    spill = np.lib.format.open_memmap(
+                        os.path.join(tmp, "vectors.npy"), mode="w+", dtype="float32", shape=(expected, dim))
+            builder.observe(range(rows, rows + len(batch)), embeddings)  # label = row in chunks.bin
+            if spill is not None:
+                spill[rows:rows + len(batch)] = embeddings
+            rows += len(batch)
+            for c in batch:
+                store.add(c["text"], c["source"], c["chunk"], c["span"])
+                lexical.add(c["text"])
+
+        if builder is None:
+            raise RuntimeError("No chunks produced. Check your data/*.txt files.")
+        print(f"🔹 Total text chunks: {rows}")
+        print("💾 Saving chunks.bin and bm25.npz...")
+        lexical.save(Path(BM25_INDEX))
+
+        if spill is not None:
+            print(f"🔹 Training {kind} on a sample, then adding all {rows} vectors...")
+            builder.train()
+            for start in range(0, rows, EMBED_BATCH_SIZE):
+                stop = min(start + EMBED_BATCH_SIZE, rows)
+                builder.add(range(start, stop), spill[start:stop])
+            del spill
+    index = builder.index
+
+    # manifest first, then the index is renamed into place (what a hot reload reacts to)
+    faiss.write_index(index, FAISS_INDEX + ".tmp")
+    write_manifest(Path(FAISS_INDEX), {
+        "embed_model": EMBED_MODEL,
+        "embed_backend": backend.name,
+        "dim": int(index.d),
+        "count": int(index.ntotal),
+        "index": {"type": kind, "params": params},
+    })
+    os.replace(FAISS_INDEX + ".tmp", FAISS_INDEX)
+
+    peak = peak_rss_mb()
+    print(
+        f"✅ Saved faiss.index (+ .json manifest) and chunks.bin "
+        f"(peak RSS {'n/a' if peak is None else f'{peak:.1f} MB'}, "
+        f"index vectors {index.ntotal * index.d * 4 / (1024 * 1024):.1f} MB)"
+    )
 
 
 def main():
-    docs = load_text_files(DATA_FOLDER)
-    chunks = build_dataset(docs)
-    embeddings = embed_chunks(chunks)
-    save_index(embeddings, chunks)
+    # a quick chunking pass first, so the index type is known before embedding
+    expected = sum(1 for _ in build_dataset(load_text_files(DATA_FOLDER)))
+    chunks = build_dataset(load_text_files(DATA_FOLDER))
+    build_index(chunks, expected)
     print("🎉 Ingestion complete! FAISS index is ready.")
 
 
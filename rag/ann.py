@@ -0,0 +1,277 @@
+# rag/ann.py
+"""
+Index types for the FAISS index, shared by the builders and the retriever.
+
+    flat     exact brute force (IndexFlat)                 small corpora
+    hnsw     graph search (IndexHNSWFlat)                  fast, exact vectors kept
+    ivfflat  inverted lists over exact vectors (IndexIVFFlat)
+    ivfpq    inverted lists over PQ codes (IndexIVFPQ)     smallest memory
+
+Builders stream vectors into the chosen type with IndexBuilder as they are
+embedded (IVF types are trained on a sample first); no exact copy of the
+corpus is held next to the index. The choice and its parameters are
+written to a JSON manifest next to faiss.index.
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+# ---- Config (override via env vars) ----
+INDEX_TYPE = os.getenv("INDEX_TYPE", "auto")  # auto | flat | hnsw | ivfflat | ivfpq
+# auto: flat below FLAT_MAX vectors, hnsw below HNSW_MAX, ivfpq above
+FLAT_MAX = int(os.getenv("INDEX_FLAT_MAX", "20000"))
+HNSW_MAX = int(os.getenv("INDEX_HNSW_MAX", "500000"))
+
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "80"))
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # 0 = 4 * sqrt(n)
+PQ_M = int(os.getenv("PQ_M", "0"))  # sub-quantizers; 0 = largest divisor of dim <= 64
+PQ_NBITS = int(os.getenv("PQ_NBITS", "8"))
+
+# Search-time knobs (retriever defaults; the builder's recall report sweeps them)
+EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))  # HNSW
+NPROBE = int(os.getenv("FAISS_NPROBE", "16"))  # IVF
+
+INDEX_TYPES = ("flat", "hnsw", "ivfflat", "ivfpq")
+
+# faiss k-means wants ~39 training points per centroid
+_MIN_POINTS_PER_CENTROID = 39
+_TRAIN_MAX = 100_000
+
+
+def manifest_path(index_path: Path) -> Path:
+    return Path(str(index_path) + ".json")
+
+
+def read_manifest(index_path: Path) -> Dict[str, Any]:
+    """Manifest written by the builder ({} for indexes that predate it)."""
+    p = manifest_path(index_path)
+    if not p.exists():
+        return {}
+    return json.loads(p.read_text(encoding="utf-8"))
+
+
+def write_manifest(index_path: Path, manifest: Dict[str, Any]) -> Path:
+    p = manifest_path(index_path)
+    tmp = p.with_name(p.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    os.replace(tmp, p)
+    return p
+
+
+def choose_index_type(n: int, requested: str = INDEX_TYPE) -> str:
+    if requested != "auto":
+        if requested not in INDEX_TYPES:
+            raise ValueError(f"INDEX_TYPE must be auto or one of {INDEX_TYPES}, got {requested!r}")
+        return requested
+    if n < FLAT_MAX:
+        return "flat"
+    if n < HNSW_MAX:
+        return "hnsw"
+    return "ivfpq"
+
+
+def _pq_m(dim: int) -> int:
+    if PQ_M:
+        return PQ_M
+    return max(m for m in range(1, 65) if dim % m == 0)
+
+
+def index_params(kind: str, n: int, dim: int) -> Tuple[str, Dict[str, Any]]:
+    """
+    Build parameters for `kind` at this corpus size. IVF types that cannot be
+    trained on n vectors are downgraded (ivfpq -> ivfflat -> flat).
+    """
+    if kind in ("ivfflat", "ivfpq"):
+        nlist = IVF_NLIST or int(4 * math.sqrt(n))
+        nlist = max(1, min(nlist, n // _MIN_POINTS_PER_CENTROID))
+        if kind == "ivfpq" and n < (1 << PQ_NBITS) * _MIN_POINTS_PER_CENTROID:
+            kind = "ivfflat"
+        if nlist < 2:
+            return "flat", {}
+        if kind == "ivfpq":
+            return kind, {"nlist": nlist, "pq_m": _pq_m(dim), "pq_nbits": PQ_NBITS}
+        return kind, {"nlist": nlist}
+    if kind == "hnsw":
+        return kind, {"M": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION}
+    return "flat", {}
+
+
+class IndexBuilder:
+    """
+    Builds an index of the given kind from (ids, vectors) batches as they are
+    embedded, without an exact flat copy next to it:
+
+      flat / hnsw   every observe()d batch is added right away
+      ivf*          observe() keeps a uniform reservoir sample of at most
+                    _TRAIN_MAX vectors; train() fits the quantizers on it and
+                    the caller then add()s the vectors in a second pass
+                    (re-read from disk, e.g. the builder's embedding cache)
+
+    Peak memory is the index itself plus the training sample and one batch.
+    With `queries`, observe() also keeps their exact top-k over everything
+    seen (brute force, batch by batch), the ground truth for recall().
+    Vectors are normalized and compared by inner product, as everywhere.
+    """
+
+    def __init__(self, kind: str, params: Dict[str, Any], dim: int, expected: int,
+                 queries: Optional[np.ndarray] = None, k: int = 10) -> None:
+        self.kind = kind
+        self.params = params
+        metric = faiss.METRIC_INNER_PRODUCT
+        if kind in ("flat", "hnsw"):
+            inner = faiss.IndexFlat(dim, metric) if kind == "flat" else faiss.IndexHNSWFlat(dim, params["M"], metric)
+            if kind == "hnsw":
+                inner.hnsw.efConstruction = params["ef_construction"]
+            self.index: faiss.Index = faiss.IndexIDMap2(inner)
+            self._sample: Optional[np.ndarray] = None
+        else:
+            quantizer = faiss.IndexFlat(dim, metric)
+            if kind == "ivfpq":
+                self.index = faiss.IndexIVFPQ(quantizer, dim, params["nlist"], params["pq_m"],
+                                              params["pq_nbits"], metric)
+            else:
+                self.index = faiss.IndexIVFFlat(quantizer, dim, params["nlist"], metric)
+            # arbitrary int64 ids + reconstruct(id) (used by MMR / re-keying)
+            self.index.set_direct_map_type(faiss.DirectMap.Hashtable)
+            self._sample = np.empty((max(1, min(_TRAIN_MAX, expected)), dim), dtype="float32")
+        self._rng = np.random.default_rng(0)
+        self.seen = 0
+        self._queries = queries
+        self._k = k
+        self._top_scores: Optional[np.ndarray] = None
+        self._top_ids: Optional[np.ndarray] = None
+        self._exact_s = 0.0
+
+    @property
+    def needs_second_pass(self) -> bool:
+        return self._sample is not None
+
+    def observe(self, ids: Sequence[int], vecs: np.ndarray) -> None:
+        """First (and for flat / hnsw only) pass over the vectors."""
+        if not len(ids):
+            return
+        vecs = np.ascontiguousarray(vecs, dtype="float32")
+        ids_arr = np.asarray(ids, dtype="int64")
+        if self._queries is not None:
+            self._update_truth(ids_arr, vecs)
+        if self._sample is None:
+            self.index.add_with_ids(vecs, ids_arr)
+        else:
+            self._reservoir(vecs)
+        self.seen += len(ids_arr)
+
+    def _reservoir(self, vecs: np.ndarray) -> None:
+        assert self._sample is not None
+        cap = len(self._sample)
+        t = np.arange(self.seen, self.seen + len(vecs))
+        fill = t < cap
+        self._sample[t[fill]] = vecs[fill]
+        rest = ~fill
+        if rest.any():
+            j = (self._rng.random(int(rest.sum())) * (t[rest] + 1)).astype("int64")
+            keep = j < cap
+            self._sample[j[keep]] = vecs[rest][keep]
+
+    def _update_truth(self, ids: np.ndarray, vecs: np.ndarray) -> None:
+        assert self._queries is not None
+        t0 = time.perf_counter()
+        scores = self._queries @ vecs.T
+        cand_ids = np.broadcast_to(ids, scores.shape)
+        if self._top_scores is not None:
+            scores = np.hstack([self._top_scores, scores])
+            cand_ids = np.hstack([self._top_ids, cand_ids])
+        k = min(self._k, scores.shape[1])
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        self._top_scores = np.take_along_axis(scores, part, axis=1)
+        self._top_ids = np.take_along_axis(cand_ids, part, axis=1)
+        self._exact_s += time.perf_counter() - t0
+
+    def train(self) -> None:
+        """IVF types: fit the quantizers on the sample (then add() every vector)."""
+        if self._sample is None:
+            return
+        self.index.train(self._sample[:min(self.seen, len(self._sample))])
+        self._sample = None
+
+    def add(self, ids: Sequence[int], vecs: np.ndarray) -> None:
+        """Second pass (IVF types, after train())."""
+        assert self._sample is None, "train() first"
+        if len(ids):
+            self.index.add_with_ids(np.ascontiguousarray(vecs, dtype="float32"), np.asarray(ids, dtype="int64"))
+
+    def recall(self, k: int = 10) -> Optional[Dict[str, Any]]:
+        """recall_at_k of the finished index against the exact top-k of the queries."""
+        if self._queries is None or self._top_ids is None:
+            return None
+        order = np.argsort(-self._top_scores, axis=1)
+        truth = np.take_along_axis(self._top_ids, order, axis=1)[:, :k]
+        exact_ms = self._exact_s * 1000.0 / len(self._queries)
+        return recall_at_k(self.index, truth, exact_ms, self._queries, k)
+
+
+def describe(index: faiss.Index) -> str:
+    """Index type name as used in INDEX_TYPE, detected from the object."""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivfflat"
+    return "flat"
+
+
+def set_search_params(index: faiss.Index, ef_search: int = 0, nprobe: int = 0) -> Dict[str, int]:
+    """Apply search-time knobs where the index type has them (0 = leave as is)."""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    applied: Dict[str, int] = {}
+    if isinstance(inner, faiss.IndexHNSW):
+        if ef_search:
+            inner.hnsw.efSearch = ef_search
+        applied["efSearch"] = int(inner.hnsw.efSearch)
+    elif isinstance(inner, faiss.IndexIVF):
+        if nprobe:
+            inner.nprobe = nprobe
+        applied["nprobe"] = int(inner.nprobe)
+    return applied
+
+
+def recall_at_k(ann: faiss.Index, truth: np.ndarray, exact_ms: float,
+                queries: np.ndarray, k: int = 10) -> Dict[str, Any]:
+    """Mean overlap of the ANN top-k with the exact top-k ids (`truth`), plus per-query latency."""
+    k = min(k, truth.shape[1])
+    nq = len(queries)
+
+    def measure() -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        _, got = ann.search(queries, k)
+        ms = (time.perf_counter() - t0) * 1000.0 / nq
+        hits = sum(len(set(t[t >= 0]) & set(g[g >= 0])) for t, g in zip(truth, got))
+        return {"recall": round(hits / (nq * k), 4), "ms_per_query": round(ms, 4)}
+
+    # sweep the search-time knob so the trade-off is visible, then restore the default
+    kind = describe(ann)
+    sweep = []
+    if kind == "hnsw":
+        for ef in sorted({16, 32, 64, 128, 256, EF_SEARCH}):
+            sweep.append(dict(set_search_params(ann, ef_search=max(ef, k)), **measure()))
+    elif kind in ("ivfflat", "ivfpq"):
+        nlist = (faiss.downcast_index(ann.index) if isinstance(ann, faiss.IndexIDMap) else ann).nlist
+        for nprobe in sorted({1, 4, 16, 64, NPROBE}):
+            if nprobe <= nlist:
+                sweep.append(dict(set_search_params(ann, nprobe=nprobe), **measure()))
+    params = set_search_params(ann, EF_SEARCH, NPROBE)
+    return dict(
+        {"k": k, "queries": nq, "search_params": params, "exact_ms_per_query": round(exact_ms, 4)},
+        **measure(),
+        sweep=sweep,
+    )
@@ -2,137 +2,588 @@
 from __future__ import annotations
 
 import os
-import pickle
+import random
+import sqlite3
+import sys
+import threading
 import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Iterator, List, Tuple
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 import faiss
 import numpy as np
-from openai import OpenAI
+from openai import APIConnectionError, APIStatusError, OpenAI
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from rag.ann import (  # noqa: E402
+    IndexBuilder, choose_index_type, describe, index_params, read_manifest, write_manifest,
+)
+from rag.chunking import CHUNKER, chunk_spans, normalize_source  # noqa: E402
+from rag.chunkstore import ChunkStore, ChunkStoreWriter, chunk_id, strip_prefix  # noqa: E402
+from rag.embeddings import EMBED_MODEL, backend_name, make_backend  # noqa: E402
+from rag.faq import FAQ_PATH, FAQ_SOURCES, extract_faq, is_faq_source  # noqa: E402
+from rag.lexical import BM25Writer  # noqa: E402
+from rag.shards import ShardFiles, shard_files, shard_names, shard_of  # noqa: E402
+from rag.timing import peak_rss_mb  # noqa: E402
 
 # ---- Config (override via env vars) ----
-EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")
+# EMBED_MODEL / EMBED_BACKEND pick the embedding backend (rag/embeddings.py);
+# the server must run with the same ones.
 BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "900"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "150"))
 MAX_CHUNKS = int(os.getenv("MAX_CHUNKS", "0"))  # 0 = no limit
 OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))  # seconds
 
+# Parallel embedding: bounded worker pool + per-minute budgets (0 = unlimited;
+# the budgets only apply to API backends)
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))
+EMBED_RPM = int(os.getenv("EMBED_RPM", "3000"))
+EMBED_TPM = int(os.getenv("EMBED_TPM", "1000000"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+EMBED_BACKOFF_BASE = float(os.getenv("EMBED_BACKOFF_BASE", "1.0"))  # seconds
+EMBED_BACKOFF_MAX = float(os.getenv("EMBED_BACKOFF_MAX", "60"))  # seconds
+
+# Incremental rebuilds: chunks whose text is unchanged keep their vectors
+# (from the previous faiss.index or the embedding cache); only new text is
+# embedded. INCREMENTAL=0 or --full forces a rebuild from scratch.
+INCREMENTAL = os.getenv("INCREMENTAL", "1") == "1"
+
+# ANN recall check (only for non-flat index types, see rag/ann.py): the
+# held-out queries are questions ("...?" lines) found in the sources, or one
+# query per line from RECALL_QUERIES_PATH.
+RECALL_K = int(os.getenv("RECALL_K", "10"))
+RECALL_QUERIES = int(os.getenv("RECALL_QUERIES", "200"))
+RECALL_QUERIES_PATH = os.getenv("RECALL_QUERIES_PATH", "")
+
 BASE = Path(__file__).resolve().parent
 ROOT = BASE.parent
 # DATA_DIR = ROOT / "data"
 DATA_DIR = Path(os.getenv("DATA_DIR", str(ROOT / "data")))
-DOCS_PATH = ROOT / "docs.pkl"
+CHUNKS_PATH = ROOT / "chunks.bin"
 FAISS_PATH = ROOT / "faiss.index"
+BM25_PATH = ROOT / "bm25.npz"
+_UNSHARDED = ShardFiles(FAISS_PATH, CHUNKS_PATH, BM25_PATH)  # SHARDS unset (see rag/shards.py)
+_READ_BATCH = 4096  # cached vectors per read in the IVF second pass
+CHUNK_EMBED_CACHE_PATH = Path(os.getenv("CHUNK_EMBED_CACHE_PATH", str(ROOT / "chunk_embeddings.sqlite")))
 
-client = OpenAI()
+# Retries are handled in embed_batch (with the rate limiter), not by the SDK
+backend = make_backend(
+    EMBED_MODEL,
+    **({"client": OpenAI(max_retries=0, timeout=OPENAI_TIMEOUT)} if backend_name() == "openai" else {}),
+)
 
 
-def chunk_text(text: str, chunk_size: int, overlap: int) -> Iterator[str]:
-    """Yield overlapping character chunks from text (memory-safe)."""
-    text = text.replace("\r\n", "\n").strip()
-    n = len(text)
-    if n == 0:
-        return
-    
-    if overlap >= chunk_size:
-        raise ValueError("CHUNK_OVERLAP must be < CHUNK_SIZE")
-
-    start = 0
-    while start < n:
-        end = min(n, start + chunk_size)
-        c = text[start:end].strip()
-        if c:
-            yield c
-
-        # ✅ critical: if we reached the end, stop (prevents infinite tail repeats)
-        if end >= n:
-            break
-        start = end - overlap
+class RateLimiter:
+    """
+    Thread-safe token buckets for requests/min and tokens/min. acquire()
+    blocks until both budgets can cover the request.
+    """
+
+    def __init__(self, rpm: int, tpm: int) -> None:
+        self.rpm = rpm
+        self.tpm = tpm
+        self._req = float(rpm)
+        self._tok = float(tpm)
+        self._t = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        dt = now - self._t
+        self._t = now
+        if self.rpm:
+            self._req = min(self.rpm, self._req + dt * self.rpm / 60.0)
+        if self.tpm:
+            self._tok = min(self.tpm, self._tok + dt * self.tpm / 60.0)
+
+    def acquire(self, tokens: int) -> None:
+        if self.tpm:
+            tokens = min(tokens, self.tpm)  # a single oversize request must still pass eventually
+        while True:
+            with self._lock:
+                self._refill()
+                need_req = 1 - self._req if self.rpm else 0.0
+                need_tok = tokens - self._tok if self.tpm else 0.0
+                if need_req <= 0 and need_tok <= 0:
+                    if self.rpm:
+                        self._req -= 1
+                    if self.tpm:
+                        self._tok -= tokens
+                    return
+                wait = max(
+                    need_req * 60.0 / self.rpm if self.rpm else 0.0,
+                    need_tok * 60.0 / self.tpm if self.tpm else 0.0,
+                )
+            time.sleep(wait)
+
+
+_limiter = RateLimiter(EMBED_RPM, EMBED_TPM)
+
+
+def estimate_tokens(texts: List[str]) -> int:
+    # ~4 chars/token for English; good enough for budgeting
+    return sum(len(t) for t in texts) // 4 + len(texts)
+
+
+def _retry_delay(attempt: int, err: Exception) -> float:
+    """Exponential backoff with full jitter; honours Retry-After when present."""
+    response = getattr(err, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(EMBED_BACKOFF_MAX, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(EMBED_BACKOFF_MAX, EMBED_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _is_retryable(err: Exception) -> bool:
+    if isinstance(err, APIConnectionError):  # includes timeouts
+        return True
+    if isinstance(err, APIStatusError):
+        return err.status_code == 429 or err.status_code >= 500
+    return False
 
-def iter_sources() -> Iterator[Tuple[str, str]]:
+
+def iter_sources(shard: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+    """(name, text) of every source file, or only those of one shard."""
     if not DATA_DIR.exists():
         raise FileNotFoundError(f"Missing data folder: {DATA_DIR}")
     files = sorted(DATA_DIR.rglob("*.txt"))
     if not files:
         raise FileNotFoundError(f"No .txt files found in: {DATA_DIR}")
     for fp in files:
-        yield fp.name, fp.read_text(encoding="utf-8", errors="ignore")
+        if shard is None or shard_of(fp.name) == shard:
+            yield fp.name, fp.read_text(encoding="utf-8", errors="ignore")
 
 
 def embed_batch(texts: List[str]) -> np.ndarray:
-    """Embed a batch and return normalized float32 vectors."""
-    print(f"Embedding batch of {len(texts)}...")
+    """Embed a batch and return normalized float32 vectors (rate-limited, retried)."""
     t0 = time.time()
-    resp = client.embeddings.create(
-        model=EMBED_MODEL,
-        input=texts,
-        timeout=OPENAI_TIMEOUT,
-    )
-    vecs = np.array([d.embedding for d in resp.data], dtype="float32")
-    faiss.normalize_L2(vecs)  # cosine-like similarity with IndexFlatIP
-    print(f"Batch done in {time.time() - t0:.1f}s")
+    tokens = estimate_tokens(texts)
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        if backend.remote:
+            _limiter.acquire(tokens)
+        try:
+            vecs = backend.embed(texts).vectors  # cosine-like similarity with IndexFlatIP
+            break
+        except Exception as e:
+            if not _is_retryable(e) or attempt == EMBED_MAX_RETRIES:
+                raise
+            delay = _retry_delay(attempt, e)
+            print(f"Embedding batch failed ({type(e).__name__}); retry {attempt + 1} in {delay:.1f}s")
+            time.sleep(delay)
+
+    print(f"Embedded batch of {len(texts)} in {time.time() - t0:.1f}s")
     return vecs
 
 
-def main() -> None:
-    docs: List[str] = []
-    vec_batches: List[np.ndarray] = []
+def embed_in_order(batches: Iterable[List[str]], workers: int = EMBED_WORKERS) -> Iterator[np.ndarray]:
+    """
+    Embed batches on a bounded thread pool and yield the results in input
+    order. At most 2 * workers batches are in flight, so memory stays
+    bounded even when the batch source is a long generator.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        inflight: Deque[Future] = deque()
+        try:
+            for texts in batches:
+                inflight.append(pool.submit(embed_batch, texts))
+                if len(inflight) >= 2 * max(1, workers):
+                    yield inflight.popleft().result()
+            while inflight:
+                yield inflight.popleft().result()
+        finally:
+            for f in inflight:
+                f.cancel()
 
-    chunk_count = 0
-    pending: List[str] = []
 
-    print(f"Reading sources from: {DATA_DIR}")
-    print(
-        f"Embedding model: {EMBED_MODEL} | batch={BATCH_SIZE} | chunk={CHUNK_SIZE} | "
-        f"overlap={CHUNK_OVERLAP} | max_chunks={MAX_CHUNKS or 'none'}"
+class ChunkEmbeddingCache:
+    """
+    Persistent chunk_id -> vector map (sqlite, float32 blobs). chunk_id
+    hashes the backend key (backend + model) with the exact chunk text, so an
+    entry can never be served for different text or a different model.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._db = sqlite3.connect(str(path))
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_embeddings (id INTEGER PRIMARY KEY, vec BLOB NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, cid: int) -> Optional[np.ndarray]:
+        row = self._db.execute("SELECT vec FROM chunk_embeddings WHERE id = ?", (cid,)).fetchone()
+        return None if row is None else np.frombuffer(row[0], dtype="float32")
+
+    def get_many(self, ids: List[int]) -> Dict[int, np.ndarray]:
+        out: Dict[int, np.ndarray] = {}
+        for k in range(0, len(ids), 500):  # under sqlite's bound-parameter limit
+            part = ids[k:k + 500]
+            rows = self._db.execute(
+                f"SELECT id, vec FROM chunk_embeddings WHERE id IN ({','.join('?' * len(part))})", part
+            )
+            out.update((cid, np.frombuffer(vec, dtype="float32")) for cid, vec in rows)
+        return out
+
+    def put_many(self, ids: List[int], vecs: np.ndarray) -> None:
+        self._db.executemany(
+            "INSERT OR REPLACE INTO chunk_embeddings (id, vec) VALUES (?, ?)",
+            [(cid, v.tobytes()) for cid, v in zip(ids, vecs)],
+        )
+        self._db.commit()
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class PreviousIndex:
+    """
+    Vectors of the previous build by chunk_id, for chunks that are missing
+    from the embedding cache (builds from before the cache existed).
+    faiss.index is only opened, memory-mapped where faiss supports it, on
+    the first lookup, so a rebuild whose vectors are all cached never loads
+    it. Lossy IVF-PQ codes are not reused; those chunks are re-embedded.
+    """
+
+    def __init__(self, path: Path, ids: np.ndarray, row_addressed: bool) -> None:
+        self.path = path
+        self.ids: Set[int] = set(ids.tolist())
+        self._rows: Optional[Dict[int, int]] = None
+        if row_addressed:  # older builds: label = row in the chunk store
+            self._rows = {}
+            for row, cid in enumerate(ids.tolist()):
+                self._rows.setdefault(cid, row)
+        self._index: Optional[faiss.Index] = None
+
+    def get(self, cid: int) -> Optional[np.ndarray]:
+        if cid not in self.ids:
+            return None
+        if self._index is None:
+            flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+            try:
+                self._index = faiss.read_index(str(self.path), flag | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                self._index = faiss.read_index(str(self.path))
+            print(f"Reading vectors missing from the cache from the previous {describe(self._index)} index")
+        if describe(self._index) == "ivfpq":
+            return None
+        return self._index.reconstruct(self._rows[cid] if self._rows is not None else cid)
+
+
+def load_previous(files: ShardFiles) -> Optional[PreviousIndex]:
+    """
+    The previous build of this shard, or None when there is nothing
+    reusable (missing files, other model). A row-addressed index from an
+    older build is re-keyed using the text in its chunk store.
+    """
+    if not (files.faiss.exists() and files.chunks.exists()):
+        return None
+    old = ChunkStore(files.chunks)
+    model = old.header.get("embed_model")
+    built_with = old.header.get("embed_backend", "openai")  # older stores predate EMBED_BACKEND
+    if model is None:
+        # stores converted from docs.pkl carry no model; they came from this builder
+        print(f"Previous chunks.bin does not record its model; assuming {EMBED_MODEL}")
+    elif model != EMBED_MODEL or built_with != backend.name:
+        print(f"Previous index was built with {model!r} ({built_with}); doing a full rebuild")
+        return None
+    count = read_manifest(files.faiss).get("count")
+    if count is not None and int(count) != len(old):
+        print("Previous faiss.index and chunks.bin disagree; doing a full rebuild")
+        return None
+
+    if old.ids is None:
+        ids = np.fromiter((chunk_id(backend.key, old.text(i)) for i in range(len(old))), dtype="int64")
+    else:
+        ids = np.array(old.ids, dtype="int64")
+    return PreviousIndex(files.faiss, ids, old.ids is None)
+
+
+def iter_recall_queries(shard: Optional[str] = None) -> List[str]:
+    if RECALL_QUERIES_PATH:
+        lines = Path(RECALL_QUERIES_PATH).read_text(encoding="utf-8").splitlines()
+    else:
+        lines = [
+            line for _, text in iter_sources(shard)
+            for line in normalize_source(text).splitlines() if line.strip().endswith("?")
+        ]
+    queries = sorted({q.strip() for q in lines if q.strip()})
+    random.Random(0).shuffle(queries)
+    return queries[:RECALL_QUERIES]
+
+
+def embed_queries(queries: List[str], cache: ChunkEmbeddingCache) -> np.ndarray:
+    """Query vectors via the embedding cache (only unseen queries are embedded)."""
+    ids = [chunk_id(backend.key, q) for q in queries]
+    vecs: List[Optional[np.ndarray]] = [cache.get(cid) for cid in ids]
+    missing = [i for i, v in enumerate(vecs) if v is None]
+    for k in range(0, len(missing), BATCH_SIZE):
+        part = missing[k:k + BATCH_SIZE]
+        out = embed_batch([queries[i] for i in part])
+        cache.put_many([ids[i] for i in part], out)
+        for i, v in zip(part, out):
+            vecs[i] = v
+    return np.vstack(vecs).astype("float32")
+
+
+def format_memory_summary(ntotal: int, dim: int) -> str:
+    """
+    Peak RSS next to the size of the vectors themselves: chunk text and
+    batches are streamed, so the peak should track the index, not the corpus.
+    """
+    peak = peak_rss_mb()
+    vectors_mb = ntotal * dim * 4 / (1024.0 * 1024.0)
+    return (
+        f"Memory: peak RSS {'n/a' if peak is None else f'{peak:.1f} MB'} | "
+        f"index vectors {vectors_mb:.1f} MB ({ntotal} x {dim} float32)"
     )
 
-    for fname, text in iter_sources():
+
+def count_chunks(shard: Optional[str] = None) -> int:
+    """Chunks the build will see (before dedup), to size the index ahead of embedding."""
+    n = 0
+    for _, text in iter_sources(shard):
+        n += sum(1 for _ in chunk_spans(text, CHUNK_SIZE, CHUNK_OVERLAP))
+        if MAX_CHUNKS and n >= MAX_CHUNKS:
+            return MAX_CHUNKS
+    return n
+
+
+def iter_chunks(shard: Optional[str] = None) -> Iterator[Tuple[str, str, int, Tuple[int, int]]]:
+    """Yield (doc, source, chunk_no, span) for every chunk of every source (of one shard)."""
+    chunk_count = 0
+    for fname, text in iter_sources(shard):
         print(f"FILE {fname}: chars={len(text)}")
-        for i, c in enumerate(chunk_text(text, CHUNK_SIZE, CHUNK_OVERLAP), start=1):
-            docs.append(f"[{fname} | chunk {i}]\n{c}")
-            pending.append(docs[-1])
+        for i, (a, b, c) in enumerate(chunk_spans(text, CHUNK_SIZE, CHUNK_OVERLAP), start=1):
+            yield f"[{fname} | chunk {i}]\n{c}", fname, i, (a, b)
             chunk_count += 1
 
             if chunk_count % 500 == 0:
                 print(f"Chunks processed: {chunk_count}")
 
             if MAX_CHUNKS and chunk_count >= MAX_CHUNKS:
-                break
+                return
 
-            if len(pending) >= BATCH_SIZE:
-                vec_batches.append(embed_batch(pending))
-                pending.clear()
 
-          
-        if MAX_CHUNKS and chunk_count >= MAX_CHUNKS:
-            break
+def iter_batches(
+    store: ChunkStoreWriter,
+    lexical: BM25Writer,
+    builder: IndexBuilder,
+    cache: ChunkEmbeddingCache,
+    previous: Optional[PreviousIndex],
+    seen: Set[int],
+    pending_ids: Deque[List[int]],
+    reused: Dict[str, int],
+    shard: Optional[str] = None,
+) -> Iterator[List[str]]:
+    """
+    Record every chunk in the store (and the BM25 index) and decide where its vector comes from:
+    the embedding cache, the previous build (copied into the cache), or
+    neither (yielded for embedding; its ids are queued on pending_ids).
+    Reused vectors go to the builder batch by batch, in chunk order.
+    """
+    ids: List[int] = []
+    texts: List[str] = []
+    hit_ids: List[int] = []
+    hit_vecs: List[np.ndarray] = []
+    copied_ids: List[int] = []
+    copied_vecs: List[np.ndarray] = []
+
+    for doc, fname, i, span in iter_chunks(shard):
+        cid = chunk_id(backend.key, doc)
+        if cid in seen:
+            print(f"Skipping duplicate chunk: {fname} | chunk {i}")
+            continue
+        seen.add(cid)
+        store.add(doc, fname, i, span, cid)
+        lexical.add(strip_prefix(doc))
+
+        vec = cache.get(cid)
+        if vec is not None:
+            reused["cache"] += 1
+        elif previous is not None:
+            vec = previous.get(cid)
+            if vec is not None:
+                reused["previous"] += 1
+                copied_ids.append(cid)
+                copied_vecs.append(vec)
+        if vec is not None:
+            hit_ids.append(cid)
+            hit_vecs.append(vec)
+            if len(hit_ids) >= BATCH_SIZE:
+                builder.observe(hit_ids, np.vstack(hit_vecs))
+                hit_ids, hit_vecs = [], []
+            if len(copied_ids) >= BATCH_SIZE:
+                cache.put_many(copied_ids, np.vstack(copied_vecs))
+                copied_ids, copied_vecs = [], []
+            continue
+
+        ids.append(cid)
+        texts.append(doc)
+        if len(texts) >= BATCH_SIZE:
+            pending_ids.append(ids)
+            yield texts
+            ids, texts = [], []
+
+    if hit_ids:
+        builder.observe(hit_ids, np.vstack(hit_vecs))
+    if copied_ids:
+        cache.put_many(copied_ids, np.vstack(copied_vecs))
+    if texts:
+        pending_ids.append(ids)
+        yield texts
 
-    if pending:
-        vec_batches.append(embed_batch(pending))
-        pending.clear()
 
-    if not docs:
-        raise RuntimeError("No chunks produced. Check your data/*.txt files.")
+def build(name: str, cache: ChunkEmbeddingCache, full: bool) -> None:
+    """Build (or incrementally update) the index of one shard ("" = unsharded)."""
+    files = shard_files(name, _UNSHARDED)
+    files.faiss.parent.mkdir(parents=True, exist_ok=True)
+    shard = name or None
+    previous = None if full else load_previous(files)
 
-    print(f"Total chunks collected: {len(docs)}")
+    # size the index up front so vectors go straight into it as they arrive
+    expected = count_chunks(shard)
+    if not expected:
+        where = f"shard {name!r} (check its SHARDS patterns)" if name else "your data/*.txt files"
+        raise RuntimeError(f"No chunks produced. Check {where}.")
+    dim = backend.dim or int(embed_batch(["dimension probe"]).shape[1])
+    kind, params = index_params(choose_index_type(expected), expected, dim)
+    queries = None
+    if kind != "flat":
+        recall_queries = iter_recall_queries(shard)
+        if recall_queries:
+            queries = embed_queries(recall_queries, cache)
+    builder = IndexBuilder(kind, params, dim, expected, queries, RECALL_K)
 
-    vecs = np.vstack(vec_batches)
-    print(f"Embeddings shape: {vecs.shape}")
+    store = ChunkStoreWriter(files.chunks, {"embed_model": EMBED_MODEL, "embed_backend": backend.name})
+    lexical = BM25Writer()
+    seen: Set[int] = set()
+    pending_ids: Deque[List[int]] = deque()
+    reused = {"cache": 0, "previous": 0}
 
-    dim = vecs.shape[1]
-    index = faiss.IndexFlatIP(dim)
+    print(f"Reading sources from: {DATA_DIR}" + (f" (shard {name})" if name else ""))
+    print(
+        f"Embedding model: {EMBED_MODEL} ({backend.name}) | batch={BATCH_SIZE} | chunker={CHUNKER} | chunk={CHUNK_SIZE} | "
+        f"overlap={CHUNK_OVERLAP} | max_chunks={MAX_CHUNKS or 'none'} | "
+        f"workers={EMBED_WORKERS} | rpm={EMBED_RPM or 'inf'} | tpm={EMBED_TPM or 'inf'} | "
+        f"mode={'full' if full else 'incremental'} "
+        f"({len(previous.ids) if previous is not None else 0} previous vectors)"
+    )
+    print(f"Index type: {kind} {params or ''} (~{expected} chunks)")
+
+    t0 = time.time()
+    embedded = api_batches = 0
+    batches = iter_batches(store, lexical, builder, cache, previous, seen, pending_ids, reused, shard)
+    for vecs in embed_in_order(batches):
+        ids = pending_ids.popleft()
+        cache.put_many(ids, vecs)
+        builder.observe(ids, vecs)
+        embedded += len(ids)
+        api_batches += 1
+
+    removed = len(previous.ids - seen) if previous is not None else 0
+    print(
+        f"Total chunks: {len(store)} | from cache {reused['cache']} | from previous index {reused['previous']} | "
+        f"embedded {embedded} ({api_batches} batches) | removed {removed} | {time.time() - t0:.1f}s"
+    )
+
+    if builder.needs_second_pass:
+        # IVF: quantizers from the sample, then every vector again from the cache
+        t1 = time.time()
+        builder.train()
+        order = sorted(seen)
+        for k in range(0, len(order), _READ_BATCH):
+            part = order[k:k + _READ_BATCH]
+            got = cache.get_many(part)
+            builder.add(part, np.vstack([got[cid] for cid in part]))
+        print(f"Trained and filled {kind} in {time.time() - t1:.1f}s")
+
+    index = builder.index
+    assert index.ntotal == len(store)
+
+    recall = builder.recall(RECALL_K)
+    if recall is not None:
+        print(
+            f"Recall@{recall['k']} vs exact search over {recall['queries']} queries "
+            f"(exact: {recall['exact_ms_per_query']:.3f} ms/query):"
+        )
+        for row in recall["sweep"]:
+            knob = ", ".join(f"{k}={v}" for k, v in row.items() if k not in ("recall", "ms_per_query"))
+            print(f"  {knob:<14} recall={row['recall']:.4f}  {row['ms_per_query']:.3f} ms/query")
+        print(f"  serving with {recall['search_params']}: recall={recall['recall']:.4f}")
+    elif kind != "flat":
+        print("Recall: no held-out queries found; set RECALL_QUERIES_PATH")
+
+    print("Writing chunks.bin, bm25.npz and faiss.index...")
+    store.close()
+    lexical.save(files.bm25)
+
+    # tmp + rename, so a running server (hot reload) never reads a partial
+    # file; the manifest lands first and the index rename (what a reload
+    # reacts to) last, so the new index is never checked against the old one
+    tmp = files.faiss.with_name(files.faiss.name + ".tmp")
+    faiss.write_index(index, str(tmp))
+    manifest = write_manifest(files.faiss, {
+        "embed_model": EMBED_MODEL,
+        "embed_backend": backend.name,
+        "dim": int(index.d),
+        "count": int(index.ntotal),
+        "index": {"type": kind, "params": params},
+        "recall": recall,
+        "shard": name,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    })
+    os.replace(tmp, files.faiss)
+
+    print("Wrote:", files.chunks, files.bm25, files.faiss, manifest)
+    print(format_memory_summary(index.ntotal, index.d))
+
+
+def build_faq(cache: ChunkEmbeddingCache) -> None:
+    """Embed the questions of the FAQ sources into faq.index (see rag/faq.py)."""
+    entries = [
+        e for fname, text in iter_sources() if is_faq_source(fname)
+        for e in extract_faq(normalize_source(text), fname, shard_of(fname))
+    ]
+    if not entries:
+        print(f"FAQ: no question/answer pairs in {', '.join(FAQ_SOURCES)}; faq.index not written")
+        return
+    vecs = embed_queries([e.question for e in entries], cache)
+    index = faiss.IndexFlatIP(int(vecs.shape[1]))
     index.add(vecs)
 
-    print("Writing docs.pkl and faiss.index...")
-    with open(DOCS_PATH, "wb") as f:
-        pickle.dump(docs, f)
+    # manifest first, index last (as for the chunk index)
+    tmp = FAQ_PATH.with_name(FAQ_PATH.name + ".tmp")
+    faiss.write_index(index, str(tmp))
+    manifest = write_manifest(FAQ_PATH, {
+        "embed_model": EMBED_MODEL,
+        "embed_backend": backend.name,
+        "dim": int(index.d),
+        "count": int(index.ntotal),
+        "sources": sorted({e.source for e in entries}),
+        "entries": [e._asdict() for e in entries],
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    })
+    os.replace(tmp, FAQ_PATH)
+    print(f"FAQ: {len(entries)} questions from {len({e.source for e in entries})} source(s)")
+    print("Wrote:", FAQ_PATH, manifest)
 
-    faiss.write_index(index, str(FAISS_PATH))
 
-    print("Wrote:", DOCS_PATH, FAISS_PATH)
+def main() -> None:
+    """Build every shard (one index when SHARDS is unset) and the FAQ index; --full ignores previous builds."""
+    full = "--full" in sys.argv[1:] or not INCREMENTAL
+    cache = ChunkEmbeddingCache(CHUNK_EMBED_CACHE_PATH)
+    try:
+        for name in shard_names():
+            build(name, cache, full)
+        if FAQ_SOURCES:
+            build_faq(cache)
+    finally:
+        cache.close()
     print("Done.")
 
 
@@ -0,0 +1,390 @@
+# rag/cache.py
+from __future__ import annotations
+
+import asyncio
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Cache-key normalization: case-fold and collapse whitespace."""
+    return _WS_RE.sub(" ", (text or "").strip()).casefold()
+
+
+class LRUCache:
+    """
+    Small thread-safe LRU with optional TTL (seconds, 0 = never expires).
+    Counts hits / misses / evictions for the stats endpoint.
+    """
+
+    def __init__(self, max_size: int, ttl: float = 0.0) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            stored_at, value = item
+            if self.ttl and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class EmbeddingCache:
+    """
+    Query-embedding cache keyed on (model, normalized text).
+
+    Tier 1 is an in-memory LRU. Tier 2 (optional) is a sqlite file of float32
+    blobs, so the cache survives restarts/redeploys when the path is on a
+    persistent disk. Misses are recorded with the API latency and token usage
+    they cost, which gives an estimate of what the hits saved.
+
+    put() only touches the LRU and a queue: a background thread writes the
+    queued vectors to sqlite in batches (one commit each) on its own
+    connection, so disk latency never blocks the event loop. close() (or
+    flush()) waits for the queue to drain. On the async path, aget() does
+    the sqlite lookup of an LRU miss in a worker thread for the same reason.
+    """
+
+    WRITE_BATCH = 64  # rows per sqlite commit
+
+    def __init__(self, max_size: int, path: Optional[Path] = None) -> None:
+        self._mem = LRUCache(max_size)
+        self._path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._writes: "queue.Queue[Optional[Tuple[str, str, bytes]]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        self.disk_hits = 0
+        self.disk_writes = 0
+        self._miss_ms = 0.0
+        self._miss_tokens = 0
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            # WAL: lookups keep reading while the writer thread commits
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                " model TEXT NOT NULL, text TEXT NOT NULL, vec BLOB NOT NULL,"
+                " PRIMARY KEY (model, text))"
+            )
+            self._db.commit()
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        key = (model, normalize_query(text))
+        vec = self._mem.get(key)
+        if vec is not None or self._db is None:
+            return vec
+        return self._disk_get(key)
+
+    async def aget(self, model: str, text: str) -> Optional[np.ndarray]:
+        """get() for the event loop: an LRU miss is looked up on disk in a worker thread."""
+        key = (model, normalize_query(text))
+        vec = self._mem.get(key)
+        if vec is not None or self._db is None:
+            return vec
+        return await asyncio.to_thread(self._disk_get, key)
+
+    def _disk_get(self, key: Tuple[str, str]) -> Optional[np.ndarray]:
+        assert self._db is not None
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT vec FROM query_embeddings WHERE model = ? AND text = ?", key
+            ).fetchone()
+        if row is None:
+            return None
+        vec = np.frombuffer(row[0], dtype="float32").copy()
+        self.disk_hits += 1
+        self._mem.put(key, vec)
+        return vec
+
+    def put(self, model: str, text: str, vec: np.ndarray, api_ms: float = 0.0, tokens: int = 0) -> None:
+        key = (model, normalize_query(text))
+        vec = np.ascontiguousarray(vec, dtype="float32")
+        self._mem.put(key, vec)
+        self._miss_ms += api_ms
+        self._miss_tokens += tokens
+        if self._db is not None:
+            self._start_writer()
+            self._writes.put((key[0], key[1], vec.tobytes()))
+
+    def _start_writer(self) -> None:
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="embedding-cache-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self) -> None:
+        assert self._path is not None
+        db = sqlite3.connect(str(self._path))
+        try:
+            while True:
+                item = self._writes.get()
+                rows: List[Tuple[str, str, bytes]] = []
+                stop = item is None
+                if item is not None:
+                    rows.append(item)
+                while not stop and len(rows) < self.WRITE_BATCH:
+                    try:
+                        item = self._writes.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                    else:
+                        rows.append(item)
+                if rows:
+                    db.executemany(
+                        "INSERT OR REPLACE INTO query_embeddings (model, text, vec) VALUES (?, ?, ?)", rows
+                    )
+                    db.commit()
+                    self.disk_writes += len(rows)
+                for _ in range(len(rows) + (item is None)):
+                    self._writes.task_done()
+                if stop:
+                    return
+        finally:
+            db.close()
+
+    def flush(self) -> None:
+        """Block until every queued vector is on disk."""
+        if self._writer is not None:
+            self._writes.join()
+
+    def close(self) -> None:
+        """Flush and stop the writer thread (a later put() starts a new one)."""
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._writes.put(None)
+            writer.join()
+
+    def stats(self) -> Dict[str, Any]:
+        s = self._mem.stats()
+        # A disk hit is recorded as a memory miss; report end-to-end numbers.
+        api_calls = s["misses"] - self.disk_hits
+        saved = s["hits"] + self.disk_hits
+        avg_ms = self._miss_ms / api_calls if api_calls else 0.0
+        avg_tokens = self._miss_tokens / api_calls if api_calls else 0.0
+        lookups = s["hits"] + s["misses"]
+        s.update({
+            "disk_enabled": self._db is not None,
+            "disk_hits": self.disk_hits,
+            "disk_writes": self.disk_writes,
+            "disk_pending": self._writes.qsize(),
+            "api_calls": api_calls,
+            "hit_rate": round(saved / lookups, 4) if lookups else 0.0,
+            "est_api_ms_saved": round(saved * avg_ms, 1),
+            "est_tokens_saved": int(saved * avg_tokens),
+        })
+        return s
+
+
+class AnswerCache:
+    """
+    Final-answer cache in front of the LLM stage.
+
+    The key combines the normalized question, the ids of the retrieved
+    chunks, the system-prompt hash and the index version. Entries expire
+    after `ttl` seconds; when a new index version shows up the whole cache
+    is dropped, so answers built on a previous index are never served.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self._lru = LRUCache(max_size, ttl)
+        self._version = ""
+        self.invalidations = 0
+
+    @staticmethod
+    def key(question: str, chunk_ids: Any, prompt_hash: str, index_version: str) -> Tuple[Hashable, ...]:
+        return (normalize_query(question), tuple(chunk_ids), prompt_hash, index_version)
+
+    def _check_version(self, index_version: str) -> None:
+        if index_version != self._version:
+            if self._version:
+                self._lru.clear()
+                self.invalidations += 1
+            self._version = index_version
+
+    def get(self, key: Tuple[Hashable, ...]) -> Optional[str]:
+        self._check_version(key[-1])  # type: ignore[arg-type]
+        return self._lru.get(key)
+
+    def put(self, key: Tuple[Hashable, ...], answer: str) -> None:
+        self._check_version(key[-1])  # type: ignore[arg-type]
+        self._lru.put(key, answer)
+
+    def stats(self) -> Dict[str, Any]:
+        s = self._lru.stats()
+        s.update({
+            "ttl_s": self._lru.ttl,
+            "index_version": self._version,
+            "invalidations": self.invalidations,
+        })
+        return s
+
+
+class SemanticAnswerCache:
+    """
+    Near-duplicate answer cache over past query embeddings.
+
+    A small in-memory FAISS IndexFlatIP (wrapped in an IDMap so entries can
+    be evicted) holds the normalized query vectors that _embed_query already
+    produced. A lookup reuses a cached answer when the best cosine score is
+    >= `threshold` AND the stored routing intent equals the current one, so a
+    suitability question never gets a requirement answer (and vice versa).
+
+    The search is restricted (IDSelectorBatch) to entries of the caller's
+    index version and intent, so closer neighbours from another shard, intent
+    or version can never hide an eligible entry further down the ranking.
+    """
+
+    def __init__(self, max_size: int, threshold: float, ttl: float = 0.0) -> None:
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl = ttl
+        self._index: Optional[faiss.Index] = None  # created on first put (dim from the vector)
+        # id -> (stored_at, index_version, intent, answer); insertion order = eviction order
+        self._entries: "OrderedDict[int, Tuple[float, str, str, str]]" = OrderedDict()
+        # (index_version, intent) -> ids, the candidates of one lookup
+        self._groups: Dict[Tuple[str, str], set] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.intent_rejects = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _remove(self, ids: list) -> None:
+        assert self._index is not None
+        self._index.remove_ids(np.asarray(ids, dtype="int64"))
+        for i in ids:
+            _, version, intent, _ = self._entries.pop(i)
+            group = (version, intent)
+            self._groups[group].discard(i)
+            if not self._groups[group]:
+                del self._groups[group]
+
+    def get(self, vec: np.ndarray, intent: str, index_version: str) -> Optional[str]:
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            candidates = self._groups.get((index_version, intent))
+            if candidates and self.ttl:
+                now = time.monotonic()
+                expired = [i for i in candidates if now - self._entries[i][0] > self.ttl]
+                if expired:
+                    self._remove(expired)
+                candidates = self._groups.get((index_version, intent))
+            query = vec.reshape(1, -1).astype("float32")
+            if candidates:
+                sel = faiss.IDSelectorBatch(np.fromiter(candidates, dtype="int64", count=len(candidates)))
+                scores, ids = self._index.search(query, 1, params=faiss.SearchParameters(sel=sel))
+                if ids[0][0] >= 0 and scores[0][0] >= self.threshold:
+                    self._entries.move_to_end(int(ids[0][0]))
+                    self.hits += 1
+                    return self._entries[int(ids[0][0])][3]
+
+            # miss; count it as an intent reject if another intent had a match
+            if self._index is not None and self._index.ntotal:
+                scores, ids = self._index.search(query, 1)
+                i = int(ids[0][0])
+                if i >= 0 and scores[0][0] >= self.threshold and self._entries[i][2] != intent:
+                    self.intent_rejects += 1
+            self.misses += 1
+            return None
+
+    def put(self, vec: np.ndarray, intent: str, answer: str, index_version: str) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if self._index is None:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(int(vec.shape[-1])))
+            # answers are only stored for the live index: older versions are stale
+            stale = [i for (v, _), ids in self._groups.items() if v != index_version for i in ids]
+            if stale:
+                self._remove(stale)
+                self.invalidations += 1
+            if len(self._entries) >= self.max_size:
+                n_evict = len(self._entries) - self.max_size + 1
+                oldest = [i for i, _ in zip(self._entries, range(n_evict))]
+                self._remove(oldest)
+                self.evictions += len(oldest)
+
+            i = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(
+                vec.reshape(1, -1).astype("float32"), np.asarray([i], dtype="int64")
+            )
+            self._entries[i] = (time.monotonic(), index_version, intent, answer)
+            self._groups.setdefault((index_version, intent), set()).add(i)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "intent_rejects": self.intent_rejects,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
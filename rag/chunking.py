@@ -0,0 +1,247 @@
+# rag/chunking.py
+"""
+Structure-aware chunking of the data/*.txt sources, shared by
+rag/build_index_openai.py and ingest.py.
+
+The scraped pages are line-oriented: section headings on their own line,
+FAQ questions ("...?") followed by their answer, bullet lists, and tables
+flattened to tab-separated rows. Cutting every CHUNK_SIZE characters splits
+question/answer pairs and table rows across chunks, so the text is first
+parsed into units that should stay whole:
+
+    heading  a short line without end punctuation that opens a block; it is
+             glued to the unit after it (never left at the end of a chunk)
+    qa       a question line and its answer, up to the next question or heading
+    list     consecutive bullet / numbered lines
+    table    consecutive tab-separated rows
+    para     any other run of lines
+
+A line ending in ":" right before a list or table is glued to it as well.
+Units are packed greedily into chunks of at most `chunk_size` characters; a
+heading or a question starts a new chunk once the current one holds
+CHUNK_MIN_CHARS, so sections and FAQ entries are not mixed. Only a unit that
+is longer than `chunk_size` on its own is split: between its lines first,
+then at sentence ends, and as a last resort into fixed windows with
+`overlap`.
+
+Every chunk is an exact slice of normalize_source(text), yielded as
+(start, end, text[start:end]), so spans stay valid for merge_overlapping
+(rag/rerank.py). CHUNKER=fixed restores the fixed-size character windows.
+"""
+from __future__ import annotations
+
+import os
+import re
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+# ---- Config (override via env vars) ----
+CHUNKER = os.getenv("CHUNKER", "structure")  # structure | fixed
+CHUNK_MIN_CHARS = int(os.getenv("CHUNK_MIN_CHARS", "250"))  # a section starts a new chunk past this
+HEADING_MAX_CHARS = 60
+QUESTION_MAX_CHARS = 300
+
+_ITEM_RE = re.compile(r"(?:[-*•·▪◦–]|\d{1,2}[.)]|\([a-z0-9]{1,2}\))\s")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+Span = Tuple[int, int]
+
+
+def normalize_source(text: str) -> str:
+    """Chunk spans are char offsets into this normalized form of a source file."""
+    return text.replace("\r\n", "\n").strip()
+
+
+class _Line(NamedTuple):
+    start: int  # first non-space char
+    end: int  # after the last non-space char
+    kind: str  # blank | heading | question | row | item | text
+
+
+class Unit(NamedTuple):
+    kind: str  # qa | list | table | para
+    start: int
+    end: int
+    section: bool  # opens a section (heading or question): preferred chunk start
+    pieces: Tuple[Span, ...]  # lines, the places an oversize unit may be split
+
+
+def _lines(text: str) -> List[_Line]:
+    raw: List[Tuple[int, int, str]] = []
+    pos = 0
+    for line in text.split("\n"):
+        body = line.strip()
+        start = pos + (len(line) - len(line.lstrip()))
+        raw.append((start, start + len(body), body))
+        pos += len(line) + 1
+
+    lines: List[_Line] = []
+    for i, (start, end, body) in enumerate(raw):
+        if not body:
+            kind = "blank"
+        elif "\t" in body:
+            kind = "row"
+        elif _ITEM_RE.match(body):
+            kind = "item"
+        elif body.endswith("?") and len(body) <= QUESTION_MAX_CHARS:
+            kind = "question"
+        elif (
+            len(body) <= HEADING_MAX_CHARS
+            and body[-1] not in ".!?:;,"
+            and (i == 0 or lines[-1].kind in ("blank", "heading"))
+            and i + 1 < len(raw) and raw[i + 1][2]  # content follows directly
+        ):
+            kind = "heading"
+        else:
+            kind = "text"
+        lines.append(_Line(start, end, kind))
+    return lines
+
+
+def _next_content(lines: List[_Line], j: int) -> Optional[int]:
+    while j < len(lines) and lines[j].kind == "blank":
+        j += 1
+    return j if j < len(lines) else None
+
+
+def _unit_end(lines: List[_Line], i: int) -> int:
+    """Index after the last line of the unit starting at line i."""
+    kind = lines[i].kind
+    j = i + 1
+    if kind == "question":
+        # the answer may run over several paragraphs, lists or rows
+        while j < len(lines) and lines[j].kind not in ("question", "heading"):
+            j += 1
+    elif kind in ("row", "item"):
+        while j < len(lines):
+            if lines[j].kind == kind:
+                j += 1
+                continue
+            k = _next_content(lines, j)
+            if lines[j].kind == "blank" and k is not None and lines[k].kind == kind:
+                j = k  # items separated by blank lines are still one list
+                continue
+            break
+    else:
+        while j < len(lines) and lines[j].kind == "text":
+            j += 1
+    return j
+
+
+_UNIT_KIND = {"question": "qa", "row": "table", "item": "list"}
+
+
+def units(text: str) -> List[Unit]:
+    """The structural units of a normalized source, in order."""
+    lines = _lines(text)
+    out: List[Unit] = []
+    glue: List[Span] = []  # headings / a lead-in waiting for their unit
+    section = False
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.kind == "blank":
+            i += 1
+            continue
+        if line.kind == "heading":
+            glue.append((line.start, line.end))
+            section = True
+            i += 1
+            continue
+
+        j = _unit_end(lines, i)
+        body = [(ln.start, ln.end) for ln in lines[i:j] if ln.kind != "blank"]
+        kind = _UNIT_KIND.get(line.kind, "para")
+        nxt = _next_content(lines, j)
+        if kind == "para" and text[body[-1][1] - 1] == ":" and nxt is not None and lines[nxt].kind in ("row", "item"):
+            glue.extend(body)  # "... as follows:" belongs to the list after it
+            i = j
+            continue
+        if glue:
+            body = glue + body
+        out.append(Unit(kind, body[0][0], body[-1][1], section or kind == "qa", tuple(body)))
+        glue, section, i = [], False, j
+    if glue:  # headings at the very end
+        out.append(Unit("para", glue[0][0], glue[-1][1], True, tuple(glue)))
+    return out
+
+
+def fixed_spans(text: str, chunk_size: int, overlap: int) -> Iterator[Tuple[int, int, str]]:
+    """Fixed character windows with overlap over normalize_source(text) (CHUNKER=fixed)."""
+    text = normalize_source(text)
+    if overlap >= chunk_size:
+        raise ValueError("CHUNK_OVERLAP must be < CHUNK_SIZE")
+    n = len(text)
+    start = 0
+    while start < n:
+        end = min(n, start + chunk_size)
+        raw = text[start:end]
+        c = raw.strip()
+        if c:
+            lead = len(raw) - len(raw.lstrip())
+            yield start + lead, start + lead + len(c), c
+
+        # ✅ critical: if we reached the end, stop (prevents infinite tail repeats)
+        if end >= n:
+            break
+        start = end - overlap
+
+
+def _split(text: str, span: Span, chunk_size: int, overlap: int) -> Iterator[Span]:
+    """A line longer than chunk_size: sentences, then fixed windows."""
+    a, b = span
+    if b - a <= chunk_size:
+        yield span
+        return
+    start = a
+    cuts = [(m.start(), m.end()) for m in _SENTENCE_END_RE.finditer(text, a, b)]
+    for end, nxt in cuts + [(b, b)]:
+        if end - start <= chunk_size:
+            yield start, end
+        else:
+            for s, e, _ in fixed_spans(text[start:end], chunk_size, overlap):
+                yield start + s, start + e
+        start = nxt
+
+
+def _pack(text: str, us: List[Unit], chunk_size: int, overlap: int) -> Iterator[Span]:
+    cur: Optional[List[int]] = None
+    for u in us:
+        if cur is not None and u.section and cur[1] - cur[0] >= CHUNK_MIN_CHARS:
+            yield cur[0], cur[1]
+            cur = None
+        if cur is not None and u.end - cur[0] <= chunk_size:
+            cur[1] = u.end
+            continue
+        if cur is not None:
+            yield cur[0], cur[1]
+            cur = None
+        if u.end - u.start <= chunk_size:
+            cur = [u.start, u.end]
+            continue
+        # oversize unit: refill chunks from its lines (and sentences)
+        for piece in u.pieces:
+            for a, b in _split(text, piece, chunk_size, overlap):
+                if cur is not None and b - cur[0] <= chunk_size:
+                    cur[1] = b
+                    continue
+                if cur is not None:
+                    yield cur[0], cur[1]
+                cur = [a, b]
+    if cur is not None:
+        yield cur[0], cur[1]
+
+
+def structure_spans(text: str, chunk_size: int, overlap: int) -> Iterator[Tuple[int, int, str]]:
+    """Whole units packed into chunks of at most chunk_size (see the module docstring)."""
+    if overlap >= chunk_size:
+        raise ValueError("CHUNK_OVERLAP must be < CHUNK_SIZE")
+    text = normalize_source(text)
+    for a, b in _pack(text, units(text), chunk_size, overlap):
+        yield a, b, text[a:b]
+
+
+def chunk_spans(text: str, chunk_size: int, overlap: int) -> Iterator[Tuple[int, int, str]]:
+    """Yield (start, end, chunk) spans into normalize_source(text), using CHUNKER."""
+    if CHUNKER == "fixed":
+        return fixed_spans(text, chunk_size, overlap)
+    return structure_spans(text, chunk_size, overlap)
@@ -0,0 +1,294 @@
+# rag/chunkstore.py
+"""
+Compact, memory-mapped chunk store (replaces docs.pkl).
+
+File layout (little-endian):
+
+    magic      8 bytes   b"EDICHNK1"
+    hdr_len    uint64    length of the JSON header
+    header     JSON      {"version", "count", "sources", ...}, padded to 8 bytes
+    offsets    uint64[count + 1]   byte offsets of each chunk in the blob
+    source_id  uint32[count]       index into header["sources"]
+    chunk_no   uint32[count]       1-based chunk number within its source
+    span       int64[count, 2]     [start, end) char span in the source (-1 = unknown)
+    ids        int64[count]        (version 2 only) FAISS id of each chunk
+    blob       UTF-8 text of all chunks, back to back
+
+Version 1 stores are row-addressed: FAISS id i is chunk i. Version 2 stores
+carry explicit ids (content hashes, see chunk_id) for IndexIDMap indexes
+that are updated incrementally.
+
+The reader np.memmap()s the file, so every uvicorn worker shares the same
+page-cache pages, opening is O(1), and fetching chunk i is a slice + decode.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pickle
+import re
+import shutil
+import struct
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"EDICHNK1"
+VERSION = 2
+
+# Builders prefix each chunk with "[<file> | chunk <n>]\n"
+_PREFIX_RE = re.compile(r"^\[(?P<source>[^|\]]+?) \| chunk (?P<n>\d+)\]\n")
+
+
+def _pad8(n: int) -> int:
+    return (8 - n % 8) % 8
+
+
+def chunk_id(model: str, text: str) -> int:
+    """Stable FAISS id for a chunk: 63-bit hash of (embedding model, exact chunk text)."""
+    h = hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()
+    return int.from_bytes(h[:8], "little") & 0x7FFF_FFFF_FFFF_FFFF
+
+
+class ChunkStoreWriter:
+    """
+    Append chunks one at a time; text goes straight to a temp blob file, so
+    only the small per-chunk arrays are held in memory. close() writes the
+    final file atomically (tmp + rename).
+    """
+
+    def __init__(self, path: Path, extra_header: Optional[Dict[str, Any]] = None) -> None:
+        self.path = Path(path)
+        self.extra_header = dict(extra_header or {})
+        self._blob = tempfile.NamedTemporaryFile(
+            dir=str(self.path.parent), prefix=".chunks-blob-", delete=False
+        )
+        self._offsets: List[int] = [0]
+        self._source_ids: List[int] = []
+        self._chunk_nos: List[int] = []
+        self._spans: List[Tuple[int, int]] = []
+        self._ids: List[int] = []
+        self._sources: List[str] = []
+        self._source_idx: Dict[str, int] = {}
+
+    def add(self, text: str, source: str = "", chunk_no: int = 0, span: Tuple[int, int] = (-1, -1),
+            cid: Optional[int] = None) -> int:
+        data = text.encode("utf-8")
+        self._blob.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+
+        sid = self._source_idx.get(source)
+        if sid is None:
+            sid = self._source_idx[source] = len(self._sources)
+            self._sources.append(source)
+        self._source_ids.append(sid)
+        self._chunk_nos.append(chunk_no)
+        self._spans.append((int(span[0]), int(span[1])))
+        if cid is not None:
+            self._ids.append(int(cid))
+        return len(self._source_ids) - 1
+
+    def __len__(self) -> int:
+        return len(self._source_ids)
+
+    def close(self) -> Path:
+        self._blob.close()
+        n = len(self._source_ids)
+        if self._ids and len(self._ids) != n:
+            raise ValueError("Either every chunk or no chunk must be given an id")
+        version = 2 if self._ids else 1
+        header = dict(self.extra_header, version=version, count=n, sources=self._sources)
+        hdr = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        hdr += b" " * _pad8(len(hdr))
+
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with open(tmp, "wb") as f:
+                f.write(MAGIC)
+                f.write(struct.pack("<Q", len(hdr)))
+                f.write(hdr)
+                f.write(np.asarray(self._offsets, dtype="<u8").tobytes())
+                f.write(np.asarray(self._source_ids, dtype="<u4").tobytes())
+                f.write(np.asarray(self._chunk_nos, dtype="<u4").tobytes())
+                if n % 2:
+                    f.write(b"\0" * 4)  # keep span array 8-byte aligned
+                f.write(np.asarray(self._spans, dtype="<i8").reshape(n, 2).tobytes())
+                if self._ids:
+                    f.write(np.asarray(self._ids, dtype="<i8").tobytes())
+                with open(self._blob.name, "rb") as blob:
+                    shutil.copyfileobj(blob, f, 1 << 20)
+            os.replace(tmp, self.path)
+        finally:
+            os.unlink(self._blob.name)
+        return self.path
+
+    def __enter__(self) -> "ChunkStoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._blob.close()
+            os.unlink(self._blob.name)
+
+
+class ChunkStore:
+    """Read-only, memory-mapped view over a chunk store file."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._mm = np.memmap(str(self.path), dtype="u1", mode="r")
+        if bytes(self._mm[:8]) != MAGIC:
+            raise ValueError(f"Not a chunk store: {self.path}")
+        (hdr_len,) = struct.unpack("<Q", bytes(self._mm[8:16]))
+        self.header: Dict[str, Any] = json.loads(bytes(self._mm[16:16 + hdr_len]).decode("utf-8"))
+        n = int(self.header["count"])
+        self.sources: List[str] = list(self.header["sources"])
+
+        pos = 16 + hdr_len
+        self.offsets = np.frombuffer(self._mm, dtype="<u8", count=n + 1, offset=pos)
+        pos += 8 * (n + 1)
+        self.source_ids = np.frombuffer(self._mm, dtype="<u4", count=n, offset=pos)
+        pos += 4 * n
+        self.chunk_nos = np.frombuffer(self._mm, dtype="<u4", count=n, offset=pos)
+        pos += 4 * n + (4 if n % 2 else 0)
+        self.spans = np.frombuffer(self._mm, dtype="<i8", count=2 * n, offset=pos).reshape(n, 2)
+        pos += 16 * n
+        self.ids: Optional[np.ndarray] = None
+        if int(self.header.get("version", 1)) >= 2:
+            self.ids = np.frombuffer(self._mm, dtype="<i8", count=n, offset=pos)
+            pos += 8 * n
+            # label -> row lookup without a per-chunk Python dict
+            self._order = np.argsort(self.ids, kind="stable")
+            self._sorted_ids = self.ids[self._order]
+        self._blob_start = pos
+        self._n = n
+
+    def __len__(self) -> int:
+        return self._n
+
+    def row(self, label: int) -> int:
+        """Chunk row for a FAISS id (identity for version 1 stores)."""
+        if self.ids is None:
+            return label
+        pos = int(np.searchsorted(self._sorted_ids, label))
+        if pos >= self._n or int(self._sorted_ids[pos]) != label:
+            raise KeyError(label)
+        return int(self._order[pos])
+
+    def label(self, i: int) -> int:
+        """FAISS id of chunk row i (inverse of row())."""
+        return i if self.ids is None else int(self.ids[i])
+
+    def text(self, i: int) -> str:
+        a, b = int(self.offsets[i]), int(self.offsets[i + 1])
+        return bytes(self._mm[self._blob_start + a:self._blob_start + b]).decode("utf-8")
+
+    def meta(self, i: int) -> Dict[str, Any]:
+        start, end = (int(x) for x in self.spans[i])
+        return {
+            "source": self.sources[int(self.source_ids[i])],
+            "chunk": int(self.chunk_nos[i]),
+            "span": (start, end),
+        }
+
+
+class LegacyPickleStore:
+    """Same interface as ChunkStore over a legacy docs.pkl (list of str or dict)."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._docs: List[Any] = pickle.load(f)
+        self.header: Dict[str, Any] = {"version": 0, "count": len(self._docs)}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def row(self, label: int) -> int:
+        return label
+
+    def label(self, i: int) -> int:
+        return i
+
+    def text(self, i: int) -> str:
+        return _to_text(self._docs[i])
+
+    def meta(self, i: int) -> Dict[str, Any]:
+        return _parse_prefix(self.text(i))
+
+
+def _to_text(doc: Any) -> str:
+    # supports either str docs OR dict docs from older pipelines
+    if isinstance(doc, str):
+        return doc
+    if isinstance(doc, dict):
+        for k in ("text", "content", "chunk", "page_content"):
+            v = doc.get(k)
+            if isinstance(v, str):
+                return v
+        return str(doc)
+    return str(doc)
+
+
+def strip_prefix(text: str) -> str:
+    """Chunk text without the builders' "[<file> | chunk <n>]" line."""
+    return _PREFIX_RE.sub("", text, count=1)
+
+
+def _parse_prefix(text: str) -> Dict[str, Any]:
+    m = _PREFIX_RE.match(text)
+    if not m:
+        return {"source": "", "chunk": 0, "span": (-1, -1)}
+    return {"source": m.group("source"), "chunk": int(m.group("n")), "span": (-1, -1)}
+
+
+def open_store(chunks_path: Path, legacy_docs_path: Path):
+    """Prefer the chunk store; fall back to a legacy docs.pkl."""
+    if chunks_path.exists():
+        return ChunkStore(chunks_path)
+    if legacy_docs_path.exists():
+        return LegacyPickleStore(legacy_docs_path)
+    raise FileNotFoundError(f"Chunk store not found: {chunks_path} (nor legacy {legacy_docs_path})")
+
+
+def convert_pickle(docs_path: Path, chunks_path: Path, data_dir: Optional[Path] = None) -> Path:
+    """
+    One-off migration: docs.pkl -> chunk store. If data_dir is given, char
+    spans are recovered by locating each chunk in its (normalized) source
+    file; otherwise they are stored as unknown.
+    """
+    legacy = LegacyPickleStore(docs_path)
+    sources: Dict[str, str] = {}
+    if data_dir is not None:
+        for fp in sorted(Path(data_dir).rglob("*.txt")):
+            sources[fp.name] = fp.read_text(encoding="utf-8", errors="ignore").replace("\r\n", "\n").strip()
+
+    cursor: Dict[str, int] = {}
+    with ChunkStoreWriter(chunks_path) as w:
+        for i in range(len(legacy)):
+            text = legacy.text(i)
+            m = legacy.meta(i)
+            src = sources.get(m["source"])
+            if src is not None:
+                body = strip_prefix(text)
+                start = src.find(body, cursor.get(m["source"], 0))
+                if start >= 0:
+                    m["span"] = (start, start + len(body))
+                    cursor[m["source"]] = start + 1
+            w.add(text, m["source"], m["chunk"], m["span"])
+    return chunks_path
+
+
+if __name__ == "__main__":
+    # python -m rag.chunkstore docs.pkl chunks.bin [data_dir]
+    if len(sys.argv) not in (3, 4):
+        raise SystemExit("usage: python -m rag.chunkstore <docs.pkl> <chunks.bin> [data_dir]")
+    data_dir = Path(sys.argv[3]) if len(sys.argv) == 4 else None
+    out = convert_pickle(Path(sys.argv[1]), Path(sys.argv[2]), data_dir)
+    print("Wrote:", out, f"({len(ChunkStore(out))} chunks)")
@@ -0,0 +1,42 @@
+# rag/clients.py
+from __future__ import annotations
+
+import os
+
+import httpx
+from openai import AsyncOpenAI
+
+# ---- Config (override via env vars) ----
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))  # seconds
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+
+_async_client: AsyncOpenAI | None = None
+
+
+def get_async_client() -> AsyncOpenAI:
+    """
+    Shared AsyncOpenAI client for the request path (embeddings + chat).
+    One bounded httpx pool per process, so concurrent /ask calls reuse
+    keep-alive connections instead of opening one each.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(
+            timeout=OPENAI_TIMEOUT,
+            http_client=httpx.AsyncClient(
+                timeout=OPENAI_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                ),
+            ),
+        )
+    return _async_client
+
+
+async def aclose_async_client() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
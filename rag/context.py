@@ -0,0 +1,132 @@
+# rag/context.py
+"""
+Token-budgeted context packing for the LLM prompt.
+
+Chunks arrive in relevance order; pack_context() keeps whole chunks while
+they fit in CONTEXT_TOKEN_BUDGET, cuts the first one that does not fit at a
+sentence boundary, and drops the rest. Packing is idempotent: re-packing a
+packed list returns it unchanged.
+
+Tokens are counted with tiktoken when it (and its encoding file) is
+available, otherwise estimated at ~4 characters per token.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("uvicorn.error")
+
+# ---- Config (override via env vars) ----
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))  # 0 = unlimited
+# A partially fitting chunk is only kept if at least this many tokens of it fit
+CONTEXT_MIN_PARTIAL_TOKENS = int(os.getenv("CONTEXT_MIN_PARTIAL_TOKENS", "50"))
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")  # gpt-4o family
+
+SEPARATOR = "\n\n"
+
+# split after sentence punctuation or at line breaks, keeping the delimiter
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|(?<=\n)")
+
+_encode: Optional[Callable[[str], List[int]]] = None
+_tokenizer_name = ""
+_tokenizer_lock = threading.Lock()
+
+
+def _load_tokenizer() -> None:
+    global _encode, _tokenizer_name
+    with _tokenizer_lock:
+        if _tokenizer_name:
+            return
+        try:
+            import tiktoken
+
+            # may download the encoding file on first use; warm-up calls this at startup
+            enc = tiktoken.get_encoding(TOKENIZER_ENCODING)
+            _encode = enc.encode_ordinary
+            _tokenizer_name = f"tiktoken:{TOKENIZER_ENCODING}"
+        except Exception as e:
+            logger.warning("tiktoken unavailable (%s); estimating tokens as chars/4", e)
+            _encode = None
+            _tokenizer_name = "estimate:chars/4"
+
+
+def tokenizer_name() -> str:
+    _load_tokenizer()
+    return _tokenizer_name
+
+
+def count_tokens(text: str) -> int:
+    _load_tokenizer()
+    if not text:
+        return 0
+    if _encode is not None:
+        return len(_encode(text))
+    return math.ceil(len(text) / 4)
+
+
+@dataclass
+class PackedContext:
+    chunks: List[Dict[str, Any]] = field(default_factory=list)
+    tokens: int = 0  # context tokens, separators included
+    budget: int = 0
+    truncated: int = 0  # chunks cut at a sentence boundary
+    dropped: int = 0  # chunks left out entirely
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "tokens": self.tokens,
+            "budget": self.budget,
+            "chunks": len(self.chunks),
+            "truncated": self.truncated,
+            "dropped": self.dropped,
+            "tokenizer": tokenizer_name(),
+        }
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of whole sentences (or lines) within max_tokens; "" if none fits."""
+    cuts = [m.start() for m in _SENTENCE_RE.finditer(text) if m.start() > 0]
+    # token count grows with the prefix, so binary-search the last cut that fits
+    lo, hi, best = 0, len(cuts) - 1, ""
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        prefix = text[:cuts[mid]].rstrip()
+        if count_tokens(prefix) <= max_tokens:
+            best, lo = prefix, mid + 1
+        else:
+            hi = mid - 1
+    return best
+
+
+def pack_context(chunks: List[Dict[str, Any]], text_of: Callable[[Dict[str, Any]], str],
+                 budget: int = CONTEXT_TOKEN_BUDGET) -> PackedContext:
+    """Fill `budget` tokens with chunks in the given (relevance) order."""
+    packed = PackedContext(budget=budget)
+    sep = count_tokens(SEPARATOR)
+    for i, c in enumerate(chunks):
+        text = (text_of(c) or "").strip()
+        if not text:
+            continue
+        cost = count_tokens(text) + (sep if packed.chunks else 0)
+        if not budget or packed.tokens + cost <= budget:
+            packed.chunks.append(c)
+            packed.tokens += cost
+            packed.truncated += bool(c.get("truncated"))  # cut by an earlier packing
+            continue
+
+        sep_cost = sep if packed.chunks else 0
+        room = budget - packed.tokens - sep_cost
+        cut = truncate_to_tokens(text, room) if room >= CONTEXT_MIN_PARTIAL_TOKENS else ""
+        if cut:
+            packed.chunks.append(dict(c, text=cut, truncated=True))
+            packed.tokens += count_tokens(cut) + sep_cost
+            packed.truncated += 1
+        packed.dropped = len(chunks) - i - bool(cut)
+        break
+    return packed
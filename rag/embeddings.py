@@ -0,0 +1,232 @@
+# rag/embeddings.py
+"""
+Pluggable embedding backends, shared by the retriever and both builders.
+
+Every backend turns a list of texts into L2-normalized float32 vectors
+(cosine = inner product, as the IndexFlatIP / ANN indexes expect):
+
+    openai  OpenAI embeddings API (EMBED_MODEL, e.g. text-embedding-3-small)
+    onnx    a local sentence-transformers model (all-MiniLM-L6-v2) exported
+            to ONNX and int8-quantized by rag/export_onnx.py; runs on
+            onnxruntime + tokenizers, no torch. A query takes a few ms on
+            one core and costs no API call.
+
+EMBED_BACKEND picks the backend; unset, MiniLM models go to onnx and
+everything else to openai. The index manifest and the chunk store record
+the backend that built them, and the retriever refuses a hot reload whose
+backend differs from the one answering queries. Other backends register
+themselves in BACKENDS.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import faiss
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# ---- Config (override via env vars) ----
+EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")  # 1536 dims by default
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "")  # openai | onnx; "" = by model name
+# Local ONNX backend
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "")  # "" = models/<model>-int8
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "1"))  # intra-op threads per query
+ONNX_MAX_TOKENS = int(os.getenv("ONNX_MAX_TOKENS", "256"))  # MiniLM was trained on 256
+
+# known output sizes, so a mismatched index is caught before the first query
+_DIMS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+    "all-MiniLM-L6-v2": 384,
+}
+
+
+class Embeddings(NamedTuple):
+    vectors: np.ndarray  # (n, dim) float32, L2-normalized
+    prompt_tokens: int = 0  # billed tokens (0 for local backends)
+
+
+def _normalized(vecs: np.ndarray) -> np.ndarray:
+    vecs = np.ascontiguousarray(vecs, dtype="float32")
+    faiss.normalize_L2(vecs)
+    return vecs
+
+
+class EmbeddingBackend(ABC):
+    name = ""
+    remote = False  # calls an API (rate limits, retries and token costs apply)
+
+    def __init__(self, model: str) -> None:
+        self.model = model
+
+    @property
+    def key(self) -> str:
+        """Cache / chunk-id namespace: vectors of different keys never mix."""
+        return self.model
+
+    @property
+    def dim(self) -> Optional[int]:
+        return _DIMS.get(self.model.split("/")[-1])
+
+    def load(self) -> None:
+        """Load model weights / open connections ahead of the first query."""
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> Embeddings:
+        """Vectors for texts, in order (blocking)."""
+
+    @abstractmethod
+    async def aembed(self, texts: List[str]) -> Embeddings:
+        """Vectors for texts, in order, without blocking the event loop."""
+
+    def describe(self) -> Dict[str, Any]:
+        """Recorded in the index manifest."""
+        return {"backend": self.name, "model": self.model, "dim": self.dim}
+
+
+class OpenAIBackend(EmbeddingBackend):
+    name = "openai"
+    remote = True
+
+    def __init__(self, model: str, client: Any = None) -> None:
+        super().__init__(model)
+        self._client = client  # sync client; the async path uses rag.clients
+
+    def _result(self, resp: Any) -> Embeddings:
+        data = sorted(resp.data, key=lambda d: d.index)
+        usage = getattr(resp, "usage", None)
+        return Embeddings(
+            _normalized(np.array([d.embedding for d in data], dtype="float32")),
+            int(getattr(usage, "prompt_tokens", 0) or 0),
+        )
+
+    def embed(self, texts: List[str]) -> Embeddings:
+        if self._client is None:
+            from openai import OpenAI
+
+            self._client = OpenAI()
+        return self._result(self._client.embeddings.create(model=self.model, input=texts))
+
+    async def aembed(self, texts: List[str]) -> Embeddings:
+        from rag.clients import get_async_client
+
+        return self._result(await get_async_client().embeddings.create(model=self.model, input=texts))
+
+
+def onnx_model_dir(model: str) -> Path:
+    """Where rag/export_onnx.py writes (and the onnx backend reads) a model."""
+    return Path(ONNX_MODEL_DIR) if ONNX_MODEL_DIR else ROOT / "models" / f"{model.split('/')[-1]}-int8"
+
+
+class OnnxBackend(EmbeddingBackend):
+    """
+    Mean pooling over the attention mask, then L2 normalization, as
+    sentence-transformers does for all-MiniLM-L6-v2. The session is created
+    on first use (or by load()); onnxruntime releases the GIL while it runs.
+    """
+    name = "onnx"
+
+    def __init__(self, model: str, model_dir: Optional[Path] = None,
+                 threads: int = ONNX_THREADS, max_tokens: int = ONNX_MAX_TOKENS) -> None:
+        super().__init__(model)
+        self.model_dir = Path(model_dir) if model_dir else onnx_model_dir(model)
+        self.threads = threads
+        self.max_tokens = max_tokens
+        self._session: Any = None
+        self._tokenizer: Any = None
+        self._inputs: List[str] = []
+        self._lock = threading.Lock()
+
+    @property
+    def key(self) -> str:
+        return f"onnx:{self.model}"
+
+    def load(self) -> None:
+        if self._session is not None:
+            return
+        with self._lock:
+            if self._session is not None:
+                return
+            try:
+                import onnxruntime as ort
+                from tokenizers import Tokenizer
+            except ImportError as e:
+                raise RuntimeError("EMBED_BACKEND=onnx needs `pip install -r requirements-onnx.txt`") from e
+            model_path = self.model_dir / "model.onnx"
+            if not model_path.exists():
+                raise FileNotFoundError(f"ONNX model not found: {model_path} (run rag/export_onnx.py)")
+
+            tokenizer = Tokenizer.from_file(str(self.model_dir / "tokenizer.json"))
+            tokenizer.enable_truncation(max_length=self.max_tokens)
+            pad_id = tokenizer.token_to_id("[PAD]") or 0
+            tokenizer.enable_padding(pad_id=pad_id, pad_token="[PAD]")
+
+            opts = ort.SessionOptions()
+            opts.intra_op_num_threads = self.threads
+            opts.inter_op_num_threads = 1
+            opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            # queries are small; the arena would keep its peak allocation resident
+            opts.enable_cpu_mem_arena = False
+            session = ort.InferenceSession(str(model_path), opts, providers=["CPUExecutionProvider"])
+            self._inputs = [i.name for i in session.get_inputs()]
+            self._tokenizer = tokenizer
+            self._session = session
+
+    def embed(self, texts: List[str]) -> Embeddings:
+        self.load()
+        enc = self._tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in enc], dtype="int64")
+        mask = np.array([e.attention_mask for e in enc], dtype="int64")
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self._inputs:
+            feeds["token_type_ids"] = np.zeros_like(ids)
+        hidden = self._session.run(None, feeds)[0]  # (n, tokens, dim)
+        m = mask[..., None].astype("float32")
+        pooled = (hidden * m).sum(axis=1) / np.maximum(m.sum(axis=1), 1e-9)
+        return Embeddings(_normalized(pooled))
+
+    async def aembed(self, texts: List[str]) -> Embeddings:
+        # a few ms of CPU; off the event loop so other requests keep flowing
+        return await asyncio.to_thread(self.embed, texts)
+
+    def describe(self) -> Dict[str, Any]:
+        return dict(super().describe(), quantization="int8", max_tokens=self.max_tokens)
+
+
+BACKENDS: Dict[str, Callable[..., EmbeddingBackend]] = {
+    "openai": OpenAIBackend,
+    "onnx": OnnxBackend,
+}
+
+
+def backend_name(model: str = EMBED_MODEL) -> str:
+    return EMBED_BACKEND or ("onnx" if "minilm" in model.lower() else "openai")
+
+
+def make_backend(model: str = EMBED_MODEL, name: str = "", **kwargs: Any) -> EmbeddingBackend:
+    """A new backend for `model` (kwargs go to its constructor, e.g. client=)."""
+    name = name or backend_name(model)
+    if name not in BACKENDS:
+        raise ValueError(f"unknown EMBED_BACKEND {name!r} (one of {', '.join(BACKENDS)})")
+    return BACKENDS[name](model, **kwargs)
+
+
+_default: Optional[EmbeddingBackend] = None
+_default_lock = threading.Lock()
+
+
+def get_backend() -> EmbeddingBackend:
+    """The process-wide backend for EMBED_MODEL / EMBED_BACKEND."""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = make_backend()
+    return _default
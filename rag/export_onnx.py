@@ -0,0 +1,99 @@
+# rag/export_onnx.py
+"""
+One-off export of a sentence-transformers model to int8 ONNX for
+EMBED_BACKEND=onnx (rag/embeddings.py).
+
+Needs torch + transformers on the machine that exports, on top of
+requirements-onnx.txt (all the servers need):
+
+    pip install -r requirements-onnx.txt torch transformers
+    python rag/export_onnx.py [--model sentence-transformers/all-MiniLM-L6-v2] [--out models/all-MiniLM-L6-v2-int8]
+
+Writes <out>/model.onnx (dynamic int8 weights, ~23 MB instead of ~90 MB) and
+<out>/tokenizer.json, then checks the int8 embeddings against the fp32
+PyTorch model on questions from data/*.txt (cosine should stay > 0.98).
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from rag.chunking import normalize_source  # noqa: E402
+from rag.embeddings import ROOT, OnnxBackend, onnx_model_dir  # noqa: E402
+
+
+def sample_questions(data_dir: Path, limit: int = 200) -> List[str]:
+    lines = [
+        line.strip() for fp in sorted(data_dir.glob("*.txt"))
+        for line in normalize_source(fp.read_text(encoding="utf-8", errors="ignore")).splitlines()
+        if line.strip().endswith("?")
+    ]
+    return sorted(set(lines))[:limit] or ["What are the admission requirements?"]
+
+
+def export(model_name: str, out: Path) -> None:
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    out.mkdir(parents=True, exist_ok=True)
+    tokenizer.backend_tokenizer.save(str(out / "tokenizer.json"))
+
+    sample = tokenizer(["an example sentence"], return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    axes = {n: {0: "batch", 1: "tokens"} for n in names}
+    axes["last_hidden_state"] = {0: "batch", 1: "tokens"}
+    with tempfile.TemporaryDirectory() as tmp:
+        fp32 = Path(tmp) / "model.fp32.onnx"
+        with torch.no_grad():
+            torch.onnx.export(
+                model, tuple(sample[n] for n in names), str(fp32),
+                input_names=names, output_names=["last_hidden_state"],
+                dynamic_axes=axes, opset_version=14,
+            )
+        quantize_dynamic(str(fp32), str(out / "model.onnx"), weight_type=QuantType.QInt8)
+        print(f"fp32 {fp32.stat().st_size / 1e6:.1f} MB -> int8 {(out / 'model.onnx').stat().st_size / 1e6:.1f} MB")
+
+
+def check(model_name: str, out: Path, texts: List[str]) -> None:
+    """Cosine between the int8 ONNX vectors and the fp32 PyTorch ones."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    enc = tokenizer(texts, padding=True, truncation=True, max_length=256, return_tensors="pt")
+    with torch.no_grad():
+        hidden = model(**enc).last_hidden_state
+    mask = enc["attention_mask"].unsqueeze(-1).float()
+    ref = ((hidden * mask).sum(1) / mask.sum(1).clamp(min=1e-9)).numpy()
+    ref /= np.linalg.norm(ref, axis=1, keepdims=True)
+
+    got = OnnxBackend(model_name.split("/")[-1], out).embed(texts).vectors
+    cos = (ref * got).sum(axis=1)
+    print(f"int8 vs fp32 cosine over {len(texts)} questions: mean {cos.mean():.4f}, min {cos.min():.4f}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    ap.add_argument("--out", type=Path, default=None, help="default: ONNX_MODEL_DIR or models/<model>-int8")
+    ap.add_argument("--data", type=Path, default=ROOT / "data")
+    args = ap.parse_args()
+
+    out = args.out or onnx_model_dir(args.model)
+    export(args.model, out)
+    check(args.model, out, sample_questions(args.data))
+    print(f"Wrote {out}; serve with EMBED_MODEL={args.model.split('/')[-1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+# rag/faq.py
+"""
+Official FAQ answers without the LLM.
+
+At build time rag/build_index_openai.py extracts the question -> answer
+pairs of the FAQ pages (FAQ_SOURCES; the "qa" units of rag/chunking.py) and
+embeds the questions into a small dedicated index, faq.index, next to the
+chunk index. Its manifest (faq.index.json) records the embedding backend
+and holds the entries themselves.
+
+At query time the router compares the query embedding it already has with
+the FAQ questions. When the best match scores >= FAQ_THRESHOLD (cosine)
+and beats the next different question by FAQ_MARGIN, /ask returns that
+entry's official answer as is: no chunk packing, no completion call.
+Entries only match queries routed to the shard of their source.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import threading
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from rag.ann import read_manifest
+from rag.chunking import units
+from rag.embeddings import EMBED_MODEL, get_backend
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# ---- Config (override via env vars) ----
+FAQ_SOURCES = tuple(p.strip() for p in os.getenv(
+    "FAQ_SOURCES", "cde.nus.edu.sg_edic_msc_msc-faq_.txt").split(",") if p.strip())  # "" = no FAQ index
+FAQ_PATH = Path(os.getenv("FAQ_PATH", str(ROOT / "faq.index")))
+FAQ_ANSWERS = os.getenv("FAQ_ANSWERS", "1") == "1"  # 0 = never answer from the FAQ
+FAQ_THRESHOLD = float(os.getenv("FAQ_THRESHOLD", "0.85"))  # cosine, query vs FAQ question
+FAQ_MARGIN = float(os.getenv("FAQ_MARGIN", "0.02"))  # over the runner-up question
+
+# Answers that send the reader to a link the text export dropped ("... are
+# listed on this page."): not answers on their own, so those questions go
+# through retrieval instead.
+_POINTER_RE = re.compile(r"\bthis\s+(?:web\s*)?page\b", re.IGNORECASE)
+
+
+class FaqEntry(NamedTuple):
+    question: str
+    answer: str
+    source: str
+    shard: str  # "" = unsharded
+    span: Tuple[int, int]  # answer, into normalize_source(source text)
+
+
+class FaqIndex(NamedTuple):
+    index: faiss.Index
+    entries: List[FaqEntry]
+    version: str
+
+
+def is_faq_source(filename: str) -> bool:
+    return any(fnmatch(filename, p) for p in FAQ_SOURCES)
+
+
+def extract_faq(text: str, source: str, shard: str = "") -> List[FaqEntry]:
+    """
+    Question -> answer pairs of a normalized source. Questions without an
+    answer, or whose answer points to a page that is not there, are skipped.
+    """
+    entries = []
+    for u in units(text):
+        if u.kind != "qa":
+            continue
+        # headings glued in front of the question are not part of it
+        at = next(i for i, (a, b) in enumerate(u.pieces) if text[b - 1] == "?")
+        rest = u.pieces[at + 1:]
+        if not rest:
+            continue
+        a, b = u.pieces[at]
+        answer = "\n".join(line.rstrip() for line in text[rest[0][0]:u.end].split("\n"))
+        if _POINTER_RE.search(answer):
+            continue
+        entries.append(FaqEntry(text[a:b], answer, source, shard, (rest[0][0], u.end)))
+    return entries
+
+
+_faq: Optional[FaqIndex] = None
+_loaded = False  # a missing faq.index is a valid state (no FAQ answers)
+_lock = threading.Lock()
+_counts: Dict[str, int] = {"hits": 0, "misses": 0, "ambiguous": 0, "reloads": 0}
+
+
+def _manifest_path() -> Path:
+    return FAQ_PATH.with_name(FAQ_PATH.name + ".json")
+
+
+def disk_version() -> str:
+    """Fingerprint of faq.index + its manifest on disk ("" when there is none)."""
+    paths = (FAQ_PATH, _manifest_path())
+    if not all(p.exists() for p in paths):
+        return ""
+    h = hashlib.sha1()
+    for p in paths:
+        st = p.stat()
+        h.update(f"{p.name}:{st.st_size}:{st.st_mtime_ns};".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def _open() -> Optional[FaqIndex]:
+    """Load and check faq.index; None when it does not exist. Raises ValueError on a mismatch."""
+    version = disk_version()
+    if not version:
+        return None
+    manifest = read_manifest(FAQ_PATH)
+    index = faiss.read_index(str(FAQ_PATH))
+    entries = [FaqEntry(e["question"], e["answer"], e["source"], e.get("shard", ""), tuple(e["span"]))
+               for e in manifest.get("entries", [])]
+    backend = get_backend()
+    problems = []
+    if int(index.ntotal) != len(entries):
+        problems.append(f"{index.ntotal} vectors but {len(entries)} entries")
+    if manifest.get("embed_model") != EMBED_MODEL or manifest.get("embed_backend") != backend.name:
+        problems.append(f"built with {manifest.get('embed_model')} ({manifest.get('embed_backend')}), "
+                        f"queries use {EMBED_MODEL} ({backend.name})")
+    if backend.dim and int(index.d) != backend.dim:
+        problems.append(f"dim {index.d} != {backend.name} embedding dim {backend.dim}")
+    if problems:
+        raise ValueError(f"{FAQ_PATH}: " + "; ".join(problems))
+    if disk_version() != version:
+        raise RuntimeError(f"{FAQ_PATH} changed while loading")
+    return FaqIndex(index, entries, version)
+
+
+def load_faq() -> Optional[FaqIndex]:
+    """The serving FAQ index (loaded on first use). A bad one is logged and left out."""
+    global _faq, _loaded
+    if not _loaded:
+        with _lock:
+            if not _loaded:
+                try:
+                    _faq = _open()
+                except (OSError, ValueError, RuntimeError) as e:
+                    logger.warning("FAQ answers disabled: %s", e)
+                _loaded = True
+    return _faq
+
+
+def faq_version() -> str:
+    faq = load_faq()
+    return faq.version if faq is not None else ""
+
+
+def reload_faq(force: bool = False) -> Dict[str, Any]:
+    """
+    Swap in a rebuilt faq.index (or drop a deleted one). On error the
+    serving index is kept and the error raised; no-op when nothing changed.
+    """
+    global _faq, _loaded
+    with _lock:
+        old = _faq.version if _faq is not None else ""
+        if _loaded and not force and disk_version() == old:
+            return {"reloaded": False, "version": old}
+        new = _open()
+        _faq, _loaded = new, True
+        _counts["reloads"] += 1
+    logger.info("Reloaded FAQ index %s -> %s (%d entries)", old or "-", new.version if new else "-",
+                len(new.entries) if new else 0)
+    return {"reloaded": True, "version": new.version if new else "", "entries": len(new.entries) if new else 0}
+
+
+def match_faq(vec: np.ndarray, shards: Sequence[str] = ("",)) -> Optional[Tuple[FaqEntry, float]]:
+    """The FAQ entry a query vector confidently asks for, with its score (None = no such entry)."""
+    faq = load_faq() if FAQ_ANSWERS else None
+    if faq is None or not faq.entries:
+        return None
+    # with a shard filter the best matches may all be other shards' entries;
+    # the index is small (one vector per FAQ question), so rank all of them
+    k = min(8, len(faq.entries)) if shards == ("",) else len(faq.entries)
+    scores, ids = faq.index.search(vec.reshape(1, -1).astype("float32"), k)
+    found: List[Tuple[FaqEntry, float]] = []
+    for score, i in zip(scores[0], ids[0]):
+        if i < 0:
+            break
+        entry = faq.entries[int(i)]
+        if entry.shard in shards or shards == ("",):
+            found.append((entry, float(score)))
+    if not found or found[0][1] < FAQ_THRESHOLD:
+        _counts["misses"] += 1
+        return None
+    best, score = found[0]
+    # two FAQ questions this close to the query: let the LLM read both
+    runner_up = next((s for e, s in found[1:] if e.answer != best.answer), None)
+    if runner_up is not None and score - runner_up < FAQ_MARGIN:
+        _counts["ambiguous"] += 1
+        _counts["misses"] += 1
+        return None
+    _counts["hits"] += 1
+    return best, score
+
+
+def faq_stats() -> Dict[str, Any]:
+    faq = _faq
+    return dict(
+        _counts,
+        enabled=FAQ_ANSWERS and faq is not None,
+        entries=len(faq.entries) if faq is not None else 0,
+        version=faq.version if faq is not None else "",
+        threshold=FAQ_THRESHOLD,
+        margin=FAQ_MARGIN,
+    )
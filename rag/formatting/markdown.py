@@ -1,5 +1,6 @@
 # rag/formatting/markdown.py
 import re
+from typing import List, Optional
 
 # Structural detectors
 _HEADING_RE = re.compile(r"^(#{1,6})\s+(.+)$")
@@ -24,243 +25,439 @@ def format_markdown_safe(text: str) -> str:
     - Ensures one blank line after headings and around list blocks
     - Preserves code fences exactly
     """
-      
     if not isinstance(text, str) or not text.strip():
         return text
 
-    t = _normalize_newlines(text)
-    t = _strip_trailing_spaces(t)
+    fmt = _LineFormatter()
+    return fmt.feed(text) + fmt.close()
 
-    t = _rejoin_split_headings(t)
-    t = _split_inline_h3_headings(t)
-    t = _reflow_paragraphs_preserve_blocks(t)
 
-    # Join accidental blank-line breaks in the middle of a sentence/paragraph
-    t = re.sub(r"\n\n(?=[a-z0-9])", " ", t)
-    # blank line before lowercase continuation
-    t = re.sub(r"\b(in|to|of|be|is|are|was|were)\n\n(?=\w)", r"\1 ", t, flags=re.IGNORECASE)
+# Characters that re-join a paragraph across a blank line (were: "\n\n(?=[a-z0-9])")
+_LOWER_OR_DIGIT = frozenset("abcdefghijklmnopqrstuvwxyz0123456789")
+_WORD_START_RE = re.compile(r"\w")
+_JOIN_WORD_END_RE = re.compile(r"\b(in|to|of|be|is|are|was|were)$", re.IGNORECASE)
+# "N units" fragment between blank lines; only reachable with non-ASCII digits,
+# since ASCII digits after a blank line are already re-joined (see _LineFormatter)
+_NUMBER_FRAGMENT_RE = re.compile(r"\n\n(\d+(?:\s+and\s+\d+)?\s+[A-Za-z]+[A-Za-z\s]*[,.;:]?)\n\n")
 
-    # ADD THE re.sub FIX HERE
-    t = re.sub(
-    r"\n\n(\d+(?:\s+and\s+\d+)?\s+[A-Za-z]+[A-Za-z\s]*[,.;:]?)\n\n",
-    r" \1 ",
-    t
-    )
 
-    t = _tighten_bullets(t)
-    t = _ensure_blank_line_after_headings(t)
-    t = _ensure_blank_lines_around_lists(t)
-
-    # Cap excessive blank lines (keep max 2 consecutive)
-    t = re.sub(r"\n{4,}", "\n\n\n", t).strip() + "\n"
-    return t
-
-def _rejoin_split_headings(t: str) -> str:
+class _LineFormatter:
     """
-    Rejoin headings split across lines (even with blank lines).
-    Example:
-      ### Why the EDI
-      programme?
-    -> ### Why the EDI programme?
+    The rules of format_markdown_safe as one pass over the lines.
+
+    Each rule is a small state machine that takes one line at a time and
+    hands its output lines to the next rule, holding back only the few
+    lines it still needs to see past (a heading waiting for its
+    continuation, a blank line that may be re-joined, an open paragraph).
+    In order:
+
+        _rejoin     headings split across lines ("### Why the EDI" / "programme?")
+        _split_h3   inline H3 headings ("### Title The paragraph ...")
+        _reflow     hard-wrapped paragraph lines; code fences kept as they are
+        _join_lower blank line before a lowercase/digit continuation
+        _join_word  blank line after "in/to/of/be/is/are/was/were"
+        _number     blank lines around a bare "N units" fragment
+        _tighten    blank lines between bullets
+        _heading_gap  one blank line after headings
+        _list_gap   blank lines around list blocks
+        _emit       at most two blank lines in a row, trimmed ends
+
+    feed() accepts any piece of the text and returns the output that is
+    final so far; feed(a) + feed(b) + close() == format of a + b.
     """
-    lines = t.split("\n")
-    out = []
-    i = 0
-
-    while i < len(lines):
-        line = lines[i].rstrip()
-        stripped = line.strip()
-
-        if stripped.startswith("###"):
-            # find next non-empty line
-            j = i + 1
-            while j < len(lines) and lines[j].strip() == "":
-                j += 1
-
-            if j < len(lines):
-                nxt = lines[j].strip()
-
-                # Merge only if nxt looks like heading continuation
-                if (
-                    nxt
-                    and len(nxt.split()) <= 7
-                    and not nxt.startswith(("#", "-", "*"))
-                    and not _BULLET_RE.match(nxt)
-                    and not re.search(r"[.!]$", nxt)  # allow '?'
-                ):
-                    out.append(f"{stripped} {nxt}")
-                    i = j + 1
-                    continue
-
-        out.append(line)
-        i += 1
-
-    return "\n".join(out)
-
-
-
 
+    def __init__(self) -> None:
+        self._out: List[str] = []
+        self._partial = ""  # incomplete last input line
+        self._cr = False  # input ended in "\r" (may be half of "\r\n")
+        # _rejoin
+        self._heading: Optional[str] = None
+        self._heading_blanks = 0
+        # _reflow
+        self._in_code = False
+        self._para: List[str] = []
+        # _join_lower / _join_word: pending line, and a blank line held after it
+        self._jl_prev: Optional[str] = None
+        self._jl_blank = False
+        self._jw_prev: Optional[str] = None
+        self._jw_blank = False
+        # _number
+        self._num_lines: List[str] = []
+        self._num_tail: Optional[List[str]] = None
+        # _tighten
+        self._seen = False
+        self._prev_bullet = False
+        self._held_blank: Optional[bool] = None  # whether the line before the held blank was a bullet
+        # _heading_gap
+        self._after_heading = False
+        # _list_gap
+        self._lg_prev = ""
+        self._lg_cur: Optional[str] = None
+        # _emit
+        self._started = False
+        self._blanks = 0
+        self._trailing: Optional[str] = None  # content line with trailing spaces, not yet emitted
+
+    def feed(self, text: str) -> str:
+        if self._cr:
+            text = "\r" + text
+            self._cr = False
+        if text.endswith("\r"):
+            text, self._cr = text[:-1], True
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+        lines = text.split("\n")
+        lines[0] = self._partial + lines[0]
+        self._partial = lines.pop()
+        for line in lines:
+            self._rejoin(line.rstrip())
+        return self._take()
+
+    def close(self) -> str:
+        line, self._partial = self._partial, ""
+        if self._cr:
+            self._cr = False
+            self._rejoin(line.rstrip())
+            line = ""
+        self._rejoin(line.rstrip())
+        self._rejoin_end()
+        if self._trailing is not None:
+            self._out.append(self._trailing.rstrip() + "\n")
+            self._trailing = None
+        return self._take()
+
+    def _take(self) -> str:
+        out = "".join(self._out)
+        self._out.clear()
+        return out
+
+    # ---- headings split across lines ----
+
+    def _rejoin(self, line: str) -> None:
+        if self._heading is not None:
+            if line.strip() == "":
+                self._heading_blanks += 1
+                return
+            nxt = line.strip()
+            if (
+                len(nxt.split()) <= 7
+                and not nxt.startswith(("#", "-", "*"))
+                and not _BULLET_RE.match(nxt)
+                and not nxt.endswith((".", "!"))  # allow '?'
+            ):
+                self._split_h3(f"{self._heading.strip()} {nxt}")
+                self._heading = None
+                return
+            self._rejoin_flush()
+        if line.strip().startswith("###"):
+            self._heading, self._heading_blanks = line, 0
+            return
+        self._split_h3(line)
 
-def _normalize_newlines(t: str) -> str:
-    return t.replace("\r\n", "\n").replace("\r", "\n")
-
+    def _rejoin_flush(self) -> None:
+        heading, blanks = self._heading, self._heading_blanks
+        self._heading = None
+        self._split_h3(heading)
+        for _ in range(blanks):
+            self._split_h3("")
 
-def _strip_trailing_spaces(t: str) -> str:
-    return "\n".join(line.rstrip() for line in t.split("\n"))
+    def _rejoin_end(self) -> None:
+        if self._heading is not None:
+            self._rejoin_flush()
+        self._reflow_flush()
+        self._join_lower_end()
 
-def _split_inline_h3_headings(t: str) -> str:
-    """
-    Split inline H3 headings like:
-      "### Programme overview The MSc..." ->
-      "### Programme overview\n\nThe MSc..."
+    # ---- inline H3 headings ----
 
-    Prefer splitting before 'The' (common pattern), otherwise fall back to a short-title split.
-    """
-    out = []
-    for line in t.split("\n"):
-        m = _INLINE_H3_RE.match(line.strip())
+    def _split_h3(self, line: str) -> None:
+        m = _INLINE_H3_RE.match(line.strip()) if "###" in line else None
         if not m:
-            out.append(line)
-            continue
+            self._reflow(line)
+            return
 
         prefix, rest = m.group(1), m.group(2).strip()
 
         # If it's already a short heading, keep it.
         if len(rest.split()) <= 5:
-            out.append(f"{prefix}{rest}")
-            continue
+            self._reflow(f"{prefix}{rest}")
+            return
 
         # Prefer splitting right before "The " if present (case-insensitive)
-        lower = rest.lower()
-        the_idx = lower.find(" the ")
+        the_idx = rest.lower().find(" the ")
         if the_idx != -1:
             title = rest[:the_idx].strip()
-            cont = rest[the_idx + 1 :].strip()  # keep "The ..." (remove leading space only)
+            cont = rest[the_idx + 1:].strip()  # keep "The ..." (remove leading space only)
             if title and cont:
-                out.append(f"{prefix}{title}")
-                out.append("")
-                out.append(cont)
-                continue
+                self._reflow(f"{prefix}{title}")
+                self._reflow("")
+                self._reflow(cont)
+                return
 
         # Fallback: first 3 words as title
         words = rest.split()
-        title = " ".join(words[:3])
-        cont = " ".join(words[3:]).strip()
-
-        out.append(f"{prefix}{title}")
-        out.append("")
-        out.append(cont)
-
-    return "\n".join(out)
-
-
-
+        self._reflow(f"{prefix}{' '.join(words[:3])}")
+        self._reflow("")
+        self._reflow(" ".join(words[3:]).strip())
 
+    # ---- paragraph reflow ----
 
-def _reflow_paragraphs_preserve_blocks(t: str) -> str:
-    """
-    Joins lines inside paragraphs (hard wraps) into a single line.
-    Preserves headings, bullet/numbered lines, blank lines, and code fences.
-    """
-    lines = t.split("\n")
-    out = []
-    buf = []
-    in_code = False
-
-    def flush_buf():
-        nonlocal buf
-        if not buf:
-            return
-        # Join wrapped lines with spaces (do not change words)
-        out.append(" ".join(s.strip() for s in buf if s.strip()))
-        buf = []
-
-    for line in lines:
+    def _reflow(self, line: str) -> None:
         if _CODE_FENCE_RE.match(line):
-            flush_buf()
-            out.append(line)
-            in_code = not in_code
-            continue
-
-        if in_code:
-            out.append(line)
-            continue
+            self._reflow_flush()
+            self._join_lower(line)
+            self._in_code = not self._in_code
+            return
+        if self._in_code:
+            self._join_lower(line)
+            return
 
         stripped = line.strip()
-
         if stripped == "":
-            flush_buf()
-            out.append("")
-            continue
+            self._reflow_flush()
+            self._join_lower("")
+        elif _HEADING_RE.match(stripped) or _BULLET_RE.match(stripped):
+            self._reflow_flush()
+            self._join_lower(line)
+        else:
+            self._para.append(stripped)  # paragraph text: join wrapped lines with spaces
+
+    def _reflow_flush(self) -> None:
+        if self._para:
+            self._join_lower(" ".join(self._para))
+            self._para = []
+
+    # ---- blank line before a lowercase / digit continuation ----
+
+    def _join_lower(self, line: str) -> None:
+        if self._jl_blank:
+            self._jl_blank = False
+            if line[:1] in _LOWER_OR_DIGIT:
+                self._jl_prev = f"{self._jl_prev} {line}"
+                return
+            self._join_word(self._jl_prev)
+            self._jl_prev = ""  # the held blank line is now the pending one
+        if line == "" and self._jl_prev is not None:
+            self._jl_blank = True
+            return
+        if self._jl_prev is not None:
+            self._join_word(self._jl_prev)
+        self._jl_prev = line
+
+    def _join_lower_end(self) -> None:
+        if self._jl_prev is not None:
+            self._join_word(self._jl_prev)
+            if self._jl_blank:
+                self._join_word("")
+        self._jl_prev, self._jl_blank = None, False
+        self._join_word_end()
+
+    # ---- blank line after in/to/of/be/is/are/was/were ----
+
+    def _join_word(self, line: str) -> None:
+        if self._jw_blank:
+            self._jw_blank = False
+            if _WORD_START_RE.match(line) and _JOIN_WORD_END_RE.search(self._jw_prev):
+                self._jw_prev = f"{self._jw_prev} {line}"
+                return
+            self._number(self._jw_prev)
+            self._jw_prev = ""
+        if line == "" and self._jw_prev is not None:
+            self._jw_blank = True
+            return
+        if self._jw_prev is not None:
+            self._number(self._jw_prev)
+        self._jw_prev = line
+
+    def _join_word_end(self) -> None:
+        if self._jw_prev is not None:
+            self._number(self._jw_prev)
+            if self._jw_blank:
+                self._number("")
+        self._jw_prev, self._jw_blank = None, False
+        self._number_end()
+
+    # ---- "N units" fragment between blank lines ----
+
+    def _number(self, line: str) -> None:
+        if self._num_tail is not None:
+            self._num_tail.append(line)
+            return
+        pending = self._num_lines
+        if len(pending) == 2 and pending[1] == "" and line[:1].isdecimal():
+            # Rare (non-ASCII digit): keep the rest and apply the pattern at the end.
+            self._num_tail = pending + [line]
+            self._num_lines = []
+            return
+        pending.append(line)
+        if len(pending) > 2:
+            self._tighten(pending.pop(0))
+
+    def _number_end(self) -> None:
+        lines = self._num_lines
+        if self._num_tail is not None:
+            text = _NUMBER_FRAGMENT_RE.sub(r" \1 ", "\n".join(self._num_tail))
+            lines = text.split("\n")
+        for line in lines:
+            self._tighten(line)
+        self._num_lines, self._num_tail = [], None
+        self._tighten_end()
+
+    # ---- no blank lines between bullets ----
+
+    def _tighten(self, line: str) -> None:
+        stripped = line.strip()
+        is_bullet = bool(_BULLET_RE.match(stripped))
+        if self._held_blank is not None:
+            if not (self._held_blank and is_bullet):
+                self._heading_gap("")
+            self._held_blank = None
+        if stripped == "" and self._seen:
+            self._held_blank = self._prev_bullet
+        else:
+            self._heading_gap(line)
+        self._prev_bullet = is_bullet
+        self._seen = True
+
+    def _tighten_end(self) -> None:
+        if self._held_blank is not None:
+            self._heading_gap("")
+            self._held_blank = None
+        self._list_gap_end()
+
+    # ---- one blank line after headings ----
+
+    def _heading_gap(self, line: str) -> None:
+        stripped = line.strip()
+        if self._after_heading and stripped != "":
+            self._list_gap("")
+        self._after_heading = bool(_HEADING_RE.match(stripped))
+        self._list_gap(line)
+
+    # ---- blank lines around list blocks ----
+
+    def _list_gap(self, line: str) -> None:
+        if self._lg_cur is not None:
+            self._list_gap_line(self._lg_prev, self._lg_cur, line)
+            self._lg_prev = self._lg_cur
+        self._lg_cur = line
+
+    def _list_gap_end(self) -> None:
+        if self._lg_cur is not None:
+            self._list_gap_line(self._lg_prev, self._lg_cur, "")
+        self._lg_prev, self._lg_cur = "", None
+
+    def _list_gap_line(self, prev: str, cur: str, nxt: str) -> None:
+        if not _BULLET_RE.match(cur.strip()):
+            self._emit(cur)
+            return
+        prev, nxt = prev.strip(), nxt.strip()
+        if prev != "" and not _BULLET_RE.match(prev) and not _HEADING_RE.match(prev):
+            self._emit("")
+        self._emit(cur)
+        if nxt != "" and not _BULLET_RE.match(nxt):
+            self._emit("")
+
+    # ---- output: at most two blank lines in a row, trimmed ends ----
+
+    def _emit(self, line: str) -> None:
+        if not line.strip():
+            if self._started:
+                self._blanks += 1
+            return
+        out = self._out
+        if not self._started:
+            line = line.lstrip()
+            self._started = True
+        else:
+            if self._trailing is not None:
+                out.append(self._trailing + "\n")
+                self._trailing = None
+            out.append("\n" * min(self._blanks, 2))
+            self._blanks = 0
+        if line != line.rstrip():
+            self._trailing = line  # emitted with its spaces only if more text follows
+        else:
+            out.append(line + "\n")
 
-        if _HEADING_RE.match(stripped) or _BULLET_RE.match(stripped):
-            flush_buf()
-            out.append(line)
-            continue
 
-        # Otherwise paragraph text
-        buf.append(line)
+# -----------------------------
+# Incremental (streaming) use
+# -----------------------------
 
-    flush_buf()
-    return "\n".join(out)
+_BLANK_SEP_RE = re.compile(r"\n(?:[ \t]*\n)+")
 
 
+def _normalize_newlines(text: str) -> str:
+    return text.replace("\r\n", "\n").replace("\r", "\n")
 
-def _tighten_bullets(t: str) -> str:
-    """
-    Remove blank lines between consecutive bullet items.
-    Keeps blank lines before/after list blocks (handled separately).
-    """
-    lines = t.split("\n")
-    out = []
-    for i, line in enumerate(lines):
-        if (
-            line.strip() == ""
-            and i > 0
-            and i + 1 < len(lines)
-            and _BULLET_RE.match(lines[i - 1].strip())
-            and _BULLET_RE.match(lines[i + 1].strip())
-        ):
-            # skip blank line between bullets
-            continue
-        out.append(line)
-    return "\n".join(out)
-
-
-def _ensure_blank_line_after_headings(t: str) -> str:
-    lines = t.split("\n")
-    out = []
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        out.append(line)
-        if _HEADING_RE.match(line.strip()):
-            # Ensure exactly one blank line after heading
-            if i + 1 < len(lines) and lines[i + 1].strip() != "":
-                out.append("")
-        i += 1
-    return "\n".join(out)
-
-
-def _ensure_blank_lines_around_lists(t: str) -> str:
-    """
-    Ensure:
-    - blank line before a list block (if preceding line is text)
-    - blank line after a list block (if following line is text)
-    """
-    lines = t.split("\n")
-    out = []
-    for i, line in enumerate(lines):
-        cur_is_bullet = bool(_BULLET_RE.match(line.strip()))
-        prev = lines[i - 1] if i > 0 else ""
-        nxt = lines[i + 1] if i + 1 < len(lines) else ""
 
-        if cur_is_bullet and prev.strip() != "" and not _BULLET_RE.match(prev.strip()) and not _HEADING_RE.match(prev.strip()):
-            out.append("")
+class IncrementalMarkdownFormatter:
+    """
+    Streaming front-end for format_markdown_safe.
 
-        out.append(line)
+    Deltas go straight into one _LineFormatter, so feed() returns every line
+    that is final so far and the concatenated output equals
+    format_markdown_safe() of the whole answer.
 
-        if cur_is_bullet and nxt.strip() != "" and not _BULLET_RE.match(nxt.strip()):
-            out.append("")
+    With `pre` (a raw-text fixer such as normalize_inline_numbered_lists),
+    deltas are buffered and `pre` is applied per block: text up to a blank
+    line whose following block has started (its first line is complete) and
+    can no longer be merged back by any of the cross-block rules (heading
+    rejoin, lowercase/number continuation, tight bullets, open code fence).
+    """
 
-    return "\n".join(out)
+    def __init__(self, pre=None) -> None:
+        self._buf = ""
+        self._pre = pre  # optional raw-text fixer applied per block before formatting
+        self._fmt = _LineFormatter()
+
+    def feed(self, delta: str) -> str:
+        if self._pre is None:
+            return self._fmt.feed(delta)
+        self._buf += delta
+        cut = self._safe_cut()
+        if cut <= 0:
+            return ""
+        head, self._buf = self._buf[:cut], self._buf[cut:]
+        return self._fmt.feed(self._pre(head))
+
+    def close(self) -> str:
+        head, self._buf = self._buf, ""
+        out = self._fmt.feed(self._pre(head)) if self._pre is not None and head else ""
+        return out + self._fmt.close()
+
+    def _safe_cut(self) -> int:
+        buf = _normalize_newlines(self._buf)
+        if len(buf) != len(self._buf):
+            self._buf = buf
+        cut = 0
+        for m in _BLANK_SEP_RE.finditer(buf):
+            nxt = buf[m.end():]
+            if "\n" not in nxt:
+                break  # next block's first line still streaming
+            if self._can_cut(buf[:m.start()], nxt.split("\n", 1)[0]):
+                cut = m.end()
+        return cut
+
+    @staticmethod
+    def _can_cut(prev: str, next_line: str) -> bool:
+        prev = prev.rstrip()
+        if not prev or not next_line.strip():
+            return False
+        if sum(1 for ln in prev.split("\n") if _CODE_FENCE_RE.match(ln)) % 2:
+            return False
+
+        prev_block = _BLANK_SEP_RE.split(prev)[-1].strip()
+        prev_last = prev.rsplit("\n", 1)[-1].strip()
+        nxt = next_line.strip()
+
+        if prev_last.startswith("#"):
+            return False  # heading may absorb the next line
+        if _BULLET_RE.match(prev_last) and _BULLET_RE.match(nxt):
+            return False  # same list block
+        if re.match(r"[a-z0-9]", nxt):
+            return False  # lowercase / number continuation is re-joined
+        if prev_block[:1].isdigit():
+            return False  # "N units" fragment may be re-joined on both sides
+        if _JOIN_WORD_END_RE.search(prev_last):
+            return False
+        return True
@@ -0,0 +1,200 @@
+# rag/lexical.py
+"""
+In-process BM25 over the chunk store, for the exact tokens dense embeddings
+blur: course codes (CDE5301), exam names (IELTS, TOEFL), fees, dates.
+
+The builders write bm25.npz next to faiss.index; doc numbers are chunk store
+rows. Postings are flat numpy arrays (CSR layout), so scoring a query is a
+few vectorised adds over the posting lists of its terms.
+"""
+from __future__ import annotations
+
+import math
+import re
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from rag.chunkstore import ChunkStore, strip_prefix
+
+# words, numbers and codes; keeps "10,900", "2024/25", "part-time" whole
+_TOKEN_RE = re.compile(r"[0-9A-Za-z]+(?:[.,/'-][0-9A-Za-z]+)*")
+# "CDE 5301" is also indexed/queried as "cde5301"
+_SPLIT_CODE_RE = re.compile(r"\b([A-Za-z]{2,4})\s+(\d{4}[A-Za-z]?)\b")
+_ACRONYM_RE = re.compile(r"^[A-Z][A-Z0-9]+$")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in is it me my "
+    "of on or our so that the their there this to was what when where which "
+    "who will with would you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = [t.casefold() for t in _TOKEN_RE.findall(text)]
+    tokens.extend((a + b).casefold() for a, b in _SPLIT_CODE_RE.findall(text))
+    return tokens
+
+
+def _is_exact(raw: str) -> bool:
+    """Tokens embeddings are bad at: anything with a digit, or an acronym."""
+    return any(ch.isdigit() for ch in raw) or bool(_ACRONYM_RE.match(raw))
+
+
+class BM25Writer:
+    """
+    Accumulates postings chunk by chunk, in chunk store row order. Pass the
+    chunk body (see chunkstore.strip_prefix), not the "[file | chunk n]" line.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._exact: set = set()
+        self._doc_len: List[int] = []
+
+    def add(self, text: str) -> int:
+        doc = len(self._doc_len)
+        tf: Dict[str, int] = defaultdict(int)
+        for raw in _TOKEN_RE.findall(text):
+            tf[raw.casefold()] += 1
+            if _is_exact(raw):
+                self._exact.add(raw.casefold())
+        for a, b in _SPLIT_CODE_RE.findall(text):
+            tf[(a + b).casefold()] += 1
+            self._exact.add((a + b).casefold())  # a course code, like the unsplit form
+        for term, n in tf.items():
+            self._postings[term].append((doc, n))
+        self._doc_len.append(sum(tf.values()))
+        return doc
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def save(self, path: Path) -> Path:
+        terms = sorted(self._postings)
+        offsets = np.zeros(len(terms) + 1, dtype="int64")
+        for i, t in enumerate(terms):
+            offsets[i + 1] = offsets[i] + len(self._postings[t])
+        docs = np.empty(int(offsets[-1]), dtype="int32")
+        tfs = np.empty(int(offsets[-1]), dtype="int32")
+        for i, t in enumerate(terms):
+            plist = self._postings[t]
+            docs[offsets[i]:offsets[i + 1]] = [d for d, _ in plist]
+            tfs[offsets[i]:offsets[i + 1]] = [n for _, n in plist]
+
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp.npz")
+        np.savez(
+            tmp,
+            terms=np.frombuffer("\n".join(terms).encode("utf-8"), dtype="u1"),
+            exact=np.array([t in self._exact for t in terms], dtype=bool),
+            offsets=offsets,
+            docs=docs,
+            tfs=tfs,
+            doc_len=np.asarray(self._doc_len, dtype="int32"),
+            params=np.array([self.k1, self.b], dtype="float64"),
+        )
+        tmp.replace(path)
+        return path
+
+
+class BM25Index:
+    """Read side: term lookup, BM25 scoring and top-k over chunk rows."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        with np.load(self.path) as z:
+            terms = z["terms"]
+            self._exact = z["exact"]
+            self._offsets = z["offsets"]
+            self._docs = z["docs"]
+            self._tfs = z["tfs"].astype("float32")
+            self._doc_len = z["doc_len"].astype("float32")
+            self.k1, self.b = (float(x) for x in z["params"])
+        terms = terms.tobytes().decode("utf-8").split("\n") if len(terms) else []
+        self._term_id: Dict[str, int] = {t: i for i, t in enumerate(terms)}
+        self.n_docs = len(self._doc_len)
+        avgdl = float(self._doc_len.mean()) if self.n_docs else 0.0
+        # per-doc part of the BM25 denominator, precomputed once
+        self._norm = self.k1 * (1.0 - self.b + self.b * self._doc_len / max(avgdl, 1e-9))
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    def _df(self, tid: int) -> int:
+        return int(self._offsets[tid + 1] - self._offsets[tid])
+
+    def _idf(self, tid: int) -> float:
+        df = self._df(tid)
+        return math.log(1.0 + (self.n_docs - df + 0.5) / (df + 0.5))
+
+    def content_terms(self, query: str) -> List[str]:
+        # "CDE 5301" in a query means the code, not "cde" + "5301"
+        query = _SPLIT_CODE_RE.sub(r"\1\2", query)
+        return [t for t in dict.fromkeys(tokenize(query)) if t not in STOPWORDS]
+
+    def is_exact_query(self, query: str, max_terms: int) -> bool:
+        """
+        Keyword-style query (<= max_terms content terms, all of them indexed)
+        containing at least one exact token: BM25 alone answers it well.
+        """
+        terms = self.content_terms(query)
+        if not terms or len(terms) > max_terms:
+            return False
+        tids = [self._term_id.get(t) for t in terms]
+        if any(tid is None for tid in tids):
+            return False
+        return any(bool(self._exact[tid]) for tid in tids)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        """[(chunk row, bm25 score)], best first."""
+        scores = np.zeros(self.n_docs, dtype="float32")
+        for term in self.content_terms(query):
+            tid = self._term_id.get(term)
+            if tid is None:
+                continue
+            a, b = int(self._offsets[tid]), int(self._offsets[tid + 1])
+            docs, tf = self._docs[a:b], self._tfs[a:b]
+            scores[docs] += self._idf(tid) * tf * (self.k1 + 1.0) / (tf + self._norm[docs])
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        if len(hits) > top_k:
+            hits = hits[np.argpartition(-scores[hits], top_k - 1)[:top_k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(int(i), float(scores[i])) for i in hits]
+
+
+def load_bm25(path: Path) -> Optional[BM25Index]:
+    return BM25Index(path) if Path(path).exists() else None
+
+
+def rrf(rankings: Iterable[List[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """Reciprocal-rank fusion of several best-first key lists."""
+    fused: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            fused[key] += 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda kv: kv[1], reverse=True)
+
+
+def build_from_store(chunks_path: Path, out_path: Path) -> Path:
+    """bm25.npz for an existing chunk store (no re-embedding needed)."""
+    store = ChunkStore(chunks_path)
+    writer = BM25Writer()
+    for i in range(len(store)):
+        writer.add(strip_prefix(store.text(i)))
+    return writer.save(out_path)
+
+
+if __name__ == "__main__":
+    # python -m rag.lexical chunks.bin bm25.npz
+    if len(sys.argv) != 3:
+        raise SystemExit("usage: python -m rag.lexical <chunks.bin> <bm25.npz>")
+    out = build_from_store(Path(sys.argv[1]), Path(sys.argv[2]))
+    print("Wrote:", out, f"({len(BM25Index(out))} chunks)")
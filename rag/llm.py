@@ -1,10 +1,17 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import re
-from typing import Any, Dict, List
+import time
+from typing import Any, AsyncIterator, Dict, List
 
-from openai import OpenAI
+from openai import OpenAI, OpenAIError
+
+from rag import metrics
+from rag.clients import get_async_client
+from rag.context import PackedContext, pack_context
+from rag.formatting.markdown import IncrementalMarkdownFormatter
 
 client = OpenAI()
 
@@ -18,6 +25,8 @@ except Exception:
 
 
 # Restored system message from llm-old.py (keep this as the main policy layer)
+# Sent first and byte-for-byte identical on every request, so the provider's
+# prompt cache can reuse it; anything per-request belongs in the user message.
 system_msg = """You are an admissions assistant for the MSc in Engineering Design & Innovation (MSc EDI or EDI).
 
 OUT-OF-SCOPE PROGRAMME REDIRECT (MDes):
@@ -85,6 +94,10 @@ INLINE CONTINUATION RULE (NON-NEGOTIABLE):
 """
 
 
+# Part of the answer-cache key: editing the policy text invalidates cached answers.
+SYSTEM_PROMPT_HASH = hashlib.sha256(system_msg.encode("utf-8")).hexdigest()[:16]
+
+
 def _chunk_to_text(chunk: Dict[str, Any]) -> str:
     """
     Keep compatibility with multiple chunk shapes.
@@ -102,6 +115,11 @@ def _chunk_to_text(chunk: Dict[str, Any]) -> str:
     return str(v)
 
 
+_LIST_AFTER_COLON_RE = re.compile(r":\s*(\d+\.)\s+\*\*", re.IGNORECASE)
+_INLINE_LIST_ITEM_RE = re.compile(r"(?<!\n)(\d+\.)\s+\*\*")
+_EXTRA_NEWLINES_RE = re.compile(r"\n{3,}")
+
+
 def normalize_inline_numbered_lists(text: str) -> str:
     """
     Restored from llm-old.py: fixes the common '1. **...** 2. **...**' inline formatting.
@@ -110,28 +128,33 @@ def normalize_inline_numbered_lists(text: str) -> str:
         return text
 
     # Force newline after ":" if followed by a numbered item
-    text = re.sub(r":\s*(\d+\.)\s+\*\*", r":\n\n\1 **", text, flags=re.IGNORECASE)
+    text = _LIST_AFTER_COLON_RE.sub(r":\n\n\1 **", text)
 
     # Force numbered items to start at beginning of a line unless they already do
-    text = re.sub(r"(?<!\n)(\d+\.)\s+\*\*", r"\n\n\1 **", text)
+    text = _INLINE_LIST_ITEM_RE.sub(r"\n\n\1 **", text)
 
     # Clean up accidental triple newlines
-    text = re.sub(r"\n{3,}", "\n\n", text)
+    text = _EXTRA_NEWLINES_RE.sub("\n\n", text)
 
     return text
 
 
-def ask_llm(question: str, context_chunks: List[Dict[str, Any]]) -> str:
+LLM_MODEL = "gpt-4o-mini"
+
+
+def pack_chunks(context_chunks: List[Dict[str, Any]]) -> PackedContext:
+    """Chunks that fit the prompt token budget (see rag.context), best first."""
+    return pack_context(context_chunks or [], _chunk_to_text)
+
+
+def _build_messages(question: str, context_chunks: List[Dict[str, Any]]) -> List[Dict[str, str]]:
     """
     Uses a system message (policy/rules) + user message containing context and question.
+    Context is packed into the token budget; packing is idempotent, so callers
+    may pass chunks they already packed.
     """
-    parts: List[str] = []
-    for c in context_chunks or []:
-        t = _chunk_to_text(c)
-        if t and t.strip():
-            parts.append(t.strip())
-
-    context_text = "\n\n".join(parts)
+    packed = pack_chunks(context_chunks)
+    context_text = "\n\n".join(_chunk_to_text(c).strip() for c in packed.chunks)
 
     user_prompt = f"""You must answer in well-formatted Markdown.
 
@@ -142,16 +165,83 @@ Question:
 {question}
 """
 
-    completion = client.chat.completions.create(
-        model="gpt-4o-mini",
-        temperature=0.3,
-        max_tokens=800,
-        messages=[
-            {"role": "system", "content": system_msg},
-            {"role": "user", "content": user_prompt},
-        ],
-    )
+    return [
+        {"role": "system", "content": system_msg},
+        {"role": "user", "content": user_prompt},
+    ]
 
+
+def _postprocess(completion: Any) -> str:
+    metrics.record_usage("chat", getattr(completion, "usage", None))
+    t0 = time.perf_counter()
     raw = completion.choices[0].message.content or ""
     raw = normalize_inline_numbered_lists(raw)
-    return format_markdown_safe(raw)
+    out = format_markdown_safe(raw)
+    metrics.FORMAT_SECONDS.observe(time.perf_counter() - t0)
+    return out
+
+
+def ask_llm(question: str, context_chunks: List[Dict[str, Any]]) -> str:
+    try:
+        completion = client.chat.completions.create(
+            model=LLM_MODEL,
+            temperature=0.3,
+            max_tokens=800,
+            messages=_build_messages(question, context_chunks),
+        )
+    except OpenAIError:
+        metrics.openai_error("chat")
+        raise
+    return _postprocess(completion)
+
+
+async def aask_llm(question: str, context_chunks: List[Dict[str, Any]]) -> str:
+    """Same as ask_llm, awaited on the shared AsyncOpenAI client."""
+    try:
+        completion = await get_async_client().chat.completions.create(
+            model=LLM_MODEL,
+            temperature=0.3,
+            max_tokens=800,
+            messages=_build_messages(question, context_chunks),
+        )
+    except OpenAIError:
+        metrics.openai_error("chat")
+        raise
+    return _postprocess(completion)
+
+
+async def astream_llm(question: str, context_chunks: List[Dict[str, Any]]) -> AsyncIterator[str]:
+    """
+    Streaming variant: yields formatted Markdown as soon as it is final;
+    inline numbered lists are fixed per block (see IncrementalMarkdownFormatter).
+    """
+    fmt = IncrementalMarkdownFormatter(pre=normalize_inline_numbered_lists)
+    format_s = 0.0
+    try:
+        stream = await get_async_client().chat.completions.create(
+            model=LLM_MODEL,
+            temperature=0.3,
+            max_tokens=800,
+            messages=_build_messages(question, context_chunks),
+            stream=True,
+            stream_options={"include_usage": True},  # usage arrives in a final chunk without choices
+        )
+        async for event in stream:
+            if not event.choices:
+                metrics.record_usage("chat", getattr(event, "usage", None))
+                continue
+            delta = event.choices[0].delta.content or ""
+            if delta:
+                t0 = time.perf_counter()
+                out = fmt.feed(delta)
+                format_s += time.perf_counter() - t0
+                if out:
+                    yield out
+    except OpenAIError:
+        metrics.openai_error("chat")
+        raise
+    t0 = time.perf_counter()
+    out = fmt.close()
+    metrics.FORMAT_SECONDS.observe(format_s + time.perf_counter() - t0)
+    if out:
+        yield out
@@ -0,0 +1,220 @@
+# rag/metrics.py
+"""
+Prometheus metrics for the /ask pipeline, served by GET /metrics in the
+text exposition format (no client library needed).
+
+Recording is cheap enough to leave on: every series is a preallocated list
+of bucket counts, so observe() is a bisect plus two increments, and label
+values map to their series with one dict lookup. Updates take no lock: the
+request path records from the event loop thread, and a count lost to a
+rare concurrent update from a worker thread does not matter for
+monitoring. Cache hit/miss counters are not recorded per request; they are
+read from the caches' own stats at scrape time.
+
+Metrics are per process. With several uvicorn workers, each worker reports
+its own numbers, so scrape each worker or run one worker per container.
+
+    rag_embed_seconds                      query-embedding API calls (single or batched)
+    rag_search_seconds                     FAISS searches (one per batch when batching)
+    rag_stage_seconds{stage}               StageTimer stages (classify, route_*, retrieve, pack, llm, ...)
+    rag_format_seconds                     Markdown formatting of one answer
+    rag_route_outcomes_total{outcome}      how each question was answered
+    rag_cache_hits_total{cache}            answer / semantic / embedding caches
+    rag_cache_misses_total{cache}
+    rag_openai_errors_total{endpoint}      failed chat / embeddings calls
+    rag_openai_tokens_total{endpoint,kind} prompt / completion tokens
+"""
+from __future__ import annotations
+
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds; in-process stages are sub-millisecond, API calls take 100s of ms
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+API_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STAGE_BUCKETS = FAST_BUCKETS + (2.5, 5.0, 10.0, 30.0)  # stages include the LLM call
+
+ROUTE_OUTCOMES = ("route_early", "route_intake", "policy", "requirement", "faq", "cache", "llm", "fallback")
+
+_registry: List["_Metric"] = []
+
+
+def _fmt(v: float) -> str:
+    return repr(float(v)) if v != float("inf") else "+Inf"
+
+
+def _label_str(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def labels(self, *values: str):
+        series = self._series.get(values)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(values, self._new())
+        return series
+
+    @abstractmethod
+    def _new(self) -> Any:
+        """A fresh series for one label combination."""
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} {self.kind}"
+        with self._lock:
+            series_list = sorted(self._series.items())
+        for values, series in series_list:
+            yield from series.render(self.name, self.labelnames, values)
+
+
+class _CounterSeries:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, n: float = 1.0) -> None:
+        self.value += n
+
+    def render(self, name: str, labelnames: Sequence[str], values: Sequence[str]) -> Iterable[str]:
+        yield f"{name}{_label_str(labelnames, values)} {_fmt(self.value)}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new(self) -> _CounterSeries:
+        return _CounterSeries()
+
+    def inc(self, n: float = 1.0) -> None:
+        self.labels().inc(n)
+
+
+class _HistogramSeries:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot: +Inf
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(self.bounds, seconds)] += 1  # first bucket with le >= seconds
+        self.sum += seconds
+
+    def render(self, name: str, labelnames: Sequence[str], values: Sequence[str]) -> Iterable[str]:
+        counts, total = list(self.counts), self.sum
+        cum = 0
+        for le, n in zip(self.bounds + (float("inf"),), counts):
+            cum += n
+            le_label = 'le="' + _fmt(le) + '"'
+            yield f"{name}_bucket{_label_str(labelnames, values, le_label)} {cum}"
+        yield f"{name}_sum{_label_str(labelnames, values)} {_fmt(total)}"
+        yield f"{name}_count{_label_str(labelnames, values)} {cum}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = FAST_BUCKETS) -> None:
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new(self) -> _HistogramSeries:
+        return _HistogramSeries(self.buckets)
+
+    def observe(self, seconds: float) -> None:
+        self.labels().observe(seconds)
+
+
+# -----------------------------
+# Pipeline metrics
+# -----------------------------
+
+EMBED_SECONDS = Histogram("rag_embed_seconds", "Query-embedding latency (API call or local model).", buckets=API_BUCKETS)
+SEARCH_SECONDS = Histogram("rag_search_seconds", "FAISS search latency.")
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Per-request /ask pipeline stage latency.", ("stage",),
+                          buckets=STAGE_BUCKETS)
+FORMAT_SECONDS = Histogram("rag_format_seconds", "Markdown formatting time per answer.")
+ROUTE_OUTCOMES_TOTAL = Counter("rag_route_outcomes_total", "Questions by how they were answered.", ("outcome",))
+OPENAI_ERRORS_TOTAL = Counter("rag_openai_errors_total", "Failed OpenAI API calls.", ("endpoint",))
+OPENAI_TOKENS_TOTAL = Counter("rag_openai_tokens_total", "OpenAI tokens used.", ("endpoint", "kind"))
+
+# series that exist before the first request, so dashboards see zeros
+for _outcome in ROUTE_OUTCOMES:
+    ROUTE_OUTCOMES_TOTAL.labels(_outcome)
+for _endpoint in ("chat", "embeddings"):
+    OPENAI_ERRORS_TOTAL.labels(_endpoint)
+OPENAI_TOKENS_TOTAL.labels("chat", "prompt")
+OPENAI_TOKENS_TOTAL.labels("chat", "completion")
+OPENAI_TOKENS_TOTAL.labels("embeddings", "prompt")
+EMBED_SECONDS.labels()
+SEARCH_SECONDS.labels()
+FORMAT_SECONDS.labels()
+
+
+def route_outcome(outcome: str) -> None:
+    ROUTE_OUTCOMES_TOTAL.labels(outcome).inc()
+
+
+def observe_stages(stages: Dict[str, float]) -> None:
+    """Record a finished request's StageTimer.stages (milliseconds)."""
+    for name, ms in stages.items():
+        STAGE_SECONDS.labels(name).observe(ms / 1000.0)
+
+
+def record_usage(endpoint: str, usage: Any) -> None:
+    """Token counts from an OpenAI response's `usage` (None is ignored)."""
+    if usage is None:
+        return
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    if prompt:
+        OPENAI_TOKENS_TOTAL.labels(endpoint, "prompt").inc(prompt)
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    if completion:
+        OPENAI_TOKENS_TOTAL.labels(endpoint, "completion").inc(completion)
+
+
+def openai_error(endpoint: str) -> None:
+    OPENAI_ERRORS_TOTAL.labels(endpoint).inc()
+
+
+def _cache_lines(caches: Dict[str, Dict[str, Any]]) -> Iterable[str]:
+    for kind in ("hits", "misses"):
+        name = f"rag_cache_{kind}_total"
+        yield f"# HELP {name} Cache {kind} (answer, semantic and embedding caches)."
+        yield f"# TYPE {name} counter"
+        for cache, s in caches.items():
+            yield f'{name}{{cache="{cache}"}} {_fmt(s.get(kind, 0))}'
+
+
+def render(caches: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+    """
+    Text exposition of every metric. `caches` maps a cache name to its
+    stats() dict ({"hits", "misses", ...}).
+    """
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    if caches:
+        lines.extend(_cache_lines(caches))
+    return "\n".join(lines) + "\n"
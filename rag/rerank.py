@@ -0,0 +1,128 @@
+# rag/rerank.py
+"""
+Post-processing of retrieval results before they become prompt context.
+
+- merge_overlapping: chunks are cut with CHUNK_OVERLAP, so neighbouring hits
+  from one source repeat text. Hits whose char spans overlap or touch are
+  stitched into one result covering the union span (text is never repeated).
+- mmr: maximal-marginal-relevance selection over the chunk vectors, so the
+  final top_k is relevant but not redundant.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+def _known_span(r: Dict[str, Any]) -> bool:
+    span = r.get("span")
+    return bool(r.get("source")) and span is not None and span[0] >= 0 and span[1] > span[0]
+
+
+def _body(r: Dict[str, Any]) -> str:
+    """Chunk text without the "[file | chunk n]" line; equals source[span]."""
+    text = r["text"]
+    if text.startswith("["):
+        head, sep, rest = text.partition("\n")
+        if sep and head.endswith("]") and " | chunk " in head:
+            return rest
+    return text
+
+
+def _stitch(group: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """One result for a run of overlapping hits, sorted by span start."""
+    best = max(group, key=lambda r: r["score"])
+    body = _body(group[0])
+    end = group[0]["span"][1]
+    for r in group[1:]:
+        start, stop = r["span"]
+        if stop > end:
+            body += _body(r)[end - start:]
+            end = stop
+    first, last = group[0]["chunk"], group[-1]["chunk"]
+    label = f"chunk {first}" if first == last else f"chunks {first}-{last}"
+    merged = dict(best)
+    merged.update({
+        "text": f"[{best['source']} | {label}]\n{body}",
+        "span": (group[0]["span"][0], end),
+        "chunk": first,
+        "ids": [r["id"] for r in group],
+    })
+    return merged
+
+
+def merge_overlapping(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Merge hits from the same source whose spans overlap or touch. A merged
+    result keeps the rank (and score) of its best member and lists all
+    member ids in "ids". Hits with unknown spans are left as they are.
+    """
+    rank = {id(r): i for i, r in enumerate(results)}
+    by_source: Dict[str, List[Dict[str, Any]]] = {}
+    for r in results:
+        if _known_span(r):
+            by_source.setdefault(r["source"], []).append(r)
+
+    replaced: Dict[int, Dict[str, Any]] = {}  # id(member) -> merged result
+    for hits in by_source.values():
+        if len(hits) < 2:
+            continue
+        hits.sort(key=lambda r: r["span"][0])
+        group = [hits[0]]
+        for r in hits[1:]:
+            if r["span"][0] <= max(g["span"][1] for g in group):
+                group.append(r)
+                continue
+            if len(group) > 1:
+                merged = _stitch(group)
+                replaced.update({id(g): merged for g in group})
+            group = [r]
+        if len(group) > 1:
+            merged = _stitch(group)
+            replaced.update({id(g): merged for g in group})
+
+    if not replaced:
+        return results
+    out: List[Dict[str, Any]] = []
+    emitted = set()
+    for r in sorted(results, key=lambda r: rank[id(r)]):
+        r = replaced.get(id(r), r)
+        if id(r) not in emitted:
+            emitted.add(id(r))
+            out.append(r)
+    return out
+
+
+def mmr(relevance: np.ndarray, vectors: np.ndarray, k: int, lam: float,
+        cost: Optional[np.ndarray] = None) -> List[int]:
+    """
+    Indices of items chosen greedily by
+    lam * relevance - (1 - lam) * max cosine to the already chosen items,
+    until their total cost reaches k (cost defaults to 1 per item; a merged
+    span costs one per member chunk, so merging never grows the context).
+    `vectors` must be L2-normalized; relevance is expected in [0, 1].
+    """
+    n = len(relevance)
+    if n == 0:
+        return []
+    cost = np.ones(n) if cost is None else np.asarray(cost, dtype="float64")
+    sims = vectors @ vectors.T
+    redundancy = np.zeros(n, dtype=sims.dtype)
+    available = np.ones(n, dtype=bool)
+    chosen: List[int] = []
+    budget = float(k)
+    while True:
+        available &= cost <= budget
+        if not available.any():
+            return chosen
+        if chosen:
+            gain = lam * relevance - (1.0 - lam) * redundancy
+        else:
+            gain = relevance.astype(sims.dtype)
+        gain = np.where(available, gain, -np.inf)
+        j = int(np.argmax(gain))
+        chosen.append(j)
+        available[j] = False
+        budget -= cost[j]
+        np.maximum(redundancy, sims[j], out=redundancy)
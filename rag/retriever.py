@@ -1,79 +1,685 @@
 # rag/retriever.py
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import logging
 import os
-import pickle
+import threading
+import time
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
 
 import faiss
 import numpy as np
-from openai import OpenAI
+from openai import OpenAIError
+
+from rag import metrics
+from rag.ann import EF_SEARCH, NPROBE, describe, read_manifest, set_search_params
+from rag.cache import EmbeddingCache, normalize_query
+from rag.chunkstore import open_store
+from rag.embeddings import EMBED_MODEL, Embeddings, get_backend
+from rag.lexical import BM25Index, load_bm25, rrf
+from rag.rerank import merge_overlapping, mmr
+from rag.shards import ShardFiles, route_query, shard_files, shard_names
+
+logger = logging.getLogger(__name__)
 
 MIN_SCORE = float(os.getenv("MIN_SIMILARITY", "0.2"))
 
 _BASE = Path(__file__).resolve().parent
 ROOT = _BASE.parent
-DOCS_PATH = Path(os.getenv("DOCS_PATH", str(ROOT / "docs.pkl")))
+CHUNKS_PATH = Path(os.getenv("CHUNKS_PATH", str(ROOT / "chunks.bin")))
+DOCS_PATH = Path(os.getenv("DOCS_PATH", str(ROOT / "docs.pkl")))  # legacy fallback
 FAISS_PATH = Path(os.getenv("FAISS_PATH", str(ROOT / "faiss.index")))
 
-EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")  # 1536 dims by default :contentReference[oaicite:1]{index=1}
+# Memory-map the index instead of copying it onto the heap: workers then
+# share the same page-cache pages (and fork-preloaded pages stay shared).
+FAISS_MMAP = os.getenv("FAISS_MMAP", "1") == "1"
+
+# Search-time knobs for ANN indexes (FAISS_EF_SEARCH / FAISS_NPROBE, read in
+# rag/ann.py; ignored by the exact flat index): higher = better recall, slower
+# queries. faiss.index.json has the builder's recall sweep over both.
+
+# Hybrid retrieval: BM25 over the chunks (bm25.npz, written by the builders)
+# fused with the dense results by reciprocal-rank fusion. Keyword-style
+# queries (<= LEXICAL_ONLY_MAX_TERMS content terms, including an exact token
+# such as a course code, IELTS/TOEFL, a fee or a date) are answered from BM25
+# alone, without an embedding call. HYBRID=0 = dense only.
+HYBRID = os.getenv("HYBRID", "1") == "1"
+BM25_PATH = Path(os.getenv("BM25_PATH", str(ROOT / "bm25.npz")))
+RRF_K = int(os.getenv("RRF_K", "60"))
+LEXICAL_ONLY_MAX_TERMS = int(os.getenv("LEXICAL_ONLY_MAX_TERMS", "3"))  # 0 disables
+
+# Post-processing: overlapping / touching hits from one source are merged
+# into a single span, then MMR picks a diverse top_k out of a 2x candidate
+# pool using the index's own vectors. MMR_LAMBDA=1 keeps relevance order.
+MERGE_CHUNKS = os.getenv("MERGE_CHUNKS", "1") == "1"
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+
+# Chunks per question. With the structure chunker an FAQ answer is in the
+# top 3 for every entry (bench/bench_chunking.py: ans@3 = 100%, median
+# context 457 chars); 5 leaves headroom for the dense ranking.
+RETRIEVE_TOP_K = int(os.getenv("RETRIEVE_TOP_K", "5"))
+
+# Query embeddings come from the backend picked by EMBED_MODEL / EMBED_BACKEND
+# (rag/embeddings.py): the OpenAI API, or a local int8 ONNX MiniLM that needs
+# no API call. The index must have been built with the same backend.
+
+# Query-embedding cache: in-memory LRU, plus an optional sqlite tier that
+# survives restarts (set EMBED_CACHE_PATH to a file on a persistent disk).
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "2048"))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "")
+
+# Micro-batching of concurrent query embeddings on the async path: misses
+# arriving within the window are sent as one embeddings request and one
+# batched FAISS search. 0 disables batching.
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "32"))
+
+# Hot reload (see reload_resources): a new index + chunk store is loaded and
+# checked next to the serving one, then swapped in as a single reference.
+# INDEX_WATCH_INTERVAL > 0 polls the files every that many seconds (started
+# by rag/warmup.py); the admin endpoint triggers the same reload.
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "0"))
+
+# Per-programme shards (SHARDS, see rag/shards.py): each shard is a separate
+# index + chunk store + BM25, and a query only searches the shards picked for
+# it. The paths above are the single unnamed shard used when SHARDS is unset.
+_UNSHARDED = ShardFiles(FAISS_PATH, CHUNKS_PATH, BM25_PATH)
+
+
+class Resources(NamedTuple):
+    """
+    One loaded version of a shard's index, chunk store and BM25. Handles are
+    immutable: a request takes the current one once and uses it to the end,
+    so a reload never mixes versions within a request, and the old files
+    stay mapped until the last request holding them finishes.
+    """
+    name: str  # shard ("" = unsharded)
+    docs: Any  # ChunkStore (mmap) or LegacyPickleStore
+    index: faiss.Index
+    bm25: Optional[BM25Index]
+    version: str
+    search_params: Dict[str, int]
+    loaded_at: float
+
+
+class IndexSet(NamedTuple):
+    """Every loaded shard; swapped as a whole on reload."""
+    shards: Dict[str, Resources]
+    version: str  # all shard versions combined (answer-cache keys)
+
+
+class Retrieval(NamedTuple):
+    vector: Optional[np.ndarray]  # normalized query vector (None = answered from BM25 alone)
+    chunks: List[Dict[str, Any]]
+    version: str  # index version the chunks were searched in
+
+
+_res: Optional[IndexSet] = None
+_res_lock = threading.Lock()  # serializes loads; readers never take it
+_search_knobs: Tuple[int, int] = (EF_SEARCH, NPROBE)  # kept across reloads
+_reloads: Dict[str, Any] = {"count": 0, "failed": 0, "last_error": "", "last_ms": 0.0}
+_retrieval_counts: Dict[str, int] = {"dense": 0, "hybrid": 0, "lexical_only": 0, "merged_chunks": 0}
 
-_docs: List[Any] | None = None
-_index: faiss.Index | None = None
+_backend = get_backend()
+_embed_cache = EmbeddingCache(
+    EMBED_CACHE_SIZE,
+    Path(EMBED_CACHE_PATH) if EMBED_CACHE_PATH else None,
+)
 
-_client = OpenAI()
+def _fingerprint(*paths: Path) -> str:
+    """Cheap version id for the on-disk index: changes whenever a rebuild rewrites the files."""
+    h = hashlib.sha1()
+    for p in paths:
+        st = p.stat()
+        h.update(f"{p.name}:{st.st_size}:{st.st_mtime_ns};".encode("utf-8"))
+    return h.hexdigest()[:16]
 
-def _load_resources() -> None:
-    global _docs, _index
-    if _docs is not None and _index is not None:
-        return
+def _combined(versions: Dict[str, str]) -> str:
+    if list(versions) == [""]:
+        return versions[""]  # unsharded: the index's own fingerprint
+    h = hashlib.sha1("".join(f"{n}={v};" for n, v in sorted(versions.items())).encode("utf-8"))
+    return h.hexdigest()[:16]
 
-    if not DOCS_PATH.exists():
-        raise FileNotFoundError(f"Docs file not found: {DOCS_PATH}")
-    if not FAISS_PATH.exists():
-        raise FileNotFoundError(f"FAISS index not found: {FAISS_PATH}")
+def _store_path(files: ShardFiles) -> Path:
+    if files.chunks.exists() or files is not _UNSHARDED or not DOCS_PATH.exists():
+        return files.chunks
+    return DOCS_PATH  # legacy docs.pkl, unsharded only
 
-    with open(DOCS_PATH, "rb") as f:
-        _docs = pickle.load(f)
+def _shard_version(name: str) -> str:
+    files = shard_files(name, _UNSHARDED)
+    return _fingerprint(files.faiss, _store_path(files))
 
-    _index = faiss.read_index(str(FAISS_PATH))
+def disk_version() -> str:
+    """Fingerprint of the files on disk now (differs from index_version() once a rebuild lands)."""
+    return _combined({name: _shard_version(name) for name in shard_names()})
 
-def _to_text(doc: Any) -> str:
-    # supports either str docs OR dict docs from older pipelines
-    if isinstance(doc, str):
-        return doc
-    if isinstance(doc, dict):
-        for k in ("text", "content", "chunk", "page_content"):
-            v = doc.get(k)
-            if isinstance(v, str):
-                return v
-        return str(doc)
-    return str(doc)
+def _check(files: ShardFiles, docs: Any, index: faiss.Index, reference: Optional[Resources]) -> List[str]:
+    """Reasons the files cannot be served together (empty = OK)."""
+    problems = []
+    if int(index.ntotal) != len(docs):
+        problems.append(f"index has {index.ntotal} vectors but the chunk store {len(docs)} chunks")
+    manifest = read_manifest(files.faiss)
+    for where, meta in (("index manifest", manifest), ("chunk store", docs.header)):
+        model = meta.get("embed_model")
+        if model and model != EMBED_MODEL:
+            problems.append(f"{where} was built with {model}, queries use {EMBED_MODEL}")
+        # builds from before backends were pluggable used the OpenAI API
+        backend = meta.get("embed_backend") or ("openai" if model else "")
+        if backend and backend != _backend.name:
+            problems.append(f"{where} was built with the {backend} backend, queries use {_backend.name}")
+    if manifest.get("dim") and int(manifest["dim"]) != int(index.d):
+        problems.append(f"index dim {index.d} != manifest dim {manifest['dim']}")
+    if _backend.dim and int(index.d) != _backend.dim:
+        problems.append(f"index dim {index.d} != {_backend.name} embedding dim {_backend.dim}")
+    # one query vector is searched in every shard, old and new
+    if reference is not None and int(index.d) != int(reference.index.d):
+        problems.append(f"index dim {index.d} != serving dim {reference.index.d}")
+    return problems
+
+def _open_resources(name: str, reference: Optional[Resources] = None, strict: bool = False) -> Resources:
+    files = shard_files(name, _UNSHARDED)
+    if not files.faiss.exists():
+        raise FileNotFoundError(f"FAISS index not found: {files.faiss}")
+
+    version = _shard_version(name)
+    docs = open_store(files.chunks, DOCS_PATH if files is _UNSHARDED else files.chunks)
+    index = _read_index(files.faiss)
+    problems = [f"{name}: {p}" if name else p for p in _check(files, docs, index, reference)]
+    if problems and strict:
+        raise ValueError("; ".join(problems))
+    for problem in problems:
+        logger.warning("Index check: %s", problem)
+    bm25 = load_bm25(files.bm25) if HYBRID else None
+    if bm25 is not None and len(bm25) != len(docs):
+        logger.warning("Ignoring %s: %d docs vs %d chunks (stale build?)", files.bm25, len(bm25), len(docs))
+        bm25 = None
+    params = set_search_params(index, *_search_knobs)
+    if _shard_version(name) != version:
+        raise RuntimeError(f"index files of shard {name!r} changed while loading")
+    return Resources(name, docs, index, bm25, version, params, time.time())
+
+def _open_all(old: Optional[IndexSet] = None, strict: bool = False,
+              force: bool = False) -> Tuple[IndexSet, List[Resources]]:
+    """A new IndexSet (reusing unchanged shards of `old`) and the shards actually (re)loaded."""
+    shards: Dict[str, Resources] = {}
+    opened: List[Resources] = []
+    for name in shard_names():
+        prev = old.shards.get(name) if old is not None else None
+        if prev is not None and not force and _shard_version(name) == prev.version:
+            shards[name] = prev
+            continue
+        reference = prev or next(iter(shards.values()), None)
+        res = _open_resources(name, reference, strict)
+        shards[name] = res
+        opened.append(res)
+    return IndexSet(shards, _combined({n: r.version for n, r in shards.items()})), opened
+
+def _resources() -> IndexSet:
+    """The serving handles (loaded on first use)."""
+    global _res
+    res = _res
+    if res is None:
+        with _res_lock:
+            if _res is None:
+                _res = _open_all()[0]
+            res = _res
+    return res
+
+def _warm(res: Resources, queries: int = 8) -> None:
+    """Touch the new index and chunk pages before it takes traffic."""
+    rng = np.random.default_rng(0)
+    q = rng.standard_normal((queries, int(res.index.d))).astype("float32")
+    faiss.normalize_L2(q)
+    _, idxs = res.index.search(q, 10)
+    for label in idxs.ravel():
+        if label >= 0:
+            res.docs.text(res.docs.row(int(label)))
+
+def reload_resources(force: bool = False) -> Dict[str, Any]:
+    """
+    Load changed shards (index + chunk store) from disk into new handles,
+    check them (vector count = chunk count, embedding model, dimension),
+    warm them, and swap the whole set in. Requests already running finish
+    on the old handles. On any error the serving set is kept and the error
+    is raised. No-op when no file has changed (unless force).
+    """
+    global _res
+    with _res_lock:
+        old = _res
+        if old is not None and not force and disk_version() == old.version:
+            return {"reloaded": False, "version": old.version}
+        t0 = time.perf_counter()
+        try:
+            new, opened = _open_all(old, strict=True, force=force)
+            for res in opened:
+                _warm(res)
+        except Exception as e:
+            _reloads["failed"] += 1
+            _reloads["last_error"] = str(e)
+            raise
+        _res = new
+        ms = (time.perf_counter() - t0) * 1000.0
+        _reloads["count"] += 1
+        _reloads["last_ms"] = round(ms, 1)
+        _reloads["last_error"] = ""
+    logger.info("Reloaded index %s -> %s (%s) in %.0f ms", old.version if old else "-", new.version,
+                ", ".join(f"{r.name or 'index'}: {len(r.docs)} chunks" for r in opened), ms)
+    return {"reloaded": True, "version": new.version, "previous": old.version if old else "",
+            "shards": {r.name: len(r.docs) for r in opened}, "ms": round(ms, 1)}
+
+def _read_index(path: Path) -> faiss.Index:
+    if FAISS_MMAP:
+        # IO_FLAG_MMAP_IFC maps flat codes zero-copy (faiss >= 1.8); older
+        # builds only honour IO_FLAG_MMAP for on-disk IVF lists.
+        flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        try:
+            return faiss.read_index(str(path), flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            pass
+    return faiss.read_index(str(path))
+
+def load_resources() -> None:
+    """Eagerly load the index + chunk store and the embedding backend (startup / pre-fork)."""
+    _resources()
+    _backend.load()
+
+def index_version() -> str:
+    """Fingerprint of the loaded faiss.index + chunk store of every shard (used in answer-cache keys)."""
+    return _resources().version
+
+def configure_search(ef_search: int = 0, nprobe: int = 0) -> Dict[str, int]:
+    """Change efSearch (HNSW) / nprobe (IVF) on every loaded index; 0 leaves a knob as is."""
+    global _res, _search_knobs
+    with _res_lock:
+        loaded = _res if _res is not None else _open_all()[0]
+        _search_knobs = (ef_search or _search_knobs[0], nprobe or _search_knobs[1])
+        shards = {
+            name: res._replace(search_params=set_search_params(res.index, ef_search, nprobe))
+            for name, res in loaded.shards.items()
+        }
+        _res = loaded._replace(shards=shards)
+        return next(iter(shards.values())).search_params
+
+def _shard_info(res: Resources) -> Dict[str, Any]:
+    return {
+        "type": describe(res.index),
+        "ntotal": int(res.index.ntotal),
+        "dim": int(res.index.d),
+        "search_params": dict(res.search_params),
+        "version": res.version,
+        "loaded_at": res.loaded_at,
+        "manifest": read_manifest(shard_files(res.name, _UNSHARDED).faiss),
+    }
+
+def index_info() -> Dict[str, Any]:
+    """Loaded index type, size and search knobs, the builder's manifest (per shard when sharded) and the embedding backend."""
+    loaded = _resources()
+    info: Dict[str, Any] = {"version": loaded.version, "reloads": dict(_reloads), "embedding": _backend.describe()}
+    if list(loaded.shards) == [""]:
+        info.update(_shard_info(loaded.shards[""]))
+    else:
+        info["shards"] = {name: _shard_info(res) for name, res in loaded.shards.items()}
+    return info
+
+def _observe_embed(out: Embeddings, seconds: float) -> None:
+    metrics.EMBED_SECONDS.observe(seconds)
+    metrics.record_usage("embeddings", out)
+
+def _embed(texts: List[str]) -> Embeddings:
+    try:
+        return _backend.embed(texts)
+    except OpenAIError:
+        metrics.openai_error("embeddings")
+        raise
+
+async def _aembed(texts: List[str]) -> Embeddings:
+    try:
+        return await _backend.aembed(texts)
+    except OpenAIError:
+        metrics.openai_error("embeddings")
+        raise
+
+def _timed_search(res: Resources, q: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    t0 = time.perf_counter()
+    scores, idxs = res.index.search(q, k)
+    metrics.SEARCH_SECONDS.observe(time.perf_counter() - t0)
+    return scores, idxs
 
 def _embed_query(text: str) -> np.ndarray:
-    # OpenAI Embeddings API :contentReference[oaicite:2]{index=2}
     text = text[:4000]  # safety cap
-    resp = _client.embeddings.create(
-        model=EMBED_MODEL,
-        input=text
-    )
-    vec = np.array(resp.data[0].embedding, dtype="float32")
-    # If you built the index with normalized vectors, normalize queries too
-    faiss.normalize_L2(vec.reshape(1, -1))
+    vec = _embed_cache.get(_backend.key, text)
+    if vec is not None:
+        return vec
+
+    t0 = time.perf_counter()
+    out = _embed([text])
+    _observe_embed(out, time.perf_counter() - t0)
+    vec = out.vectors[0]
+    _embed_cache.put(_backend.key, text, vec, (time.perf_counter() - t0) * 1000.0, out.prompt_tokens)
+    return vec
+
+async def _aembed_query(text: str) -> np.ndarray:
+    text = text[:4000]  # safety cap
+    vec = await _embed_cache.aget(_backend.key, text)
+    if vec is not None:
+        return vec
+
+    t0 = time.perf_counter()
+    out = await _aembed([text])
+    _observe_embed(out, time.perf_counter() - t0)
+    vec = out.vectors[0]
+    _embed_cache.put(_backend.key, text, vec, (time.perf_counter() - t0) * 1000.0, out.prompt_tokens)
     return vec
 
-def retrieve_context(query: str, top_k: int = 8) -> List[Dict[str, Any]]:
-    _load_resources()
-    assert _docs is not None and _index is not None
+def embedding_cache_stats() -> Dict[str, Any]:
+    return _embed_cache.stats()
+
+def close_embedding_cache() -> None:
+    """Write the queued query vectors to the sqlite tier (shutdown)."""
+    _embed_cache.close()
+
+def _candidates(res: Resources, top_k: int) -> int:
+    # fusion and MMR need some depth beyond top_k to reorder anything
+    return top_k * 2 if res.bm25 is not None or MMR_LAMBDA < 1.0 else top_k
 
-    q = _embed_query(query).reshape(1, -1)
-    scores, idxs = _index.search(q, top_k)
+def _search(res: Resources, q: np.ndarray, top_k: int, query: Optional[str] = None) -> List[Dict[str, Any]]:
+    scores, idxs = _timed_search(res, q.reshape(1, -1), _candidates(res, top_k))
+    return _finish(res, query, _collect(res, scores[0], idxs[0]), top_k)
 
+def _result(res: Resources, label: int, score: float) -> Dict[str, Any]:
+    i = res.docs.row(label)  # FAISS id -> chunk row (identity for row-addressed stores)
+    r = {"id": label, "text": res.docs.text(i), "score": score, **res.docs.meta(i)}
+    if res.name:
+        r["shard"] = res.name  # ids are only unique within a shard
+    return r
+
+def _collect(res: Resources, scores: np.ndarray, idxs: np.ndarray) -> List[Dict[str, Any]]:
     results: List[Dict[str, Any]] = []
-    for score, idx in zip(scores[0], idxs[0]):
+    for score, idx in zip(scores, idxs):
         if idx < 0 or score < MIN_SCORE:
             continue
-        doc = _docs[int(idx)]
-        results.append({"text": _to_text(doc), "score": float(score)})
+        results.append(_result(res, int(idx), float(score)))
     return results
+
+def _finish(res: Resources, query: Optional[str], dense: List[Dict[str, Any]],
+            top_k: int) -> List[Dict[str, Any]]:
+    """
+    Fuse dense results with BM25 by reciprocal-rank fusion (when loaded).
+    "score" is always what the list is ordered by: cosine for dense-only,
+    the RRF score for fused results (with "dense" / "bm25" components).
+    """
+    if res.bm25 is None or query is None:
+        _retrieval_counts["dense"] += 1
+        return _diversify(res, dense, top_k)
+    _retrieval_counts["hybrid"] += 1
+
+    pool = _candidates(res, top_k)
+    lexical = {res.docs.label(row): score for row, score in res.bm25.search(query, pool)}
+    by_id = {r["id"]: r for r in dense}
+    results: List[Dict[str, Any]] = []
+    for label, fused in rrf([list(by_id), list(lexical)], RRF_K)[:pool]:
+        r = dict(by_id[label]) if label in by_id else _result(res, label, 0.0)
+        r["dense"] = by_id[label]["score"] if label in by_id else None
+        r["bm25"] = lexical.get(label)
+        r["score"] = fused
+        results.append(r)
+    return _diversify(res, results, top_k)
+
+def _result_vector(res: Resources, r: Dict[str, Any]) -> np.ndarray:
+    ids = np.asarray(r.get("ids") or [r["id"]], dtype="int64")
+    vec = res.index.reconstruct_batch(ids).mean(axis=0)
+    return vec / max(float(np.linalg.norm(vec)), 1e-12)
+
+def _within_budget(results: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+    """Results in order, skipping any that no longer fit a budget of top_k chunks."""
+    keep, budget = [], float(top_k)
+    for r in results:
+        cost = len(r.get("ids") or (r["id"],))
+        if cost <= budget:
+            keep.append(r)
+            budget -= cost
+    return keep
+
+def _diversify(res: Resources, results: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+    """
+    Merge overlapping hits, then MMR down to a budget of top_k chunks
+    (relevance = the list's own score, normalized).
+    """
+    if MERGE_CHUNKS:
+        n = len(results)
+        results = merge_overlapping(results)
+        _retrieval_counts["merged_chunks"] += n - len(results)
+    if MMR_LAMBDA >= 1.0 or len(results) <= 1:
+        return _within_budget(results, top_k)  # relevance order, same budget
+    try:
+        vecs = np.vstack([_result_vector(res, r) for r in results]).astype("float32")
+    except RuntimeError:  # index type without reconstruct support
+        return _within_budget(results, top_k)
+    cost = np.array([len(r.get("ids") or (r["id"],)) for r in results], dtype="float64")
+    scores = np.array([r["score"] for r in results], dtype="float32")
+    relevance = scores / scores.max() if scores.max() > 0 else np.ones_like(scores)
+    return [results[i] for i in mmr(relevance, vecs, top_k, MMR_LAMBDA, cost)]
+
+def _lexical_only(res: Resources, query: str, top_k: int) -> Optional[List[Dict[str, Any]]]:
+    """BM25 results for keyword-style exact-token queries; None = needs the dense path."""
+    if res.bm25 is None or not LEXICAL_ONLY_MAX_TERMS:
+        return None
+    if not res.bm25.is_exact_query(query, LEXICAL_ONLY_MAX_TERMS):
+        return None
+    hits = res.bm25.search(query, _candidates(res, top_k))
+    if not hits:
+        return None
+    _retrieval_counts["lexical_only"] += 1
+    return _diversify(res, [dict(_result(res, res.docs.label(row), score), bm25=score) for row, score in hits],
+                      top_k)
+
+def _merge(per_shard: List[List[Dict[str, Any]]], top_k: int) -> List[Dict[str, Any]]:
+    """
+    Combine the (already diversified) results of several shards by
+    reciprocal-rank fusion of their rankings, within one top_k-chunks
+    budget. Raw scores are not comparable across shards (cosine, RRF or
+    BM25, depending on the path each shard took), so only ranks are used;
+    "score" becomes the cross-shard RRF score and the shard's own score is
+    kept in "shard_score".
+    """
+    if len(per_shard) == 1:
+        return per_shard[0]
+    flat = [r for results in per_shard for r in results]
+    rankings, start = [], 0
+    for results in per_shard:
+        rankings.append(list(range(start, start + len(results))))
+        start += len(results)
+    merged = [dict(flat[i], shard_score=flat[i]["score"], score=fused) for i, fused in rrf(rankings, RRF_K)]
+    return _within_budget(merged, top_k)
+
+def _selected(loaded: IndexSet, shards: Optional[Sequence[str]], query: str) -> List[Resources]:
+    return [loaded.shards[name] for name in (route_query(query) if shards is None else shards)]
+
+def _lexical_all(selected: List[Resources], query: str, top_k: int) -> Optional[List[Dict[str, Any]]]:
+    """BM25-only results when every selected shard can answer the query lexically."""
+    per_shard = []
+    for res in selected:
+        lexical = _lexical_only(res, query, top_k)
+        if lexical is None:
+            return None
+        per_shard.append(lexical)
+    return _merge(per_shard, top_k)
+
+def retrieval_stats() -> Dict[str, Any]:
+    bm25 = [res.bm25 for res in _res.shards.values() if res.bm25 is not None] if _res is not None else []
+    return {
+        "hybrid": bool(bm25),
+        "bm25_docs": sum(len(b) for b in bm25),
+        "lexical_only_max_terms": LEXICAL_ONLY_MAX_TERMS,
+        "merge_chunks": MERGE_CHUNKS,
+        "mmr_lambda": MMR_LAMBDA,
+        "queries": dict(_retrieval_counts),
+    }
+
+def retrieve_context(query: str, top_k: int = RETRIEVE_TOP_K, shards: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Top chunks for `query` from the given shards (None = route by the
+    question itself, see rag/shards.py).
+    """
+    selected = _selected(_resources(), shards, query)
+    lexical = _lexical_all(selected, query, top_k)
+    if lexical is not None:
+        return lexical
+    vec = _embed_query(query)
+    return _merge([_search(res, vec, top_k, query) for res in selected], top_k)
+
+async def aretrieve_context(query: str, top_k: int = RETRIEVE_TOP_K,
+                            shards: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Non-blocking variant for the request path: the embedding is awaited on
+    the backend (shared AsyncOpenAI client, or a worker thread for onnx). The FAISS search itself stays inline
+    (sub-millisecond on this index size).
+    """
+    return (await aretrieve_with_vector(query, top_k, shards))[1]
+
+async def aretrieve_with_vector(
+    query: str, top_k: int = RETRIEVE_TOP_K, shards: Optional[Sequence[str]] = None,
+) -> Retrieval:
+    """
+    aretrieve_context that also hands back the normalized query vector
+    and the version of the index set that was searched. The handles are
+    taken once, so a hot reload while the query waits (embedding call,
+    batching window) cannot mix versions.
+    """
+    loaded = _resources()
+    selected = _selected(loaded, shards, query)
+    lexical = _lexical_all(selected, query, top_k)
+    if lexical is not None:
+        return Retrieval(None, lexical, loaded.version)
+
+    if _batcher is not None:
+        text = query[:4000]  # safety cap
+        vec = await _embed_cache.aget(_backend.key, text)
+        if vec is None:
+            vec, chunks = await _batcher.submit(text, top_k, selected)
+            return Retrieval(vec, chunks, loaded.version)
+    else:
+        vec = await _aembed_query(query)
+    return Retrieval(vec, _merge([_search(res, vec, top_k, query) for res in selected], top_k), loaded.version)
+
+
+# -----------------------------
+# Micro-batching
+# -----------------------------
+
+class _QueryBatcher:
+    """
+    Coalesces concurrent embedding misses. The first miss opens a window of
+    `window_ms`; everything submitted until it closes (or until `max_batch`
+    is reached) is embedded with one API call (identical normalized texts
+    are sent once) and searched with one index.search per shard over the
+    stacked query matrix. Each awaiting request gets its own (vec, results) back.
+    Requests bring the shard handles they took before waiting, so a reload
+    inside the window does not change what they search.
+    """
+
+    def __init__(self, window_ms: float, max_batch: int) -> None:
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._pending: List[Tuple[str, int, List[Resources], asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: Set[asyncio.Task] = set()  # running batches (the loop only keeps weak refs)
+        self.batches = 0
+        self.queries = 0
+        self.api_inputs = 0
+
+    async def submit(self, text: str, top_k: int,
+                     shards: List[Resources]) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        loop = asyncio.get_running_loop()
+        fut: asyncio.Future = loop.create_future()
+        self._pending.append((text, top_k, shards, fut))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, int, List[Resources], asyncio.Future]]) -> None:
+        try:
+            # One API input per distinct normalized text
+            keys = [normalize_query(t) for t, _, _, _ in batch]
+            uniq: Dict[str, str] = {}
+            for k, (t, _, _, _) in zip(keys, batch):
+                uniq.setdefault(k, t)
+            texts = list(uniq.values())
+
+            t0 = time.perf_counter()
+            out = await _aembed(texts)
+            api_ms = (time.perf_counter() - t0) * 1000.0
+            _observe_embed(out, api_ms / 1000.0)
+
+            mat = out.vectors
+            tokens = out.prompt_tokens
+            row_of = {k: i for i, k in enumerate(uniq)}
+            for k, t in uniq.items():
+                # spread the call's cost across its inputs for the saved-cost estimate
+                _embed_cache.put(_backend.key, t, mat[row_of[k]], api_ms / len(texts), tokens // len(texts))
+
+            q = mat[[row_of[k] for k in keys]]
+            # one search per shard handle, over the rows of the queries routed to it
+            handles = {(res.name, res.version): res for _, _, selected, _ in batch for res in selected}
+            found: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray, Dict[int, int]]] = {}
+            for key, res in handles.items():
+                rows = [row for row, (_, _, selected, _) in enumerate(batch)
+                        if any((r.name, r.version) == key for r in selected)]
+                max_k = max(batch[row][1] for row in rows)
+                scores, idxs = _timed_search(res, q[rows], _candidates(res, max_k))
+                found[key] = (scores, idxs, {row: i for i, row in enumerate(rows)})
+
+            self.batches += 1
+            self.queries += len(batch)
+            self.api_inputs += len(texts)
+            for row, (text, top_k, selected, fut) in enumerate(batch):
+                if not fut.done():
+                    per_shard = []
+                    for res in selected:
+                        scores, idxs, at = found[(res.name, res.version)]
+                        n = _candidates(res, top_k)
+                        dense = _collect(res, scores[at[row]][:n], idxs[at[row]][:n])
+                        per_shard.append(_finish(res, text, dense, top_k))
+                    fut.set_result((q[row], _merge(per_shard, top_k)))
+        except Exception as e:
+            for _, _, _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "queries": self.queries,
+            "api_inputs": self.api_inputs,
+            "avg_batch": round(self.queries / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+_batcher: _QueryBatcher | None = None
+
+def configure_batching(window_ms: float, max_batch: int) -> None:
+    """(Re)configure the async micro-batcher; window_ms <= 0 disables it."""
+    global _batcher
+    _batcher = _QueryBatcher(window_ms, max_batch) if window_ms > 0 else None
+
+def batching_stats() -> Dict[str, Any]:
+    return _batcher.stats() if _batcher is not None else {"window_ms": 0.0}
+
+configure_batching(EMBED_BATCH_WINDOW_MS, EMBED_BATCH_MAX)
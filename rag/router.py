@@ -1,54 +1,254 @@
 from fastapi import APIRouter, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from rag.llm import ask_llm
-from rag.retriever import retrieve_context
+from rag.llm import aask_llm, astream_llm, pack_chunks, LLM_MODEL, SYSTEM_PROMPT_HASH
+from rag.retriever import RETRIEVE_TOP_K, aretrieve_with_vector, index_version
 from rag.formatting.markdown import format_markdown_safe
 
+from rag import metrics
+from rag.cache import AnswerCache, SemanticAnswerCache
+from rag.context import PackedContext
+from rag.faq import match_faq
+from rag.timing import StageTimer
+
+from rag.routing.intents import classify
+from rag.shards import SHARDS, pick_shards
 from rag.routing.policy import (
     route_early,
     route_intake,
     route_policy_logistics,
     route_requirement_or_suitability,
     pick_rag_fallback,
+    is_suitability_question,
+    policy_logistics_needs_context,
+    requirement_needs_context,
+    query_intent,
 )
 
+import json
+import logging
+import os
 import re
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Full-answer cache in front of the LLM stage (0 disables)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))  # seconds
+
+# Near-duplicate tier: reuse an answer when a past question's embedding is
+# at least this cosine-similar (and has the same routing intent).
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1024"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+
+_answer_cache = AnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL)
+_semantic_cache = SemanticAnswerCache(SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD, ANSWER_CACHE_TTL)
+
+
+def answer_cache_stats() -> Dict[str, Any]:
+    return _answer_cache.stats()
+
+
+def semantic_cache_stats() -> Dict[str, Any]:
+    return _semantic_cache.stats()
+
 
 # -----------------------------
 # Helpers
 # -----------------------------
 
-def is_suitability_question(q: str) -> bool:
-    q = (q or "").lower()
-    return any(p in q for p in [
-        "am i suitable",
-        "will i be suitable",
-        "would i be suitable",
-        "is edi suitable",
-        "suitable for me",
-        "fit for edi",
-        "good fit",
-        "good candidate",
-        "do i stand a chance",
-        "chance of admission",
-        "should i apply",
-    ])
+_LIST_AFTER_COLON_RE = re.compile(r":\s*(\d+\.)\s+\*\*", re.IGNORECASE)
+_INLINE_LIST_ITEM_RE = re.compile(r"(?<!\n)\s+(\d+\.)\s+\*\*")
+_EXTRA_NEWLINES_RE = re.compile(r"\n{3,}")
 
 
 def normalize_inline_numbered_lists(text: str) -> str:
+    # Runs after format_markdown_safe, which re-joins "\n\n1. **" onto the
+    # previous line ("\n\n(?=[a-z0-9])"); this splits such items out again.
     if not text:
         return text
 
-    text = re.sub(r":\s*(\d+\.)\s+\*\*", r":\n\n\1 **", text, flags=re.IGNORECASE)
-    text = re.sub(r"(?<!\n)\s+(\d+\.)\s+\*\*", r"\n\n\1 **", text)
-    text = re.sub(r"\n{3,}", "\n\n", text)
+    text = _LIST_AFTER_COLON_RE.sub(r":\n\n\1 **", text)
+    text = _INLINE_LIST_ITEM_RE.sub(r"\n\n\1 **", text)
+    text = _EXTRA_NEWLINES_RE.sub("\n\n", text)
     return text
 
 
+class LazyContext:
+    """
+    Retrieval stage for one request. Embeds + searches only the first time a
+    downstream stage asks for context_chunks; later calls reuse the result.
+    """
+
+    def __init__(self, q: str, timer: StageTimer, top_k: int = RETRIEVE_TOP_K, shards: Tuple[str, ...] = ("",)) -> None:
+        self._q = q
+        self._timer = timer
+        self._top_k = top_k
+        self.shards = shards  # index shards this question is searched in
+        self._chunks: Optional[List[Dict[str, Any]]] = None
+        self.qvec: Any = None  # query embedding, set once retrieval has run
+        self.version = ""  # index version the chunks came from
+
+    async def get(self) -> List[Dict[str, Any]]:
+        if self._chunks is None:
+            # the version the search actually used, so a hot reload mid-request
+            # cannot pair new chunk ids with the old version in cache keys
+            with self._timer.stage("retrieve"):
+                self.qvec, self._chunks, self.version = await aretrieve_with_vector(
+                    self._q, top_k=self._top_k, shards=self.shards)
+        return self._chunks
+
+
+def _format(text: str, timer: StageTimer) -> str:
+    with timer.stage("format"):
+        t0 = time.perf_counter()
+        out = format_markdown_safe(text)
+        metrics.FORMAT_SECONDS.observe(time.perf_counter() - t0)
+        return out
+
+
+def _respond(answer: str, timer: StageTimer) -> JSONResponse:
+    metrics.observe_stages(timer.stages)
+    return JSONResponse(
+        {"answer": answer},
+        headers={"Server-Timing": timer.server_timing()},
+    )
+
+
+class LLMJob:
+    """Everything the LLM stage needs once routing and the caches have missed."""
+
+    def __init__(self, q: str, context: PackedContext, cache_key: Any,
+                 intent: str, qvec: Any, version: str) -> None:
+        self.q = q
+        self.context = context
+        self.chunks = context.chunks
+        self.cache_key = cache_key
+        self.intent = intent
+        self.qvec = qvec
+        self.version = version
+
+    def store(self, answer: str) -> None:
+        # an answer built on a replaced index would only be evicted again
+        if answer.strip() and self.version == index_version():
+            _answer_cache.put(self.cache_key, answer)
+            if self.qvec is not None:
+                _semantic_cache.put(self.qvec, self.intent, answer, self.version)
+
+
+def _final_fallback(q: str, answer: str) -> str:
+    metrics.route_outcome("llm" if answer.strip() else "fallback")
+    # 5) Suitability fallback ONLY if LLM failed
+    if is_suitability_question(q) and not answer.strip():
+        answer = pick_rag_fallback(q)
+
+    # 6) Final generic fallback
+    if not answer.strip():
+        answer = pick_rag_fallback(q)
+    return answer
+
+
+async def _route(q: str, timer: StageTimer, programme: str = "") -> Tuple[Optional[str], Optional[LLMJob]]:
+    """
+    Deterministic routers + answer caches. Returns (answer, None) when the
+    question is answered here, else (None, job) for the LLM stage.
+    `programme` (optional, from the payload) names the index shard to search.
+    """
+    # one scan of the question; every router below reads this set
+    with timer.stage("classify"):
+        intents = classify(q)
+    ctx = LazyContext(q, timer, top_k=RETRIEVE_TOP_K, shards=pick_shards(intents, programme))
+
+    # 0) Early exits (greetings, thanks, etc.) — no retrieval needed
+    with timer.stage("route_early"):
+        r = route_early(q, intents, programmes=SHARDS)
+    if r:
+        metrics.route_outcome("route_early")
+        return _format(r, timer), None
+
+    with timer.stage("route_intake"):
+        r = route_intake(q, intents)
+    if r:
+        metrics.route_outcome("route_intake")
+        return _format(r, timer), None
+
+    # 1) Policy / logistics (visa, immigration, Student’s Pass) — HARD STOP
+    chunks = await ctx.get() if policy_logistics_needs_context(q, intents) else []
+    with timer.stage("route_policy"):
+        r = route_policy_logistics(q, chunks, intents)
+    if r:
+        metrics.route_outcome("policy")
+        return _format(r, timer), None
+
+    # 2) Requirement vs suitability
+    chunks = await ctx.get() if requirement_needs_context(q, intents) else []
+    with timer.stage("route_requirement"):
+        rs = route_requirement_or_suitability(q, chunks, intents)
+    if rs:
+        kind, payload = rs
+        if kind == "direct" and not is_suitability_question(q, intents):
+            metrics.route_outcome("requirement")
+            return _format(payload, timer), None
+
+    chunks = await ctx.get()
+
+    # 3) Official FAQ answer when the query embedding matches an FAQ question
+    #    (not for suitability questions, or keyword queries that were never embedded)
+    if ctx.qvec is not None and not is_suitability_question(q, intents):
+        with timer.stage("faq"):
+            hit = match_faq(ctx.qvec, ctx.shards)
+        if hit is not None:
+            metrics.route_outcome("faq")
+            return _format(hit[0].answer, timer), None
+
+    # 4) LLM (always used for suitability questions), behind the answer cache
+    version = ctx.version
+    cache_key = AnswerCache.key(
+        q,
+        # merged hits list all members; ids are per shard
+        [(c.get("shard", ""),) + tuple(c.get("ids") or (c.get("id"),)) for c in chunks],
+        f"{LLM_MODEL}:{SYSTEM_PROMPT_HASH}",
+        version,
+    )
+    with timer.stage("answer_cache"):
+        cached = _answer_cache.get(cache_key)
+    if cached is not None:
+        metrics.route_outcome("cache")
+        return cached, None
+
+    # Suitability answers address the user's own background, so they are
+    # never reused for a merely similar question.
+    intent = "suitability" if is_suitability_question(q, intents) else query_intent(q, intents)
+    if SHARDS:
+        intent = f"{intent}@{'+'.join(ctx.shards)}"  # same question, other programme = other answer
+    qvec = ctx.qvec if intent != "suitability" else None
+    if qvec is not None:
+        with timer.stage("semantic_cache"):
+            cached = _semantic_cache.get(qvec, intent, version)
+        if cached is not None:
+            metrics.route_outcome("cache")
+            return cached, None
+
+    # The cache key covers every retrieved chunk; the prompt only what fits the budget.
+    with timer.stage("pack"):
+        context = pack_chunks(chunks)
+    timer.note("ctx_tokens", context.tokens)
+    return None, LLMJob(q, context, cache_key, intent, qvec, version)
+
+
+def _question(payload: Dict[str, Any]) -> str:
+    return (payload.get("question") or payload.get("query") or "").strip()
+
+
+def _programme(payload: Dict[str, Any]) -> str:
+    p = payload.get("programme") or payload.get("program") or ""
+    return p.strip() if isinstance(p, str) else ""
+
+
 # -----------------------------
 # Main endpoint
 # -----------------------------
@@ -56,45 +256,95 @@ def normalize_inline_numbered_lists(text: str) -> str:
 @router.post("/ask")
 async def ask(request: Request):
     payload = await request.json()
-    q = (payload.get("question") or payload.get("query") or "").strip()
+    q = _question(payload)
 
     if not q:
+        metrics.route_outcome("fallback")
         return JSONResponse({"answer": pick_rag_fallback("")})
 
-    # Retrieve once; reuse everywhere
-    context_chunks = retrieve_context(q, top_k=10)
+    timer = StageTimer()
+    answer, job = await _route(q, timer, _programme(payload))
+    if job is None:
+        return _respond(answer, timer)
 
-    # 0) Early exits (greetings, thanks, etc.)
-    r = route_early(q)
-    if r:
-        return JSONResponse({"answer": format_markdown_safe(r)})
+    with timer.stage("llm"):
+        answer = await aask_llm(q, job.chunks)
+    with timer.stage("format"):
+        answer = normalize_inline_numbered_lists(answer)
+    job.store(answer)
 
-    r = route_intake(q)
-    if r:
-        return JSONResponse({"answer": format_markdown_safe(r)})
+    return _respond(_final_fallback(q, answer), timer)
 
-    # 1) Policy / logistics (visa, immigration, Student’s Pass) — HARD STOP
-    r = route_policy_logistics(q, context_chunks)
-    if r:
-        return JSONResponse({"answer": format_markdown_safe(r)})
 
-    # 2) Requirement vs suitability
-    rs = route_requirement_or_suitability(q, context_chunks)
-    if rs:
-        kind, payload = rs
-        if kind == "direct" and not is_suitability_question(q):
-            return JSONResponse({"answer": format_markdown_safe(payload)})
+# -----------------------------
+# Streaming endpoint (SSE)
+# -----------------------------
 
-    # 3) LLM (always used for suitability questions)
-    answer = ask_llm(q, context_chunks)
-    answer = normalize_inline_numbered_lists(answer)
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-    # 4) Suitability fallback ONLY if LLM failed
-    if is_suitability_question(q) and not answer.strip():
-        answer = pick_rag_fallback(q)
 
-    # 5) Final generic fallback
-    if not answer.strip():
-        answer = pick_rag_fallback(q)
+@router.post("/ask/stream")
+async def ask_stream(request: Request):
+    """
+    Same pipeline as /ask, as Server-Sent Events:
+      event: block  data: {"text": "<formatted markdown block>"}   (0..n)
+      event: done   data: {"answer": "<full answer>", "timings": {...}, "context": {...}}
+    Routed and cached answers arrive as a single block. If routing or the
+    LLM fails mid-stream, a fallback block (unless part of the answer was
+    already sent) and a done event with "error" still close the stream, so
+    the widget never retries the question on /ask.
+    """
+    payload = await request.json()
+    q = _question(payload)
+
+    async def events() -> AsyncIterator[str]:
+        timer = StageTimer()
+        job: Optional[LLMJob] = None
+        parts: List[str] = []
+        error = ""
+        try:
+            if not q:
+                metrics.route_outcome("fallback")
+                answer: Optional[str] = pick_rag_fallback("")
+            else:
+                answer, job = await _route(q, timer, _programme(payload))
+
+            if job is None:
+                yield _sse("block", {"text": answer})
+            else:
+                with timer.stage("llm"):
+                    async for block in astream_llm(q, job.chunks):
+                        block = normalize_inline_numbered_lists(block)
+                        parts.append(block)
+                        yield _sse("block", {"text": block})
+                answer = "".join(parts)
+                job.store(answer)
+                if not answer.strip():
+                    answer = _final_fallback(q, answer)
+                    yield _sse("block", {"text": answer})
+                else:
+                    metrics.route_outcome("llm")
+        except Exception as e:
+            logger.exception("/ask/stream failed")
+            metrics.route_outcome("fallback")
+            error = type(e).__name__
+            answer = "".join(parts)  # a partial answer is kept, never cached
+            if not answer.strip():
+                answer = pick_rag_fallback(q)
+                yield _sse("block", {"text": answer})
+
+        metrics.observe_stages(timer.stages)
+        timings = dict(timer.stages, total=timer.total_ms())
+        done: Dict[str, Any] = {"answer": answer, "timings": {k: round(v, 2) for k, v in timings.items()}}
+        if job is not None:
+            done["context"] = job.context.report()
+        if error:
+            done["error"] = error
+        yield _sse("done", done)
 
-    return JSONResponse({"answer": answer})
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
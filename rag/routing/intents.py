@@ -0,0 +1,237 @@
+# rag/routing/intents.py
+"""
+Single-pass intent classifier for the routing policy.
+
+Every intent in patterns.py is decomposed into keyword atoms, and all atoms
+are compiled into ONE regex. classify() scans the question once and returns
+the set of matched intents; policy.py then applies its ordering to that set
+instead of re-running each pattern per router.
+
+Scan layout: atoms starting with \b are grouped by their two-char prefix
+and nested by character under one leading \b, so the regex only tries
+atoms at word starts whose first letters fit. Within a prefix every atom is
+an optional lookahead with its own named group, so overlapping atoms (e.g.
+"apply" and "apply by", or "visa" in both VISA and LOGISTICS) are all
+reported. Atoms without \b are plain substrings, checked with `in`.
+
+Patterns that are not plain keyword lists (anchored greetings, the
+"^when/what/..." prefix, "is .* mandatory", the visa-process co-occurrence)
+are gated: the original pattern from patterns.py only runs when every gate
+group matched, so the result is exactly what the per-pattern checks give.
+"""
+from __future__ import annotations
+
+import re
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Pattern, Sequence, Set, Tuple
+
+from . import patterns as P
+
+
+class _Intent(NamedTuple):
+    atoms: Sequence[str]  # any match => intent
+    gates: Sequence[Sequence[str]] = ()  # every group needs a match before `verify` runs
+    verify: Optional[Pattern] = None
+
+
+# Atoms are read off the patterns in patterns.py, so the two cannot drift
+# apart (tests/test_intents.py and bench/bench_routing.py check that they
+# agree). Atoms starting with \b are regexes found by the scan; the others
+# are plain lower-case substrings. Gate atoms only need to be implied by the
+# pattern.
+
+def _split(src: str) -> List[str]:
+    """Top-level alternatives of a regex source."""
+    parts, depth, start = [], 0, 0
+    for i, c in enumerate(src):
+        if c == "\\" or (i and src[i - 1] == "\\"):
+            continue
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == "|" and depth == 0:
+            parts.append(src[start:i])
+            start = i + 1
+    return parts + [src[start:]]
+
+
+def _groups(src: str) -> List[str]:
+    """Contents of the top-level (...) groups of a regex source."""
+    found, depth, start = [], 0, 0
+    for i, c in enumerate(src):
+        if i and src[i - 1] == "\\":
+            continue
+        if c == "(":
+            depth += 1
+            if depth == 1:
+                start = i + 1
+        elif c == ")":
+            depth -= 1
+            if depth == 0:
+                found.append(src[start:i])
+    return found
+
+
+def _alternatives(pattern: Pattern) -> List[str]:
+    r"""The keywords of `\b(a|b)\b`, `^(a|b)\W*$`, `^\s*(a|b)\b` or `\ba\b|\bb\b`."""
+    groups = _groups(pattern.pattern)
+    alts = _split(groups[0]) if len(groups) == 1 else _split(pattern.pattern)
+    return [a.replace(r"\b", "") for a in alts]
+
+
+def _literal(alt: str, scanned: bool) -> str:
+    """Longest literal run of a non-keyword alternative, as an atom it implies."""
+    pieces = re.split(r"\.\*|\\[sw][*+]?|[()?]", alt)
+    best = max(pieces, key=lambda x: len(x.strip()))
+    if scanned and alt.startswith(best):
+        return r"\b" + best.rstrip()
+    return best.strip()
+
+
+def _keywords(pattern: Pattern) -> List[str]:
+    """Scan atoms for the plain keyword alternatives (those without `.*`)."""
+    return [rf"\b{a}\b" for a in _alternatives(pattern) if ".*" not in a]
+
+
+def _gate(pattern: Pattern) -> List[str]:
+    """One atom per `.*` alternative; the pattern itself then confirms the match."""
+    return [_literal(a, scanned=True) for a in _alternatives(pattern) if ".*" in a]
+
+
+def _gated(pattern: Pattern, keywords: bool = True) -> _Intent:
+    if keywords:
+        return _Intent(_keywords(pattern), [_gate(pattern)], pattern)
+    # anchored: the whole question (or its start) is one of the words
+    return _Intent((), [[rf"\b{a}\b" for a in _alternatives(pattern)]], pattern)
+
+
+# visa term and process term in either order, on one line: one gate per side
+_VISA_TERMS, _PROCESS_TERMS = (
+    [_literal(a, scanned=False) for a in _split(g)] for g in _groups(_split(P.VISA_PROCESS_PATTERN.pattern)[0])
+)
+
+INTENTS: Dict[str, _Intent] = {
+    "greeting": _gated(P.GREETING_PATTERN, keywords=False),
+    "thanks": _gated(P.THANKS_PATTERN, keywords=False),
+    "praise": _gated(P.PRAISE_PATTERN, keywords=False),
+    "mdes": _Intent(_keywords(P.MDES_PATTERN)),
+    "overview": _Intent(_keywords(P.OVERVIEW_PATTERN)),
+    "requirement": _gated(P.REQUIREMENT_PATTERN),  # "is .* mandatory"
+    "wh_prefix": _gated(P.WH_PREFIX_PATTERN, keywords=False),
+    "suitability": _Intent(_keywords(P.SUITABILITY_PATTERN)),
+    "suitability_profile": _Intent(_keywords(P.SUITABILITY_PROFILE_PATTERN)),
+    # plain substrings
+    "suitability_question": _Intent(P.SUITABILITY_QUESTION_PHRASES),
+    "intake": _Intent(_keywords(P.INTAKE_PATTERN)),
+    "programme_start": _Intent(_keywords(P.PROGRAMME_START_PATTERN)),
+    "application_period": _Intent(_keywords(P.APPLICATION_PERIOD_PATTERN)),
+    "reapplication": _Intent(_keywords(P.REAPPLICATION_PATTERN)),
+    "offer_outcome": _gated(P.OFFER_OUTCOME_PATTERN),  # "what happens if.*accept"
+    "arrival": _Intent(_keywords(P.ARRIVAL_PATTERN)),
+    "visa": _Intent(_keywords(P.VISA_PATTERN)),
+    "visa_process": _Intent((), [_VISA_TERMS, _PROCESS_TERMS], P.VISA_PROCESS_PATTERN),
+    "logistics": _Intent(_keywords(P.LOGISTICS_PATTERN)),
+}
+
+Intents = FrozenSet[str]
+
+
+def _compile():
+    atoms: List[str] = []
+    for intent in INTENTS.values():
+        for a in list(intent.atoms) + [a for g in intent.gates for a in g]:
+            if a not in atoms:
+                atoms.append(a)
+
+    # \b-atoms are found by the scan, everything else is a plain substring
+    substrings = [(i, a, re.compile(re.escape(a), re.IGNORECASE)) for i, a in enumerate(atoms)
+                  if not a.startswith(r"\b")]
+    by_prefix: Dict[str, List[int]] = {}
+    for i, a in enumerate(atoms):
+        if a.startswith(r"\b"):
+            prefix = a[2:4]
+            if not re.fullmatch(r"[a-z0-9]{2}", prefix):
+                raise ValueError(f"scanned atom must start with two literal word chars: {a!r}")
+            by_prefix.setdefault(prefix, []).append(i)
+
+    # The scan only starts at word boundaries, and each branch begins with its
+    # literal two-char prefix, so most positions are rejected in C without
+    # trying any atom. A branch consumes its prefix only; no atom can start
+    # inside it (no word boundary there).
+    branches: Dict[str, List[str]] = {}  # first char -> alternatives for the second char
+    for prefix, members in by_prefix.items():
+        tries = "".join(f"(?:(?=(?P<a{i}>{atoms[i][4:]})))?" for i in members)
+        # fail the branch unless some atom matched
+        guard = "(?!)"
+        for i in reversed(members):
+            guard = f"(?(a{i})|{guard})"
+        branches.setdefault(prefix[0], []).append(f"{prefix[1]}{tries}{guard}")
+    # nested by character, so each position tests a handful of literals
+    alts = "|".join(f"{c}(?:{'|'.join(b)})" for c, b in branches.items())
+    # matched against the lower-cased question (cheaper than IGNORECASE);
+    # scan_i is the same scan for questions that are not plain ASCII
+    scan = re.compile(rf"\b(?:{alts})")
+    scan_i = re.compile(scan.pattern, re.IGNORECASE)
+
+    # group number of every atom -> (atom, group number) for all atoms of its branch
+    branch_of: Dict[int, List[Tuple[int, int]]] = {}
+    for members in by_prefix.values():
+        groups = [(i, scan.groupindex[f"a{i}"]) for i in members]
+        for _, g in groups:
+            branch_of[g] = groups
+
+    index = {a: i for i, a in enumerate(atoms)}
+    # atom -> intents it proves outright / gated intents it may unlock
+    exact: List[List[str]] = [[] for _ in atoms]
+    gated: List[List[str]] = [[] for _ in atoms]
+    for name, it in INTENTS.items():
+        for a in it.atoms:
+            exact[index[a]].append(name)
+        for a in it.gates[0] if it.gates else ():
+            gated[index[a]].append(name)
+    gates = {name: [frozenset(index[a] for a in g) for g in it.gates] for name, it in INTENTS.items() if it.gates}
+    return scan, scan_i, branch_of, substrings, exact, gated, gates
+
+
+_SCAN, _SCAN_I, _BRANCH_OF, _SUBSTRINGS, _EXACT, _GATED, _GATES = _compile()
+
+
+def _scanned(q: str, scan: Pattern) -> Set[int]:
+    hit = set()
+    for m in scan.finditer(q):
+        # lastindex is one of this branch's groups; check the others of the branch
+        for i, g in _BRANCH_OF[m.lastindex]:
+            if m.start(g) >= 0:
+                hit.add(i)
+    return hit
+
+
+def matched_atoms(q: str) -> FrozenSet[int]:
+    """Indexes of the atoms found in q (already lower-cased, ASCII)."""
+    return frozenset(_scanned(q, _SCAN) | {i for i, sub, _ in _SUBSTRINGS if sub in q})
+
+
+def classify(q: str) -> Intents:
+    """All intents whose pattern matches q, from one scan of the text."""
+    q = q or ""
+    low = q.lower()
+    if q.isascii():
+        hit = gate_hit = matched_atoms(low)
+    else:
+        # str.lower() and re.IGNORECASE disagree outside ASCII ("İ" lowers to
+        # two code points; "ı", "ſ" and the Kelvin sign match i, s and k under
+        # IGNORECASE). Scanned atoms follow the patterns (IGNORECASE on the
+        # original text), plain substrings their lower() check; as gates,
+        # which only need to be implied, substrings also count under IGNORECASE.
+        hit = frozenset(_scanned(q, _SCAN_I) | {i for i, sub, _ in _SUBSTRINGS if sub in low})
+        gate_hit = hit | {i for i, _, pat in _SUBSTRINGS if pat.search(q)}
+    found = set()
+    candidates = set()
+    for i in hit:
+        found.update(_EXACT[i])
+    for i in gate_hit:
+        candidates.update(_GATED[i])
+    for name in candidates - found:
+        if all(gate_hit & g for g in _GATES[name]) and INTENTS[name].verify.search(q):
+            found.add(name)
+    return frozenset(found)
@@ -48,11 +48,6 @@ OFFER_OUTCOME_PATTERN = re.compile(
 
 # Logistics
 ARRIVAL_PATTERN = re.compile(r"\b(arrive|arrival|reach|come to nus|on campus|move to singapore)\b", re.IGNORECASE)
-VISA_PATTERN    = re.compile(r"\b(visa|student pass|student visa|immigration|ipa|entry permit)\b", re.IGNORECASE)
-VISA_PROCESS_PATTERN = re.compile(
-    r"\b(how do i apply|how to apply|application process|apply for a visa|visa application)\b",
-    re.IGNORECASE,
-)
 
 LOGISTICS_PATTERN = re.compile(
     r"\b(visa|student pass|immigration|ipa|entry permit|arrive|arrival|on campus|move to singapore)\b",
@@ -73,4 +68,17 @@ VISA_PROCESS_PATTERN = re.compile(
     re.I
 )
 
-
+# Suitability questions the LLM must always answer (plain substrings, case-insensitive)
+SUITABILITY_QUESTION_PHRASES = [
+    "am i suitable",
+    "will i be suitable",
+    "would i be suitable",
+    "is edi suitable",
+    "suitable for me",
+    "fit for edi",
+    "good fit",
+    "good candidate",
+    "do i stand a chance",
+    "chance of admission",
+    "should i apply",
+]
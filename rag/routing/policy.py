@@ -1,9 +1,9 @@
 # rag/routing/policy.py
 # keep this ordering
 
-from typing import Any, Optional, Tuple
-from . import patterns as P
+from typing import Any, Collection, Optional, Tuple
 from . import fallbacks as F
+from .intents import Intents, classify
 from .helpers import (
     chunks_to_text,
     has_any_signal,
@@ -28,35 +28,41 @@ def answer_requirement(q: str, context_chunks: Any) -> str:
     return F.REQUIREMENT_FALLBACK_GENERIC
 
 
-def route_early(q: str) -> Optional[str]:
-    if P.GREETING_PATTERN.match(q):
+# Every router takes the intents from classify(q); pass them in when calling
+# several routers for one question so the text is only scanned once.
+
+def _intents(q: str, intents: Optional[Intents]) -> Intents:
+    return classify(q) if intents is None else intents
+
+
+def route_early(q: str, intents: Optional[Intents] = None, programmes: Collection[str] = ()) -> Optional[str]:
+    # programmes = index shards served here (rag/shards.py); those are answered, not redirected
+    i = _intents(q, intents)
+    if "greeting" in i:
         return "Hello! I can help with MSc EDI admissions questions."
-    if P.THANKS_PATTERN.match(q):
+    if "thanks" in i:
         return "You’re welcome!"
-    if P.PRAISE_PATTERN.match(q):
+    if "praise" in i:
         return "Glad it helped!"
-    if P.MDES_PATTERN.search(q):
+    if "mdes" in i and "mdes" not in programmes:
         return F.MDES_REDIRECT_MSG
     return None
 
 
-def route_intake(q: str) -> Optional[str]:
+def route_intake(q: str, intents: Optional[Intents] = None) -> Optional[str]:
+    i = _intents(q, intents)
     # Suitability must always win
-    if P.SUITABILITY_PATTERN.search(q):
+    if "suitability" in i:
         return None
 
     # Not an intake-related question
-    if not (
-        P.INTAKE_PATTERN.search(q)
-        or P.PROGRAMME_START_PATTERN.search(q)
-        or P.APPLICATION_PERIOD_PATTERN.search(q)
-    ):
+    if not ("intake" in i or "programme_start" in i or "application_period" in i):
         return None
 
-    if P.PROGRAMME_START_PATTERN.search(q):
+    if "programme_start" in i:
         return F.PROGRAMME_START_FALLBACK
 
-    if P.APPLICATION_PERIOD_PATTERN.search(q):
+    if "application_period" in i:
         return None  # let RAG handle exact dates
 
     return (
@@ -68,52 +74,90 @@ def route_intake(q: str) -> Optional[str]:
 
 
 
-def route_policy_logistics(q: str, context_chunks: Any) -> Optional[str]:
-    if P.OFFER_OUTCOME_PATTERN.search(q):
+def route_policy_logistics(q: str, context_chunks: Any, intents: Optional[Intents] = None) -> Optional[str]:
+    i = _intents(q, intents)
+    if "offer_outcome" in i:
         return F.OFFER_OUTCOME_FALLBACK
 
-    if P.REAPPLICATION_PATTERN.search(q):
+    if "reapplication" in i:
         return F.REAPPLICATION_FALLBACK
 
-    if P.VISA_PROCESS_PATTERN.search(q):
+    if "visa_process" in i:
         return F.VISA_PROCESS_FALLBACK
 
-    if P.VISA_PATTERN.search(q):
+    if "visa" in i:
         return F.VISA_FALLBACK
 
-    if P.ARRIVAL_PATTERN.search(q):
+    if "arrival" in i:
         return None if context_chunks else F.NOT_FOUND_FALLBACK
 
     return None
 
 
+def _is_requirement(i: Intents) -> bool:
+    return "requirement" in i and "wh_prefix" not in i and "logistics" not in i
+
+
+def _is_suitability(i: Intents) -> bool:
+    return "suitability" in i or "suitability_profile" in i
+
+
 def route_requirement_or_suitability(
-    q: str, context_chunks: Any
+    q: str, context_chunks: Any, intents: Optional[Intents] = None
 ) -> Optional[Tuple[str, str]]:
+    i = _intents(q, intents)
     # Requirements: can be answered directly
-    if (
-        P.REQUIREMENT_PATTERN.search(q)
-        and not P.WH_PREFIX_PATTERN.search(q)
-        and not P.LOGISTICS_PATTERN.search(q)
-    ):
+    if _is_requirement(i):
         return ("direct", answer_requirement(q, context_chunks))
 
     # Suitability: DETECT ONLY — never answer here
-    if P.SUITABILITY_PATTERN.search(q) or P.SUITABILITY_PROFILE_PATTERN.search(q):
+    if _is_suitability(i):
         return ("suitability", "")
 
     return None
 
 
-def pick_rag_fallback(q: str) -> str:
-    if (
-        P.REQUIREMENT_PATTERN.search(q)
-        and not P.WH_PREFIX_PATTERN.search(q)
-        and not P.LOGISTICS_PATTERN.search(q)
-    ):
+def is_suitability_question(q: str, intents: Optional[Intents] = None) -> bool:
+    # Questions about the user's own fit: always answered by the LLM
+    return "suitability_question" in _intents(q, intents)
+
+
+# -----------------------------
+# Context requirements
+# -----------------------------
+# route_early / route_intake never see context_chunks. The two routers below
+# only read them on specific branches; /ask checks these before retrieving so
+# fixed-fallback answers never pay for an embedding call.
+
+def policy_logistics_needs_context(q: str, intents: Optional[Intents] = None) -> bool:
+    # Only the arrival branch inspects context_chunks
+    return "arrival" in _intents(q, intents)
+
+
+def requirement_needs_context(q: str, intents: Optional[Intents] = None) -> bool:
+    # Only the "direct" requirement answer inspects context_chunks
+    return _is_requirement(_intents(q, intents))
+
+
+def query_intent(q: str, intents: Optional[Intents] = None) -> str:
+    """
+    Coarse routing intent, in the same precedence as pick_rag_fallback.
+    Used to keep cached answers from crossing intents.
+    """
+    i = _intents(q, intents)
+    if _is_requirement(i):
+        return "requirement"
+    if _is_suitability(i):
+        return "suitability"
+    return "general"
+
+
+def pick_rag_fallback(q: str, intents: Optional[Intents] = None) -> str:
+    i = _intents(q, intents)
+    if _is_requirement(i):
         return F.REQUIREMENT_FALLBACK_GENERIC
 
-    if P.SUITABILITY_PATTERN.search(q) or P.SUITABILITY_PROFILE_PATTERN.search(q):
+    if _is_suitability(i):
         return F.SUITABILITY_FALLBACK
 
     return F.NOT_FOUND_FALLBACK
@@ -0,0 +1,102 @@
+# rag/shards.py
+"""
+Per-programme index shards.
+
+SHARDS splits the sources in data/ into named shards by file name:
+
+    SHARDS="msc:cde.nus.edu.sg_edic_msc*,EDI-*;mdes:cde.nus.edu.sg_did_mdes*"
+
+(fnmatch patterns, first shard whose pattern matches wins; files that match
+no pattern go to DEFAULT_SHARD). rag/build_index_openai.py builds one
+faiss.index + chunks.bin + bm25.npz per shard under INDEX_DIR/<name>/, and
+the retriever loads them side by side.
+
+At query time pick_shards() decides which shards to search:
+  1. an explicit `programme` in the /ask payload ("all" = every shard),
+  2. else every shard named after a routing intent the question matched
+     (a shard called "mdes" takes MDES_PATTERN questions),
+  3. else DEFAULT_SHARD.
+A query therefore only scans the index of its own programme.
+
+With SHARDS unset there is a single unnamed shard "" stored at the usual
+paths in the repo root (FAISS_PATH, CHUNKS_PATH, BM25_PATH), as before.
+"""
+from __future__ import annotations
+
+import os
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Dict, Iterable, NamedTuple, Tuple
+
+from rag.routing.intents import Intents, classify
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _parse(spec: str) -> Dict[str, Tuple[str, ...]]:
+    shards: Dict[str, Tuple[str, ...]] = {}
+    for part in spec.split(";"):
+        if not part.strip():
+            continue
+        name, _, patterns = part.partition(":")
+        name = name.strip().lower()
+        if not name or name == "all" or "/" in name:
+            raise ValueError(f"bad shard name in SHARDS: {part!r}")
+        shards[name] = tuple(p.strip() for p in patterns.split(",") if p.strip())
+    return shards
+
+
+# ---- Config (override via env vars) ----
+SHARDS: Dict[str, Tuple[str, ...]] = _parse(os.getenv("SHARDS", ""))  # name -> source file patterns
+INDEX_DIR = Path(os.getenv("INDEX_DIR", str(ROOT / "indexes")))
+DEFAULT_SHARD = os.getenv("DEFAULT_SHARD", "").strip().lower() or next(iter(SHARDS), "")
+
+if SHARDS and DEFAULT_SHARD not in SHARDS:
+    raise ValueError(f"DEFAULT_SHARD={DEFAULT_SHARD!r} is not one of SHARDS ({', '.join(SHARDS)})")
+
+
+class ShardFiles(NamedTuple):
+    faiss: Path
+    chunks: Path
+    bm25: Path
+
+
+def shard_names() -> Tuple[str, ...]:
+    """Configured shards, or ("",) for the single unsharded index."""
+    return tuple(SHARDS) or ("",)
+
+
+def shard_files(name: str, unsharded: ShardFiles) -> ShardFiles:
+    """Where shard `name` lives; the unnamed shard uses the caller's root paths."""
+    if not name:
+        return unsharded
+    d = INDEX_DIR / name
+    return ShardFiles(d / "faiss.index", d / "chunks.bin", d / "bm25.npz")
+
+
+def shard_of(filename: str) -> str:
+    """Shard a source file (data/*.txt name) is indexed in."""
+    for name, patterns in SHARDS.items():
+        if any(fnmatch(filename, p) for p in patterns):
+            return name
+    return DEFAULT_SHARD
+
+
+def pick_shards(intents: Iterable[str], programme: str = "") -> Tuple[str, ...]:
+    """Shards to search for one question (see the module docstring for the order)."""
+    if not SHARDS:
+        return ("",)
+    programme = (programme or "").strip().lower()
+    if programme == "all":
+        return tuple(SHARDS)
+    if programme in SHARDS:
+        return (programme,)
+    intents = set(intents)
+    return tuple(name for name in SHARDS if name in intents) or (DEFAULT_SHARD,)
+
+
+def route_query(q: str, programme: str = "", intents: Intents | None = None) -> Tuple[str, ...]:
+    """pick_shards() for a raw question (classifies it unless intents are given)."""
+    if not SHARDS:
+        return ("",)
+    return pick_shards(classify(q) if intents is None else intents, programme)
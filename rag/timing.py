@@ -0,0 +1,70 @@
+# rag/timing.py
+from __future__ import annotations
+
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore[assignment]
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process, in MB."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return peak_rss_mb() or 0.0
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far, in MB (None if unavailable)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KB on Linux, bytes on macOS
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+class StageTimer:
+    """
+    Per-request wall-clock timings (milliseconds) for the /ask pipeline.
+    Stages that run more than once accumulate. note() records a non-timing
+    value (e.g. prompt tokens) that is reported alongside the stages.
+    """
+
+    def __init__(self) -> None:
+        self._t0 = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.notes: Dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - t0) * 1000.0)
+
+    def add(self, name: str, ms: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + ms
+
+    def note(self, name: str, value: int) -> None:
+        self.notes[name] = value
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._t0) * 1000.0
+
+    def server_timing(self) -> str:
+        """Render as a Server-Timing header value (visible in browser devtools)."""
+        parts = [f"{name};dur={ms:.2f}" for name, ms in self.stages.items()]
+        parts.extend(f'{name};desc="{value}"' for name, value in self.notes.items())
+        parts.append(f"total;dur={self.total_ms():.2f}")
+        return ", ".join(parts)
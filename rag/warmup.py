@@ -0,0 +1,153 @@
+# rag/warmup.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import List, Optional
+
+from rag.clients import get_async_client
+from rag.context import tokenizer_name
+from rag.faq import disk_version as faq_disk_version, faq_version, load_faq, reload_faq
+from rag.retriever import (
+    INDEX_WATCH_INTERVAL,
+    RETRIEVE_TOP_K,
+    aretrieve_context,
+    close_embedding_cache,
+    disk_version,
+    index_version,
+    load_resources,
+    reload_resources,
+)
+from rag.timing import rss_mb
+
+# uvicorn only configures its own loggers; log through it so lines show up
+logger = logging.getLogger("uvicorn.error")
+
+# ---- Config (override via env vars) ----
+# Load index + chunk store at import time, i.e. before a pre-forking server
+# (gunicorn --preload) forks its workers, so pages are shared copy-on-write.
+PRELOAD_RESOURCES = os.getenv("PRELOAD_RESOURCES", "0") == "1"
+# Open the OpenAI connection pool and fill the embedding cache at startup.
+WARMUP = os.getenv("WARMUP", "1") == "1"
+# "|"-separated; defaults to the widget's suggestion chips (docs/edi-chat.js)
+WARMUP_QUERIES: List[str] = [
+    q.strip()
+    for q in os.getenv(
+        "WARMUP_QUERIES",
+        "What are the admission requirements?"
+        "|What courses are taught in the MSc EDI programme?"
+        "|Do I need a visa to study at NUS?"
+        "|What is the GPA requirement to graduate?"
+        "|I am an engineer. Am I suitable for EDI?",
+    ).split("|")
+    if q.strip()
+]
+
+_ready = False
+_watcher: Optional[asyncio.Task] = None
+
+
+def is_ready() -> bool:
+    return _ready
+
+
+def preload() -> None:
+    t0 = time.perf_counter()
+    load_resources()
+    load_faq()
+    logger.info(
+        "Preloaded index + chunk store in %.0f ms (pid=%d, rss=%.1f MB)",
+        (time.perf_counter() - t0) * 1000.0, os.getpid(), rss_mb(),
+    )
+
+
+async def startup() -> None:
+    """Lifespan hook: load resources, optionally warm connections and caches, then mark ready."""
+    global _ready, _watcher
+    t0 = time.perf_counter()
+    load_resources()
+    load_faq()
+    # first use may load (or download) the tokenizer's encoding file
+    logger.info("Context packing: tokenizer %s", tokenizer_name())
+    t_load = time.perf_counter()
+
+    if WARMUP:
+        try:
+            # Opens a pooled keep-alive connection without spending tokens
+            await get_async_client().models.list()
+        except Exception as e:  # warm-up must never block startup
+            logger.warning("Warm-up: OpenAI connection check failed: %s", e)
+        results = await asyncio.gather(
+            *(aretrieve_context(q, top_k=RETRIEVE_TOP_K) for q in WARMUP_QUERIES),
+            return_exceptions=True,
+        )
+        failed = [r for r in results if isinstance(r, Exception)]
+        if failed:
+            logger.warning("Warm-up: %d/%d retrievals failed: %s", len(failed), len(results), failed[0])
+
+    if INDEX_WATCH_INTERVAL > 0:
+        _watcher = asyncio.create_task(_watch_index(INDEX_WATCH_INTERVAL))
+
+    _ready = True
+    t_end = time.perf_counter()
+    logger.info(
+        "Startup ready in %.0f ms (load %.0f ms, warm-up %.0f ms; pid=%d, rss=%.1f MB)",
+        (t_end - t0) * 1000.0, (t_load - t0) * 1000.0, (t_end - t_load) * 1000.0,
+        os.getpid(), rss_mb(),
+    )
+
+
+async def _watch_index(interval: float) -> None:
+    """
+    Reload the index when a rebuild lands. A new fingerprint must stay the
+    same for one more poll first (the builder replaces several files one
+    after another), and a version that failed its checks is not retried
+    until the files change again. faq.index is checked on the same polls.
+    """
+    seen = index_version()
+    rejected = faq_rejected = ""
+    while True:
+        await asyncio.sleep(interval)
+        faq_rejected = await _check_faq(faq_rejected)
+        try:
+            current = disk_version()
+        except OSError:  # a file is being replaced right now
+            continue
+        if current in (index_version(), rejected):
+            seen = current
+            continue
+        if current != seen:
+            seen = current  # changed since the last poll; wait until it settles
+            continue
+        try:
+            await asyncio.to_thread(reload_resources)
+        except Exception as e:
+            rejected = current
+            logger.error("Index reload failed, still serving %s: %s", index_version(), e)
+
+
+async def _check_faq(rejected: str) -> str:
+    """Reload faq.index when a rebuild rewrote it; returns the version that last failed its checks."""
+    try:
+        current = faq_disk_version()
+    except OSError:
+        return rejected
+    if current in (faq_version(), rejected):
+        return rejected
+    try:
+        await asyncio.to_thread(reload_faq)
+    except Exception as e:
+        logger.error("FAQ index reload failed, still serving %s: %s", faq_version() or "none", e)
+        return current
+    return ""
+
+
+def shutdown() -> None:
+    global _ready, _watcher
+    _ready = False
+    if _watcher is not None:
+        _watcher.cancel()
+        _watcher = None
+    close_embedding_cache()
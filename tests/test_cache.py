@@ -0,0 +1,79 @@
+# tests/test_cache.py
+import asyncio
+
+import numpy as np
+
+from rag.cache import EmbeddingCache, SemanticAnswerCache
+
+
+def test_aget_reads_the_disk_tier_off_the_event_loop(tmp_path):
+    path = tmp_path / "emb.sqlite"
+    writer = EmbeddingCache(8, path)
+    writer.put("m", "What are the fees?", np.arange(4, dtype="float32"))
+    writer.close()
+
+    cache = EmbeddingCache(8, path)
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(1)
+            await asyncio.sleep(0)
+
+    async def main():
+        task = asyncio.create_task(ticker())
+        with cache._db_lock:  # a slow disk: the lookup has to wait for the lock
+            pending = asyncio.create_task(cache.aget("m", "  what are the FEES?"))
+            await asyncio.sleep(0.05)
+            assert not pending.done()
+            assert ticks  # the loop kept running meanwhile
+        vec = await pending
+        task.cancel()
+        return vec
+
+    vec = asyncio.run(main())
+    assert np.array_equal(vec, np.arange(4, dtype="float32"))
+    assert cache.disk_hits == 1
+    assert asyncio.run(cache.aget("m", "What are the fees?")) is vec  # now in the LRU
+    assert asyncio.run(cache.aget("m", "unknown")) is None
+    cache.close()
+
+
+def _unit(*xs):
+    v = np.asarray(xs, dtype="float32")
+    return v / np.linalg.norm(v)
+
+
+def test_semantic_match_behind_closer_ineligible_entries():
+    cache = SemanticAnswerCache(64, threshold=0.9)
+    query = _unit(1, 0, 0)
+    for n in range(6):  # closer neighbours, but another programme's intent
+        cache.put(_unit(1, 0.001 * n, 0), "requirement@mdes", f"mdes {n}", "v1")
+    cache.put(_unit(1, 0.3, 0), "requirement@msc", "msc answer", "v1")  # cos ~0.96
+    assert cache.get(query, "requirement@msc", "v1") == "msc answer"
+    assert cache.get(query, "fees@msc", "v1") is None
+    assert cache.intent_rejects == 1
+
+
+def test_semantic_entries_of_other_versions_are_never_served():
+    cache = SemanticAnswerCache(64, threshold=0.9)
+    cache.put(_unit(1, 0, 0), "requirement", "old answer", "v1")
+    assert cache.get(_unit(1, 0, 0), "requirement", "v2") is None
+    cache.put(_unit(1, 0.2, 0), "requirement", "new answer", "v2")  # drops the v1 entries
+    assert cache.stats()["size"] == 1
+    # a request still holding the old version does not evict the new entries
+    assert cache.get(_unit(1, 0, 0), "requirement", "v1") is None
+    assert cache.get(_unit(1, 0, 0), "requirement", "v2") == "new answer"
+
+
+def test_semantic_expired_neighbours_do_not_hide_a_fresh_entry(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("rag.cache.time.monotonic", lambda: clock[0])
+    cache = SemanticAnswerCache(64, threshold=0.9, ttl=10)
+    for n in range(6):
+        cache.put(_unit(1, 0.001 * n, 0), "requirement", f"stale {n}", "v1")
+    clock[0] = 105.0
+    cache.put(_unit(1, 0.3, 0), "requirement", "fresh", "v1")
+    clock[0] = 112.0  # the first six have expired
+    assert cache.get(_unit(1, 0, 0), "requirement", "v1") == "fresh"
+    assert cache.stats()["size"] == 1
@@ -0,0 +1,59 @@
+# tests/test_chunking.py
+from pathlib import Path
+
+import pytest
+
+from rag.chunking import fixed_spans, normalize_source, structure_spans, units
+
+DATA = sorted((Path(__file__).resolve().parent.parent / "data").glob("*.txt"))
+SAMPLE = """Admissions
+
+Overview
+The programme admits students once a year. Classes are held in the evening.
+
+When are classes held?
+Classes are held on weekday evenings and some Saturdays.
+Attendance is compulsory.
+
+Is the application fee refundable?
+No. The fee is not refundable.
+
+- a list item
+- another list item
+"""
+
+
+def _sources():
+    return [SAMPLE] + [fp.read_text(encoding="utf-8", errors="ignore") for fp in DATA]
+
+
+@pytest.mark.parametrize("spans", [structure_spans, fixed_spans])
+@pytest.mark.parametrize("size, overlap", [(900, 150), (200, 30)])
+def test_spans_are_exact_slices(spans, size, overlap):
+    for raw in _sources():
+        text = normalize_source(raw)
+        for a, b, chunk in spans(raw, size, overlap):
+            assert chunk == text[a:b]
+            assert chunk and chunk == chunk.strip()
+
+
+@pytest.mark.parametrize("size", [900, 300])
+def test_qa_pairs_stay_whole(size):
+    for raw in _sources():
+        text = normalize_source(raw)
+        spans = [(a, b) for a, b, _ in structure_spans(raw, size, 50)]
+        for u in units(text):
+            if u.kind == "qa" and u.end - u.start <= size:
+                assert any(a <= u.start and u.end <= b for a, b in spans), text[u.start:u.end][:80]
+
+
+def test_sample_question_and_answer_share_a_chunk():
+    chunks = [c for _, _, c in structure_spans(SAMPLE, 120, 20)]
+    pair = next(c for c in chunks if "When are classes held?" in c)
+    assert "Attendance is compulsory." in pair
+
+
+def test_overlap_must_be_smaller_than_size():
+    for spans in (structure_spans, fixed_spans):
+        with pytest.raises(ValueError):
+            list(spans(SAMPLE, 100, 100))
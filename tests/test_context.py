@@ -0,0 +1,46 @@
+# tests/test_context.py
+from rag.context import count_tokens, pack_context
+
+TEXT = "".join(f"This is sentence {i} about the programme. " for i in range(60)).strip()
+
+
+def _chunks(n=5):
+    return [{"id": i, "text": f"Chunk {i}. {TEXT}"} for i in range(n)]
+
+
+def _text(c):
+    return c["text"]
+
+
+def test_everything_fits_without_a_budget():
+    packed = pack_context(_chunks(), _text, budget=0)
+    assert len(packed.chunks) == 5 and not packed.truncated and not packed.dropped
+
+
+def test_cut_at_a_sentence_boundary():
+    chunks = _chunks()
+    budget = count_tokens(chunks[0]["text"]) + 200
+    packed = pack_context(chunks, _text, budget)
+    assert packed.tokens <= budget
+    assert [c["id"] for c in packed.chunks] == [0, 1]
+    cut = packed.chunks[1]
+    assert cut["truncated"] and cut["text"].endswith(".")
+    assert chunks[1]["text"].startswith(cut["text"])
+    assert chunks[1]["text"][len(cut["text"])] == " "
+    assert (packed.truncated, packed.dropped) == (1, 3)
+
+
+def test_packing_is_idempotent():
+    chunks = _chunks()
+    budget = count_tokens(chunks[0]["text"]) + 200
+    once = pack_context(chunks, _text, budget)
+    twice = pack_context(once.chunks, _text, budget)
+    assert twice.chunks == once.chunks
+    assert (twice.tokens, twice.truncated, twice.dropped) == (once.tokens, once.truncated, 0)
+
+
+def test_small_remainder_is_dropped_not_cut():
+    chunks = _chunks(2)
+    budget = count_tokens(chunks[0]["text"]) + 10
+    packed = pack_context(chunks, _text, budget)
+    assert [c["id"] for c in packed.chunks] == [0] and packed.dropped == 1
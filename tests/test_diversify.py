@@ -0,0 +1,23 @@
+# tests/test_diversify.py
+from types import SimpleNamespace
+
+import rag.retriever as retriever
+
+
+class _NoReconstruct:
+    def reconstruct_batch(self, ids):
+        raise RuntimeError("reconstruct not implemented for this type of index")
+
+
+def test_fallback_without_reconstruct_keeps_the_chunk_budget(monkeypatch):
+    monkeypatch.setattr(retriever, "MERGE_CHUNKS", False)
+    monkeypatch.setattr(retriever, "MMR_LAMBDA", 0.7)
+    res = SimpleNamespace(index=_NoReconstruct())
+    results = [
+        {"id": 0, "ids": [0, 1, 2], "score": 0.9},  # a merged run of three chunks
+        {"id": 3, "ids": [3, 4], "score": 0.8},
+        {"id": 5, "score": 0.7},
+        {"id": 6, "score": 0.6},
+    ]
+    out = retriever._diversify(res, results, 4)
+    assert [r["id"] for r in out] == [0, 5]  # 3 + 1 chunks; the 2-chunk hit does not fit
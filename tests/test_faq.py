@@ -0,0 +1,67 @@
+# tests/test_faq.py
+from pathlib import Path
+
+import faiss
+import numpy as np
+import pytest
+
+from rag import faq
+from rag.chunking import normalize_source
+from rag.faq import FaqEntry, FaqIndex, extract_faq, match_faq
+
+FAQ_SOURCE = Path(__file__).resolve().parent.parent / "data" / "cde.nus.edu.sg_edic_msc_msc-faq_.txt"
+
+
+def _unit(v):
+    v = np.asarray(v, dtype="float32")
+    return v / np.linalg.norm(v)
+
+
+@pytest.fixture
+def loaded(monkeypatch):
+    """Ten near-identical mdes questions ranked above the one msc entry."""
+    dim = 16
+    rng = np.random.default_rng(0)
+    query = _unit(rng.standard_normal(dim))
+    vecs, entries = [], []
+    for i in range(10):
+        vecs.append(_unit(query + 0.01 * rng.standard_normal(dim)))
+        entries.append(FaqEntry(f"mdes question {i}?", "mdes answer", "EDI-x.txt", "mdes", (0, 1)))
+    vecs.append(_unit(query + 0.2 * rng.standard_normal(dim)))
+    entries.append(FaqEntry("msc question?", "msc answer", "msc-faq.txt", "msc", (0, 1)))
+    index = faiss.IndexFlatIP(dim)
+    index.add(np.vstack(vecs))
+    monkeypatch.setattr(faq, "_faq", FaqIndex(index, entries, "v"))
+    monkeypatch.setattr(faq, "_loaded", True)
+    monkeypatch.setattr(faq, "FAQ_THRESHOLD", 0.5)
+    return query
+
+
+def test_shard_entry_found_behind_other_shards(loaded):
+    hit = match_faq(loaded, ("msc",))
+    assert hit is not None and hit[0].answer == "msc answer"
+
+
+def test_unfiltered_match_prefers_the_closest(loaded):
+    hit = match_faq(loaded)
+    assert hit is not None and hit[0].shard == "mdes"
+
+
+def test_link_pointer_answers_are_not_extracted():
+    text = normalize_source(FAQ_SOURCE.read_text(encoding="utf-8"))
+    entries = extract_faq(text, FAQ_SOURCE.name)
+    assert entries
+    questions = [e.question for e in entries]
+    assert not any("requirements for admission" in q for q in questions)
+    assert not any(q.startswith("What are the fees") for q in questions)
+    assert all("this page" not in e.answer and "this webpage" not in e.answer for e in entries)
+    # real answers stay
+    assert any("refundable" in q for q in questions)
+
+
+def test_pointer_answer_in_a_sample():
+    text = normalize_source(
+        "What are the fees?\nThe fees for this programme are listed on this page.\n\n"
+        "When are classes held?\nClasses are held on weekday evenings.\n"
+    )
+    assert [e.question for e in extract_faq(text, "sample.txt")] == ["When are classes held?"]
@@ -0,0 +1,57 @@
+# tests/test_intents.py
+import random
+
+import pytest
+
+from bench.bench_routing import LEGACY_CHECKS, ROOT, engine_decision, legacy_decision, load_corpus
+from rag.routing.intents import INTENTS, classify
+
+CORPUS = load_corpus(ROOT / "bench" / "questions.txt")
+
+
+def test_every_pattern_has_an_intent():
+    assert set(INTENTS) == set(LEGACY_CHECKS)
+
+
+@pytest.mark.parametrize("q", CORPUS)
+def test_classifier_matches_patterns(q):
+    assert classify(q) == frozenset(k for k, check in LEGACY_CHECKS.items() if check(q))
+    assert engine_decision(q) == legacy_decision(q)
+
+
+@pytest.mark.parametrize("q, intent", [
+    ("Is the portfolio mandatory?", "requirement"),
+    ("What happens if I don't accept the offer?", "offer_outcome"),
+    ("how do I get my student pass", "visa_process"),
+    ("Hello!", "greeting"),
+])
+def test_gated_intents(q, intent):
+    assert intent in classify(q)
+
+
+def _legacy(q):
+    return frozenset(k for k, check in LEGACY_CHECKS.items() if check(q))
+
+
+@pytest.mark.parametrize("q", [
+    "VİSA application?",  # "İ".lower() is two code points
+    "İntake dates?",
+    "what is the ıntake",  # dotless i matches i under IGNORECASE
+    "I need a viſa, how?",  # long s
+    "Is the portfolıo mandatory?",
+    "Wİll I be suitable?",
+    "Straße to campus: when do I arrive?",
+])
+def test_non_ascii_matches_patterns(q):
+    assert classify(q) == _legacy(q)
+
+
+def test_random_non_ascii_matches_patterns():
+    rng = random.Random(0)
+    for _ in range(3000):
+        q = list(rng.choice(CORPUS))
+        for _ in range(rng.randint(1, 3)):
+            j = rng.randrange(len(q))
+            q[j] = rng.choice("İıſKÅßﬁΣς" + q[j].upper())
+        q = "".join(q)
+        assert classify(q) == _legacy(q), q
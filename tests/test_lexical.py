@@ -0,0 +1,65 @@
+# tests/test_lexical.py
+import math
+from pathlib import Path
+
+import pytest
+
+from rag.chunkstore import ChunkStore, strip_prefix
+from rag.lexical import _SPLIT_CODE_RE, BM25Index, BM25Writer
+
+DOCS = [
+    "CDE 5301 is the core design module of the programme.",
+    "Applications open in October and close in January.",
+    "The programme is taught in the evening; the EDI office answers questions.",
+    "Tuition fees are payable each semester.",
+]
+
+
+@pytest.fixture
+def bm25(tmp_path):
+    w = BM25Writer()
+    for d in DOCS:
+        w.add(d)
+    return BM25Index(w.save(tmp_path / "bm25.npz"))
+
+
+def test_scores_follow_bm25(bm25):
+    hits = bm25.search("tuition", 10)
+    assert [row for row, _ in hits] == [3]
+    # one term, tf=1: idf * (k1 + 1) / (1 + k1 * (1 - b + b * dl / avgdl))
+    dl, avgdl = bm25._doc_len[3], bm25._doc_len.mean()
+    idf = math.log(1.0 + (len(DOCS) - 1 + 0.5) / (1 + 0.5))
+    want = idf * (bm25.k1 + 1.0) / (1.0 + bm25.k1 * (1.0 - bm25.b + bm25.b * dl / avgdl))
+    assert hits[0][1] == pytest.approx(want, rel=1e-5)
+
+
+def test_ranking_and_stopwords(bm25):
+    rows = [row for row, _ in bm25.search("when do applications open?", 10)]
+    assert rows[0] == 1
+    assert bm25.search("the and of", 10) == []
+    assert len(bm25.search("programme", 1)) == 1
+
+
+def test_split_course_code_matches(bm25):
+    assert bm25.search("CDE5301", 10)[0][0] == 0
+    assert bm25.search("cde 5301", 10)[0][0] == 0
+
+
+def test_is_exact_query(bm25):
+    assert bm25.is_exact_query("CDE 5301", 3)
+    assert bm25.is_exact_query("EDI office", 3)
+    assert not bm25.is_exact_query("tuition fees", 3)  # no digit or acronym
+    assert not bm25.is_exact_query("CDE 9999", 3)  # not indexed
+    assert not bm25.is_exact_query("CDE 5301 core design module", 3)  # too long
+    assert not bm25.is_exact_query("the", 3)
+
+
+def test_shipped_index_marks_split_course_codes_exact():
+    root = Path(__file__).resolve().parent.parent
+    shipped = BM25Index(root / "bm25.npz")
+    assert shipped.is_exact_query("CDE 5301", 3)
+    store = ChunkStore(root / "chunks.bin")
+    codes = {a + " " + b for i in range(len(store)) for a, b in _SPLIT_CODE_RE.findall(strip_prefix(store.text(i)))}
+    assert codes
+    for code in codes:
+        assert shipped.is_exact_query(code, 3), code
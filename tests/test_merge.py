@@ -0,0 +1,36 @@
+# tests/test_merge.py
+from rag.retriever import _merge
+
+
+def _hits(shard, scores, **extra):
+    return [dict({"id": i, "shard": shard, "score": s}, **extra) for i, s in enumerate(scores)]
+
+
+def test_shards_are_fused_by_rank_not_raw_score():
+    dense = _hits("msc", [0.82, 0.80, 0.78])  # dense-only shard: cosine
+    fused = _hits("mdes", [0.033, 0.032, 0.016], bm25=1.0)  # hybrid shard: RRF
+    out = _merge([dense, fused], 4)
+    # best of each shard first, whatever the scale of its scores
+    assert [(r["shard"], r["id"]) for r in out] == [("msc", 0), ("mdes", 0), ("msc", 1), ("mdes", 1)]
+    assert out[1]["shard_score"] == 0.033
+    assert out[0]["score"] >= out[1]["score"] >= out[2]["score"]
+
+
+def test_lexical_shard_with_large_scores_does_not_crowd_out_the_other():
+    lexical = _hits("msc", [12.5, 9.1, 7.7, 6.0])  # BM25
+    dense = _hits("mdes", [0.71])
+    out = _merge([lexical, dense], 3)
+    assert ("mdes", 0) in [(r["shard"], r["id"]) for r in out]
+
+
+def test_merged_spans_count_against_the_budget():
+    a = [{"id": 0, "ids": [0, 1, 2], "shard": "a", "score": 0.9}, {"id": 5, "shard": "a", "score": 0.8}]
+    b = _hits("b", [0.03, 0.02])
+    out = _merge([a, b], 4)
+    assert sum(len(r.get("ids") or (r["id"],)) for r in out) <= 4
+    assert [(r["shard"], r["id"]) for r in out] == [("a", 0), ("b", 0)]
+
+
+def test_single_shard_is_unchanged():
+    hits = _hits("", [0.9, 0.5])
+    assert _merge([hits], 5) is hits
@@ -0,0 +1,50 @@
+# tests/test_rerank.py
+import numpy as np
+
+from rag.rerank import merge_overlapping, mmr
+
+SOURCE = "".join(f"Sentence number {i} of the source. " for i in range(40))
+
+
+def _hit(i, a, b, score, source="a.txt"):
+    return {"id": i, "source": source, "chunk": i, "span": (a, b), "score": score,
+            "text": f"[{source} | chunk {i}]\n{SOURCE[a:b]}"}
+
+
+def test_overlapping_hits_are_stitched():
+    hits = [_hit(2, 80, 200, 0.9), _hit(1, 0, 100, 0.5), _hit(3, 200, 260, 0.4), _hit(9, 500, 600, 0.3)]
+    out = merge_overlapping(hits)
+    assert len(out) == 2
+    merged, far = out
+    assert merged["span"] == (0, 260)
+    assert merged["text"] == f"[a.txt | chunks 1-3]\n{SOURCE[0:260]}"
+    assert merged["score"] == 0.9 and sorted(merged["ids"]) == [1, 2, 3]
+    assert far is hits[3]
+
+
+def test_other_sources_and_unknown_spans_are_left_alone():
+    hits = [_hit(1, 0, 100, 0.9), _hit(2, 50, 150, 0.8, source="b.txt"), dict(_hit(3, 0, 0, 0.7), span=None)]
+    assert merge_overlapping(hits) == hits
+
+
+def _unit(rows):
+    v = np.asarray(rows, dtype="float32")
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def test_mmr_skips_near_duplicates():
+    vecs = _unit([[1, 0, 0], [1, 0.01, 0], [0, 1, 0], [0, 0, 1]])
+    rel = np.array([0.9, 0.89, 0.6, 0.5])
+    assert mmr(rel, vecs, 2, 0.5) == [0, 2]
+    assert mmr(rel, vecs, 2, 1.0) == [0, 1]  # relevance only
+
+
+def test_mmr_budget_counts_member_chunks():
+    vecs = _unit(np.eye(4))
+    rel = np.array([0.9, 0.8, 0.7, 0.6])
+    cost = np.array([3, 1, 2, 1])
+    chosen = mmr(rel, vecs, 4, 0.7, cost)
+    assert chosen == [0, 1]
+    assert cost[chosen].sum() <= 4
+    assert mmr(rel, vecs, 2, 0.7, cost) == [1, 3]  # the 3-chunk span never fits
+    assert mmr(rel[:0], vecs[:0], 3, 0.7) == []
@@ -1,13 +1,29 @@
 Write-Host "Rebuilding RAG index..."
-python build_index.py
+python -m rag.build_index_openai
 if ($LASTEXITCODE -ne 0) {
     Write-Error "Index build failed. Aborting."
     exit 1
 }
 
-if (!(Test-Path "faiss.index") -or !(Test-Path "docs.pkl")) {
-    Write-Error "faiss.index or docs.pkl not found. Aborting."
-    exit 1
+# SHARDS set: one faiss.index / chunks.bin / bm25.npz per shard under INDEX_DIR (rag/shards.py)
+$indexDir = if ($env:INDEX_DIR) { $env:INDEX_DIR } else { "indexes" }
+if ($env:SHARDS) {
+    $indexFiles = @($indexDir)
+    if (!(Test-Path $indexDir)) {
+        Write-Error "$indexDir not found. Aborting."
+        exit 1
+    }
+} else {
+    $indexFiles = @("faiss.index", "faiss.index.json", "chunks.bin", "bm25.npz")
+    if (!(Test-Path "faiss.index") -or !(Test-Path "chunks.bin")) {
+        Write-Error "faiss.index or chunks.bin not found. Aborting."
+        exit 1
+    }
+}
+# FAQ answer index (rag/faq.py); not written when FAQ_SOURCES is empty
+$faqPath = if ($env:FAQ_PATH) { $env:FAQ_PATH } else { "faq.index" }
+foreach ($f in @($faqPath, "$faqPath.json")) {
+    if (Test-Path $f) { $indexFiles += $f }
 }
 
 Write-Host ""
@@ -21,8 +37,8 @@ if ($confirm -ne "y") {
     exit 0
 }
 
-git add faiss.index docs.pkl
-git commit -m "Update RAG index (faiss.index, docs.pkl)"
+git add -- $indexFiles
+git commit -m "Update RAG index ($($indexFiles -join ', '))"
 
 Write-Host ""
 $pushConfirm = Read-Host "Push to remote (triggers Render deploy)? (y/n)"